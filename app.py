@@ -1,11 +1,44 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_migrate import Migrate
 from config import Config
+from utils.compression import Compress
+from utils.engagement import EngagementLog
+from utils.fragments import FragmentCache
+from utils.hashing import PasswordHasher
+from utils.jobs import JobQueue
+from utils.mail import Mailer
+from utils.metrics import Metrics
+from utils.near_duplicates import NearDuplicates
+from utils.query_budget import init_query_budgets
+from utils.rate_limit import RateLimiter
+from utils.sharding import Shards, ShardedSession
+from utils.single_flight import SingleFlight
+from utils.unique_views import UniqueViews
+import mimetypes
 import os
+import weakref
+
+# HLS playlists and segments served from static/uploads (utils.video)
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
 
 # Initialize extensions
-db = SQLAlchemy()
+shards = Shards()
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+migrate = Migrate(render_as_batch=True)
+metrics = Metrics()
+fragment_cache = FragmentCache()
+password_hasher = PasswordHasher()
+rate_limiter = RateLimiter()
+compress = Compress()
+flights = SingleFlight()
+unique_views = UniqueViews()
+engagement_log = EngagementLog()
+near_duplicates = NearDuplicates()
+jobs = JobQueue()
+mailer = Mailer()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
@@ -16,18 +49,21 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     
     # Initialize extensions with app
+    shards.init_app(app)  # adds the shard databases to SQLALCHEMY_BINDS
     db.init_app(app)
+    migrate.init_app(app, db)
     login_manager.init_app(app)
-    
-    # Create upload directories
-    upload_dirs = [
-        'static/uploads/profiles',
-        'static/uploads/posts',
-        'static/images'
-    ]
-    
-    for directory in upload_dirs:
-        os.makedirs(directory, exist_ok=True)
+    metrics.init_app(app)
+    init_query_budgets(app)
+    fragment_cache.init_app(app)
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    flights.init_app(app)
+    unique_views.init_app(app)
+    engagement_log.init_app(app)
+    near_duplicates.init_app(app)
+    jobs.init_app(app)
+    mailer.init_app(app)
     
     # Register blueprints
     from routes.auth import auth_bp
@@ -35,20 +71,54 @@ def create_app(config_class=Config):
     from routes.user import user_bp
     from routes.post import post_bp
     from routes.api import api_bp
+    from routes.api_v2 import api_v2_bp
     
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(main_bp)
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(post_bp, url_prefix='/post')
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(api_v2_bp, url_prefix='/api/v2')
+    
+    import tasks  # registers the background tasks with `jobs`
+    
+    from models.user import session_user_cache
+    session_user_cache.maxsize = app.config['SESSION_USER_CACHE_SIZE']
+    session_user_cache.ttl = app.config['SESSION_USER_CACHE_TTL']
+    from models.block import hidden_ids_cache
+    hidden_ids_cache.maxsize = app.config['HIDDEN_USERS_CACHE_SIZE']
+    hidden_ids_cache.ttl = app.config['HIDDEN_USERS_CACHE_TTL']
+    
+    # Wraps app.wsgi_app, so it sees the final response of every request
+    compress.init_app(app)
+    
+    # Upload directories and the schema are set up by `flask setup`, not on every boot
+    from commands import register_commands
+    register_commands(app)
     
-    # Create database tables
     with app.app_context():
-        db.create_all()
+        _fork_engines.update(db.engines.values())
     
     return app
 
+# Engines created before a fork (gunicorn --preload) must not share pooled
+# connections with the parent; children start with empty pools instead.
+_fork_engines = weakref.WeakSet()
+
+def _reset_after_fork():
+    for engine in list(_fork_engines):
+        engine.dispose(close=False)
+    password_hasher.reset_after_fork()
+    flights.reset_after_fork()
+    unique_views.reset_after_fork()
+    engagement_log.reset_after_fork()
+    near_duplicates.reset_after_fork()
+    mailer.reset_after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 @login_manager.user_loader
 def load_user(user_id):
-    from models.user import User
-    return User.query.get(int(user_id))
+    from models.user import load_session_user
+    return load_session_user(int(user_id))
@@ -0,0 +1,13 @@
+"""ASGI entry point for async serving:
+
+    pip install uvicorn aiosqlite greenlet   # asyncpg for PostgreSQL
+    uvicorn asgi:application --workers 4
+
+The polled /api endpoints (routes/api_async.py) run as coroutines; all other
+routes are served by the regular Flask app on a thread pool.
+"""
+from app import create_app
+from routes.api_async import ROUTES
+from utils.asgi import AsyncApp
+
+application = AsyncApp(create_app(), ROUTES)
@@ -0,0 +1,205 @@
+"""Benchmark the main routes and compare against a stored baseline.
+
+Drives the routes through the Flask test client (default) or a running
+server (``--url``), reporting p50/p99 latency, throughput and SQL statements
+per request. Seed the database first with ``python -m benchmarks.seed``.
+
+    python -m benchmarks.bench --database sqlite:////tmp/socialapp_bench.db
+    python -m benchmarks.bench --save-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BENCH_USER = 'user1'
+
+# (name, method, path, authenticated); {post_id} is filled from the seeded data
+SCENARIOS = [
+    ('index_anonymous', 'GET', '/', False),
+    ('index', 'GET', '/', True),
+    ('explore', 'GET', '/explore', True),
+    ('search', 'GET', '/search?q=coffee', True),
+    ('post_detail', 'GET', '/post/{post_id}', True),
+    ('post_like', 'POST', '/post/{post_id}/like', True),
+    ('api_unread_count', 'GET', '/api/notifications/unread-count', True),
+    ('api_users_search', 'GET', '/api/users/search?q=user1', True),
+    ('api_trending', 'GET', '/api/posts/trending', True),
+    ('api_stats', 'GET', '/api/stats', True),
+    ('api_v2_feed', 'GET', '/api/v2/feed', True),
+    ('api_v2_batch', 'GET', '/api/v2/batch?resources=unread_count,stats,trending_posts', True),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, queries, wall_time):
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'throughput_rps': round(len(latencies) / wall_time, 1) if wall_time else 0.0,
+        'queries_per_request': round(statistics.mean(queries), 1) if queries else None,
+    }
+
+
+def _busiest_post_id(app):
+    from models import Post
+    with app.app_context():
+        post = Post.query.order_by(Post.comments_count.desc()).first()
+        return post.id if post else 1
+
+
+def run_test_client(app, iterations, warmup):
+    """Run every scenario in-process, counting SQL with a QueryBudget"""
+    from utils.query_budget import QueryBudget
+
+    post_id = _busiest_post_id(app)
+    anonymous = app.test_client()
+    authenticated = app.test_client()
+    authenticated.post('/auth/login', data={'username_or_email': BENCH_USER, 'password': 'password'})
+
+    results = {}
+    for name, method, path, needs_auth in SCENARIOS:
+        client = authenticated if needs_auth else anonymous
+        url = path.format(post_id=post_id)
+        call = client.post if method == 'POST' else client.get
+        for _ in range(warmup):
+            call(url)
+        latencies, queries = [], []
+        wall_start = time.perf_counter()
+        for _ in range(iterations):
+            with QueryBudget(mode='log') as budget:
+                start = time.perf_counter()
+                response = call(url)
+                latencies.append(time.perf_counter() - start)
+            queries.append(budget.count)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: {method} {url} returned {response.status_code}')
+        results[name] = summarize(latencies, queries, time.perf_counter() - wall_start)
+    return results
+
+
+def _metrics_query_sum(opener, base_url):
+    """Total SQL statements recorded by the server's /metrics endpoint"""
+    request = Request(base_url + '/metrics')
+    if os.environ.get('METRICS_TOKEN'):  # needed unless the server allows this host's address
+        request.add_header('Authorization', f"Bearer {os.environ['METRICS_TOKEN']}")
+    body = opener.open(request).read().decode()
+    total = 0.0
+    for line in body.splitlines():
+        if line.startswith('db_queries_per_request_sum'):
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+
+def run_server(base_url, iterations, concurrency, post_id):
+    """Run every scenario against a live server with concurrent clients"""
+    base_url = base_url.rstrip('/')
+    anonymous = build_opener(HTTPCookieProcessor(CookieJar()))
+    authenticated = build_opener(HTTPCookieProcessor(CookieJar()))
+    authenticated.open(base_url + '/auth/login', urlencode(
+        {'username_or_email': BENCH_USER, 'password': 'password'}).encode())
+
+    results = {}
+    for name, method, path, needs_auth in SCENARIOS:
+        opener = authenticated if needs_auth else anonymous
+        url = base_url + path.format(post_id=post_id)
+
+        def one_request(_):
+            request = Request(url, data=b'' if method == 'POST' else None, method=method)
+            start = time.perf_counter()
+            opener.open(request).read()
+            return time.perf_counter() - start
+
+        queries_before = _metrics_query_sum(anonymous, base_url)
+        wall_start = time.perf_counter()
+        # One user toggling the same like concurrently only measures lock contention
+        workers = 1 if method == 'POST' else concurrency
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            latencies = list(pool.map(one_request, range(iterations)))
+        wall_time = time.perf_counter() - wall_start
+        queries_total = _metrics_query_sum(anonymous, base_url) - queries_before
+        results[name] = summarize(latencies, [queries_total / iterations], wall_time)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print results next to the baseline; returns the names of regressed scenarios"""
+    regressions = []
+    print(f"{'scenario':<20}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}   vs baseline")
+    for name, result in results.items():
+        line = (f"{name:<20}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['throughput_rps']:>10}{result['queries_per_request'] or '-':>9}")
+        base = baseline.get(name)
+        if base:
+            change = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] if base['p50_ms'] else 0.0
+            more_queries = (result['queries_per_request'] or 0) > (base['queries_per_request'] or 0)
+            line += f"   p50 {change:+.0%}, queries {base['queries_per_request']}"
+            if change > tolerance or more_queries:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--post-id', type=int, default=1, help='post used by --url runs')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown before a scenario counts as regressed')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        results = run_server(args.url, args.iterations, args.concurrency, args.post_id)
+    else:
+        from app import create_app
+        from config import Config
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = args.database
+            RATELIMIT_ENABLED = False
+
+        results = run_test_client(create_app(BenchConfig), args.iterations, args.warmup)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+    elif regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare bytes saved against CPU cost for each compression setting.
+
+Fetches uncompressed responses for typical pages through the test client,
+then compresses each body at several gzip (and, when installed, brotli)
+levels, reporting total size and CPU time per response. Seed the database
+first with ``python -m benchmarks.seed``.
+
+    python -m benchmarks.compression --repeat 50
+"""
+import argparse
+import time
+
+from benchmarks.bench import BENCH_USER, _busiest_post_id
+from benchmarks.seed import SEED_PASSWORD
+from utils.compression import CompressionMiddleware, brotli
+
+PAGES = ['/', '/explore', '/search?q=coffee', '/post/{post_id}', '/api/v2/feed',
+         '/api/posts/trending', '/static/css/style.css', '/static/js/main.js']
+SETTINGS = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('br', 1), ('br', 4), ('br', 11)]
+
+
+def fetch_bodies(app):
+    post_id = _busiest_post_id(app)
+    client = app.test_client()
+    client.post('/auth/login', data={'username_or_email': BENCH_USER, 'password': SEED_PASSWORD})
+    return [client.get(page.format(post_id=post_id)).data for page in PAGES]
+
+
+def measure(bodies, encoding, level, repeat):
+    middleware = CompressionMiddleware(None, gzip_level=level, br_level=level)
+    compressed = sum(len(middleware.compress(body, encoding)) for body in bodies)
+    start = time.process_time()
+    for _ in range(repeat):
+        for body in bodies:
+            middleware.compress(body, encoding)
+    cpu_us = (time.process_time() - start) / (repeat * len(bodies)) * 1e6
+    return compressed, cpu_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database
+        RATELIMIT_ENABLED = False
+        COMPRESS_ENABLED = False
+
+    bodies = fetch_bodies(create_app(BenchConfig))
+    original = sum(len(body) for body in bodies)
+    print(f'{len(bodies)} responses, {original} bytes uncompressed')
+    print(f"{'setting':<10}{'bytes':>10}{'saved':>8}{'CPU us/resp':>13}")
+    for encoding, level in SETTINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        compressed, cpu_us = measure(bodies, encoding, level, args.repeat)
+        print(f"{f'{encoding}-{level}':<10}{compressed:>10}{1 - compressed / original:>8.0%}{cpu_us:>13.0f}")
+    if brotli is None:
+        print('brotli is not installed; install it to compare br levels')
+
+
+if __name__ == '__main__':
+    main()
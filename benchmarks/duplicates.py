@@ -0,0 +1,64 @@
+"""Time near-duplicate lookups: the LSH-banded MinHash index vs a scan of recent posts.
+
+Fills a MinHashIndex with synthetic posts (random words from a small
+vocabulary, plus a spam wave of edited copies) and times a lookup of a new
+post against it, next to comparing the new post with every indexed
+signature.
+
+    python -m benchmarks.duplicates --posts 20000 --lookups 500
+"""
+import argparse
+import random
+import time
+
+from utils.near_duplicates import MinHashIndex, signature, similarity
+
+VOCABULARY = [f'word{i}' for i in range(5000)]
+
+
+def make_post(rng):
+    return ' '.join(rng.choices(VOCABULARY, k=rng.randint(10, 60)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=20_000)
+    parser.add_argument('--lookups', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    spam = make_post(rng)
+    index, signatures = MinHashIndex(maxsize=args.posts), {}
+    started = time.perf_counter()
+    for post_id in range(args.posts):
+        text = f'{spam} link{post_id}' if post_id % 100 == 0 else make_post(rng)
+        signatures[post_id] = signature(text)
+        index.add(post_id, signatures[post_id], 0)
+    build = time.perf_counter() - started
+
+    queries = [f'{spam} other{i}' if i % 2 else make_post(rng) for i in range(args.lookups)]
+    started = time.perf_counter()
+    query_signatures = [signature(text) for text in queries]
+    signing = (time.perf_counter() - started) / args.lookups
+
+    started = time.perf_counter()
+    found = [index.matches(value) for value in query_signatures]
+    lookup = (time.perf_counter() - started) / args.lookups
+
+    scanned = min(args.lookups, 20)
+    started = time.perf_counter()
+    expected = [sorted(post_id for post_id, stored in signatures.items() if similarity(stored, value) >= 0.6)
+                for value in query_signatures[:scanned]]
+    scan = (time.perf_counter() - started) / scanned
+    recall = sum(len(set(a) & set(b)) for a, b in zip(found, expected)) / max(1, sum(map(len, expected)))
+
+    print(f'{args.posts} indexed posts ({build:.1f}s to build), {args.lookups} lookups')
+    print(f'signature        {signing * 1000:8.3f} ms')
+    print(f'index lookup     {lookup * 1000:8.3f} ms')
+    print(f'linear scan      {scan * 1000:8.3f} ms')
+    print(f'index recall vs scan: {recall:.1%}')
+
+
+if __name__ == '__main__':
+    main()
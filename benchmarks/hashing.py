@@ -0,0 +1,89 @@
+"""Measure login throughput and page latency during a login storm.
+
+Runs concurrent logins through the test client with hashing inline and on
+the process pool, reporting logins/sec per core and the p50/p99 latency of
+an anonymous page fetched at the same time. Seed the database first with
+``python -m benchmarks.seed``.
+
+    python -m benchmarks.hashing --concurrency 16 --duration 10
+"""
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.bench import BENCH_USER, percentile
+from benchmarks.seed import SEED_PASSWORD
+
+
+def storm(app, concurrency, duration, page='/explore'):
+    """Log in from ``concurrency`` threads while one thread polls ``page``"""
+    stop = threading.Event()
+    logins, busy, page_latencies = [], [], []
+
+    def login_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            response = client.post('/auth/login', data={
+                'username_or_email': BENCH_USER, 'password': SEED_PASSWORD})
+            if response.status_code == 503:
+                busy.append(1)
+            else:
+                logins.append(1)
+            client.get('/auth/logout')
+
+    def page_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get(page)
+            page_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=page_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    cores = os.cpu_count() or 1
+    return {
+        'logins_per_sec': round(len(logins) / duration, 1),
+        'logins_per_sec_per_core': round(len(logins) / duration / cores, 1),
+        'rejected_503': len(busy),
+        'page_p50_ms': round(percentile(page_latencies, 50) * 1000, 1) if page_latencies else None,
+        'page_p99_ms': round(percentile(page_latencies, 99) * 1000, 1) if page_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, help='pool size (default PASSWORD_HASH_WORKERS)')
+    args = parser.parse_args()
+
+    from app import create_app, password_hasher
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    pool_workers = args.workers or app.config['PASSWORD_HASH_WORKERS']
+    print(f'{os.cpu_count()} cores, {args.concurrency} concurrent logins for {args.duration}s')
+    print(f"{'mode':<12}{'logins/s':>10}{'per core':>10}{'503s':>7}{'page p50':>10}{'page p99':>10}")
+    for mode, workers in (('inline', 0), (f'pool x{pool_workers}', pool_workers)):
+        password_hasher.configure(workers=workers)
+        result = storm(app, args.concurrency, args.duration)
+        print(f"{mode:<12}{result['logins_per_sec']:>10}{result['logins_per_sec_per_core']:>10}"
+              f"{result['rejected_503']:>7}{result['page_p50_ms']:>10}{result['page_p99_ms']:>10}")
+    password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
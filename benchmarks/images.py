@@ -0,0 +1,94 @@
+"""Measure time and peak memory per image upload.
+
+Compares the previous save path (full decode, then ``thumbnail``) with
+utils.images (reduced-size JPEG decode, one decode for every size) on a
+synthetic phone photo. Each mode runs in a fresh interpreter so its peak
+RSS is its own.
+
+    python -m benchmarks.images --megapixels 48 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UPLOAD = '''
+import io, json, resource, sys, time
+from PIL import Image
+sys.path.insert(0, sys.argv[4])
+
+def peak_kb():
+    # VmHWM is this process's own high-water mark; ru_maxrss can carry the parent's over exec
+    try:
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmHWM'))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+mode, path, runs = sys.argv[1], sys.argv[2], int(sys.argv[3])
+data = open(path, 'rb').read()
+baseline = peak_kb()
+timings = []
+for _ in range(runs):
+    out = io.BytesIO()
+    start = time.perf_counter()
+    if mode == 'full_decode':
+        img = Image.open(io.BytesIO(data))
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+        img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
+        img.save(out, 'JPEG', optimize=True, quality=85)
+        thumb = Image.open(io.BytesIO(out.getvalue()))  # FileHandler.create_thumbnail decoded again
+        thumb.thumbnail((300, 300), Image.Resampling.LANCZOS)
+        thumb.save(io.BytesIO(), 'JPEG', optimize=True, quality=85)
+    else:
+        from utils.images import render_sizes
+        variants = render_sizes(io.BytesIO(data), {'': (1200, 1200), 'thumb': (300, 300)}, 100_000_000)
+        for image in variants.values():
+            image.save(out, 'JPEG', optimize=True, quality=85)
+    timings.append((time.perf_counter() - start) * 1000)
+peak = peak_kb()
+print(json.dumps({'ms': sorted(timings)[len(timings) // 2], 'peak_rss_mb': peak / 1024,
+                  'upload_rss_mb': (peak - baseline) / 1024}))
+'''
+
+
+def make_photo(path, megapixels):
+    """A JPEG with camera-like noise and an EXIF rotation, like a phone upload"""
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    tile = Image.merge('RGB', [Image.effect_noise((512, 512), sigma) for sigma in (40, 50, 60)])
+    photo = tile.resize((width, height), Image.Resampling.BILINEAR)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90
+    photo.save(path, 'JPEG', quality=90, exif=exif)
+    return width, height
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=48)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'photo.jpg')
+        width, height = make_photo(path, args.megapixels)
+        print(f'{width}x{height} JPEG ({os.path.getsize(path) / 1e6:.1f} MB), 1200px + 300px outputs, '
+              f'median of {args.runs}')
+        print(f"{'mode':<14}{'ms/upload':>11}{'peak RSS MB':>13}{'upload RSS MB':>15}")
+        for mode in ('full_decode', 'pipeline'):
+            output = subprocess.run([sys.executable, '-c', UPLOAD, mode, path, str(args.runs), ROOT],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output)
+            print(f"{mode:<14}{result['ms']:>11.1f}{result['peak_rss_mb']:>13.1f}{result['upload_rss_mb']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Time sending digest mail: a new SMTP connection per message vs the pooled Mailer.
+
+Starts a local aiosmtpd server (``pip install aiosmtpd``) that accepts and
+drops every message, optionally adding a delay per connection to stand in
+for the TCP/TLS handshake of a real relay, and sends the same messages
+both ways.
+
+    python -m benchmarks.mail --messages 500 --connect-delay 0.02
+"""
+import argparse
+import asyncio
+import smtplib
+import time
+from email.message import EmailMessage
+
+from flask import Flask
+from utils.mail import Mailer
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class SinkHandler:
+    def __init__(self, connect_delay):
+        self.connect_delay = connect_delay
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.connect_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        return '250 OK'
+
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        message = EmailMessage()
+        message['From'] = 'noreply@localhost'
+        message['To'] = f'user{i}@example.com'
+        message['Subject'] = 'You have 3 new notifications'
+        message.set_content('alice liked your post\n' * 3)
+        messages.append(message)
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=200, help='messages per send_many (DIGEST_BATCH_SIZE)')
+    parser.add_argument('--connect-delay', type=float, default=0.02, help='seconds added to each EHLO')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+    if Controller is None:
+        raise SystemExit('This benchmark needs aiosmtpd: pip install aiosmtpd')
+
+    controller = Controller(SinkHandler(args.connect_delay), hostname='127.0.0.1', port=args.port)
+    controller.start()
+    try:
+        started = time.perf_counter()
+        for message in make_messages(args.messages):
+            with smtplib.SMTP('127.0.0.1', args.port) as connection:
+                connection.send_message(message)
+        per_message = time.perf_counter() - started
+
+        app = Flask(__name__)
+        app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=args.port, MAIL_USE_TLS=False)
+        mailer = Mailer(app)
+        messages = make_messages(args.messages)
+        started = time.perf_counter()
+        for start in range(0, len(messages), args.batch_size):
+            mailer.send_many(messages[start:start + args.batch_size])
+        pooled = time.perf_counter() - started
+        mailer.close()
+    finally:
+        controller.stop()
+
+    print(f'{args.messages} messages, {args.connect_delay * 1000:.0f} ms per connection setup')
+    print(f'connection per message {per_message:8.2f} s  {args.messages / per_message:8.0f} msg/s')
+    print(f'pooled Mailer          {pooled:8.2f} s  {args.messages / pooled:8.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
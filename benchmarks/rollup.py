@@ -0,0 +1,62 @@
+"""Time the engagement rollup of one event chunk, with and without numpy.
+
+Generates a chunk of synthetic events (views, likes, comments over a week,
+skewed towards a few popular posts) and times utils.engagement.rollup on
+the numpy path and the pure-Python fallback.
+
+    python -m benchmarks.rollup --events 100000 --posts 5000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import utils.engagement as engagement
+
+
+def make_columns(events, posts, users, seed=42):
+    rng = random.Random(seed)
+    start = int(time.time()) - 7 * 86400
+    post_ids = [min(int(rng.paretovariate(1.2)), posts) for _ in range(events)]
+    return {
+        'ts': sorted(start + rng.randrange(7 * 86400) for _ in range(events)),
+        'kind': [rng.choices((0, 1, 2, 3), (90, 7, 1, 2))[0] for _ in range(events)],
+        'post_id': post_ids,
+        'user_id': [post_id % users + 1 for post_id in post_ids],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'events.chunk')
+        engagement.write_chunk(path, make_columns(args.events, args.posts, args.users))
+        print(f'{args.events} events, {os.path.getsize(path) / 1e6:.1f} MB chunk, best of {args.runs}')
+        print(f"{'mode':<10}{'read ms':>10}{'rollup ms':>12}{'rows':>10}")
+        numpy = engagement.numpy
+        for mode in ('numpy', 'python'):
+            if mode == 'numpy' and numpy is None:
+                print(f'{mode:<10}  (not installed)')
+                continue
+            engagement.numpy = numpy if mode == 'numpy' else None
+            reads, rollups = [], []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                columns = engagement.read_chunk(path)
+                reads.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                counts = engagement.rollup(columns)
+                rollups.append(time.perf_counter() - started)
+            print(f'{mode:<10}{min(reads) * 1000:>10.1f}{min(rollups) * 1000:>12.1f}{len(counts):>10}')
+        engagement.numpy = numpy
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Synthetic data generator for benchmarks.
+
+Creates users, a power-law follow graph, posts with tags and media, likes,
+nested comments and notifications using bulk inserts. The same ``--seed``
+always produces the same data set.
+
+    python -m benchmarks.seed --database sqlite:////tmp/bench.db --users 2000
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+
+TAGS = ['travel', 'food', 'tech', 'music', 'art', 'photography', 'sports', 'books',
+        'fitness', 'nature', 'gaming', 'movies', 'python', 'design', 'coffee']
+WORDS = ('the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet today '
+         'weekend coffee sunset city beach mountain code release launch team amazing '
+         'great new first finally love happy trip photo video recipe review').split()
+MEDIA_IMAGES = 8
+BATCH_SIZE = 5000
+SEED_PASSWORD = 'password'
+
+
+def _sentence(rng, min_words=5, max_words=30):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + '.'
+
+
+def _power_law_weights(n, alpha):
+    """Zipf-like popularity weights: the k-th most popular user gets 1 / k**alpha"""
+    return [1.0 / (k ** alpha) for k in range(1, n + 1)]
+
+
+def _bulk_insert(db, model, rows):
+    from app import shards
+    key = getattr(model, '__shard_key__', None)
+    for _, group in shards.partition(rows, key) if key else [(None, rows)]:
+        for start in range(0, len(group), BATCH_SIZE):
+            db.session.execute(insert(model), group[start:start + BATCH_SIZE])
+
+
+def _create_media(upload_folder):
+    """Write a handful of small images that seeded posts point at"""
+    from PIL import Image
+    posts_dir = os.path.join(upload_folder, 'posts')
+    os.makedirs(posts_dir, exist_ok=True)
+    filenames = []
+    for i in range(MEDIA_IMAGES):
+        filename = f'seed_{i}.jpg'
+        path = os.path.join(posts_dir, filename)
+        if not os.path.exists(path):
+            color = ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)
+            Image.new('RGB', (800, 600), color).save(path, quality=85)
+        filenames.append(filename)
+    return filenames
+
+
+def seed(db, users=1000, posts_per_user=5, follows_per_user=20, likes_per_post=8,
+         comments_per_post=3, reply_ratio=0.3, media_ratio=0.2, seed_value=42,
+         upload_folder='static/uploads', days=30):
+    """Populate an empty database; returns a dict of row counts"""
+    from models import User, Post, Comment, Like, Follow, Notification
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    counts = {}
+
+    # Users: hashing is expensive, so every seeded account shares one hash
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    user_rows = [{
+        'id': i,
+        'username': f'user{i}',
+        'email': f'user{i}@example.com',
+        'password_hash': password_hash,
+        'full_name': f'User {i}',
+        'bio': _sentence(rng),
+        'profile_picture': 'default-avatar.png',
+        'is_private': rng.random() < 0.05,
+        'is_verified': rng.random() < 0.02,
+        'is_active': True,
+        'is_admin': False,
+        'created_at': now - timedelta(days=days + rng.randint(0, 365)),
+        'last_seen': now - timedelta(minutes=rng.randint(0, 60 * 24 * days)),
+    } for i in range(1, users + 1)]
+    _bulk_insert(db, User, user_rows)
+    counts['users'] = len(user_rows)
+
+    # Follow graph: followees are drawn with power-law popularity
+    user_ids = list(range(1, users + 1))
+    weights = _power_law_weights(users, 1.1)
+    popularity = user_ids[:]
+    rng.shuffle(popularity)
+    follow_rows = []
+    followers_of = {}
+    for follower in user_ids:
+        wanted = min(users - 1, max(1, int(rng.expovariate(1.0 / follows_per_user))))
+        followed = set()
+        for candidate in rng.choices(popularity, weights=weights, k=wanted * 2):
+            if candidate != follower:
+                followed.add(candidate)
+            if len(followed) >= wanted:
+                break
+        for followed_id in followed:
+            follow_rows.append({'follower_id': follower, 'followed_id': followed_id,
+                                'created_at': now - timedelta(days=rng.randint(0, days))})
+            followers_of.setdefault(followed_id, []).append(follower)
+    _bulk_insert(db, Follow, follow_rows)
+    counts['follows'] = len(follow_rows)
+
+    # Posts: popular users post more
+    media = _create_media(upload_folder) if media_ratio else []
+    post_rows = []
+    post_id = 0
+    for rank, user_id in enumerate(popularity, start=1):
+        n_posts = max(1, int(posts_per_user * 3 * weights[rank - 1] ** 0.3 * rng.random()))
+        for _ in range(n_posts):
+            post_id += 1
+            created = now - timedelta(seconds=rng.randint(0, days * 86400))
+            post_rows.append({
+                'id': post_id,
+                'content': _sentence(rng, 8, 60),
+                'tags': ', '.join(rng.sample(TAGS, rng.randint(0, 4))) or None,
+                'location': rng.choice([None, None, 'Paris', 'Tokyo', 'New York', 'Mumbai']),
+                'image_filename': rng.choice(media) if media and rng.random() < media_ratio else None,
+                'likes_count': 0,
+                'comments_count': 0,
+                'shares_count': 0,
+                'views_count': rng.randint(0, 5000),
+                'created_at': created,
+                'updated_at': created,
+                'user_id': user_id,
+            })
+
+    # Likes, comments and the notifications they trigger
+    like_rows, comment_rows, notification_rows = [], [], []
+    comment_id = 0
+    for post in post_rows:
+        author = post['user_id']
+        audience = followers_of.get(author) or user_ids
+        likers = set(rng.choices(audience, k=int(rng.expovariate(1.0 / likes_per_post))))
+        likers.discard(author)
+        for liker in likers:
+            like_rows.append({'user_id': liker, 'post_id': post['id'], 'owner_id': author,
+                              'created_at': post['created_at']})
+            notification_rows.append({
+                'type': 'like', 'message': f'user{liker} liked your post', 'is_read': rng.random() < 0.7,
+                'post_id': post['id'], 'sender_id': liker, 'recipient_id': author,
+                'created_at': post['created_at'],
+            })
+        post['likes_count'] = len(likers)
+
+        top_level = []
+        for _ in range(int(rng.expovariate(1.0 / comments_per_post))):
+            comment_id += 1
+            commenter = rng.choice(audience)
+            parent = rng.choice(top_level) if top_level and rng.random() < reply_ratio else None
+            if parent is None:
+                top_level.append(comment_id)
+            comment_rows.append({
+                'id': comment_id, 'content': _sentence(rng, 3, 25), 'user_id': commenter,
+                'post_id': post['id'], 'parent_id': parent,
+                'created_at': post['created_at'], 'updated_at': post['created_at'],
+            })
+            if commenter != author:
+                notification_rows.append({
+                    'type': 'comment', 'message': f'user{commenter} commented on your post',
+                    'is_read': rng.random() < 0.7, 'post_id': post['id'], 'comment_id': comment_id,
+                    'sender_id': commenter, 'recipient_id': author, 'created_at': post['created_at'],
+                })
+
+    # comments_count counts every comment on the post, replies included
+    per_post = {}
+    for row in comment_rows:
+        per_post[row['post_id']] = per_post.get(row['post_id'], 0) + 1
+    for post in post_rows:
+        post['comments_count'] = per_post.get(post['id'], 0)
+
+    for follow in follow_rows[::10]:
+        notification_rows.append({
+            'type': 'follow', 'message': f"user{follow['follower_id']} started following you",
+            'is_read': rng.random() < 0.7, 'sender_id': follow['follower_id'],
+            'recipient_id': follow['followed_id'], 'created_at': follow['created_at'],
+        })
+
+    _bulk_insert(db, Post, post_rows)
+    _bulk_insert(db, Comment, comment_rows)
+    _bulk_insert(db, Like, like_rows)
+    _bulk_insert(db, Notification, notification_rows)
+    db.session.commit()
+
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+    counts.update(posts=len(post_rows), comments=len(comment_rows), likes=len(like_rows),
+                  notifications=len(notification_rows))
+    return counts
+
+
+def create_bench_app(database_url):
+    """App bound to the benchmark database, with the schema migrated to head"""
+    from flask_migrate import upgrade
+    from app import create_app, shards
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations'))
+        for shard in range(shards.count):  # SHARD_DATABASE_URLS
+            shards.create_tables(shard)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts-per-user', type=int, default=5)
+    parser.add_argument('--follows-per-user', type=int, default=20)
+    parser.add_argument('--likes-per-post', type=int, default=8)
+    parser.add_argument('--comments-per-post', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from config import Config
+    for url in [args.database] + Config.SHARD_DATABASE_URIS:
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else None
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    from app import db
+    app = create_bench_app(args.database)
+    start = time.perf_counter()
+    with app.app_context():
+        counts = seed(db, users=args.users, posts_per_user=args.posts_per_user,
+                      follows_per_user=args.follows_per_user, likes_per_post=args.likes_per_post,
+                      comments_per_post=args.comments_per_post, seed_value=args.seed,
+                      upload_folder=app.config['UPLOAD_FOLDER'])
+    elapsed = time.perf_counter() - start
+    print(', '.join(f'{count} {name}' for name, count in counts.items()) + f' in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure cold start and forked-worker start times.
+
+Each run starts a fresh interpreter and times importing ``app``,
+``create_app()`` and the first request. The fork run mimics gunicorn
+``--preload``: the app is built once, then each forked child times its
+first request on its own connection pool.
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from config import Config
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = sys.argv[1]
+application = app.create_app(BenchConfig)
+created = time.perf_counter()
+application.test_client().get('/')
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (done - created) * 1000, 'total_ms': (done - start) * 1000,
+                  'modules': len(sys.modules), 'pil_loaded': 'PIL.Image' in sys.modules,
+                  'bleach_loaded': 'bleach' in sys.modules}))
+'''
+
+
+def cold_start(database, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START, database], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def forked_workers(database, runs):
+    """First-request time in children forked from a preloaded app"""
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database
+
+    app = create_app(BenchConfig)
+    app.test_client().get('/')  # the parent holds pooled connections now
+    timings = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = app.test_client().get('/').status_code
+            os.write(write_fd, json.dumps({'ms': (time.perf_counter() - start) * 1000,
+                                           'status': status}).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            result = json.loads(pipe.read())
+        os.waitpid(pid, 0)
+        if result['status'] != 200:
+            raise RuntimeError(f"forked worker got HTTP {result['status']}")
+        timings.append(result['ms'])
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = cold_start(args.database, args.runs)
+    print(f'cold start, median of {args.runs} runs:')
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        print(f'  {key:<18}{statistics.median(r[key] for r in results):>8.1f}')
+    print(f"  modules loaded    {results[-1]['modules']:>8}")
+    print(f"  Pillow / bleach   {'loaded' if results[-1]['pil_loaded'] else 'deferred':>8} / "
+          f"{'loaded' if results[-1]['bleach_loaded'] else 'deferred'}")
+
+    if hasattr(os, 'fork'):
+        timings = forked_workers(args.database, args.runs)
+        print(f'forked worker first request: median {statistics.median(timings):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Measure database load when many readers open the same post at once.
+
+Anonymous readers fetch the busiest post's page, the trending API and the
+front page (trending-tag sidebar) from ``concurrency`` threads, first with
+single-flight disabled and then enabled, and report the SQL statements run
+per request alongside latency. Seed the database first with
+``python -m benchmarks.seed``.
+
+    python -m benchmarks.viral --concurrency 64 --duration 5
+"""
+import argparse
+import threading
+import time
+
+from sqlalchemy import event
+
+from benchmarks.bench import _busiest_post_id, percentile
+
+
+def pile_on(app, paths, concurrency, duration):
+    from app import db
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def count(*args):
+        statements.append(1)
+
+    stop = threading.Event()
+    latencies = []
+
+    def reader(path):
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get(path)
+            latencies.append(time.perf_counter() - start)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    threads = [threading.Thread(target=reader, args=(paths[i % len(paths)],)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    event.remove(engine, 'before_cursor_execute', count)
+
+    return {
+        'requests': len(latencies),
+        'queries_per_request': round(len(statements) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:////tmp/socialapp_bench.db')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    from app import create_app, flights
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    paths = [f'/post/{_busiest_post_id(app)}', '/api/posts/trending', '/']
+    print(f'{args.concurrency} concurrent anonymous readers of {", ".join(paths)} for {args.duration}s')
+    print(f"{'single-flight':<15}{'requests':>10}{'queries/req':>13}{'p50 ms':>9}{'p99 ms':>9}")
+    for enabled in (False, True):
+        flights.enabled = enabled
+        flights.results.clear()
+        result = pile_on(app, paths, args.concurrency, args.duration)
+        print(f"{'on' if enabled else 'off':<15}{result['requests']:>10}{result['queries_per_request']:>13}"
+              f"{result['p50_ms']:>9}{result['p99_ms']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+
+def upload_dirs(app):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    return [
+        os.path.join(upload_folder, 'profiles'),
+        os.path.join(upload_folder, 'posts'),
+        'static/images',
+    ]
+
+
+@click.command('setup')
+@click.option('--upgrade', is_flag=True, help='Apply pending migrations instead of failing.')
+@with_appcontext
+def setup_command(upgrade):
+    """Create upload directories and check the schema is at the latest migration."""
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from flask_migrate import upgrade as upgrade_schema
+    from app import db
+
+    for directory in upload_dirs(current_app):
+        os.makedirs(directory, exist_ok=True)
+
+    config = current_app.extensions['migrate'].migrate.get_config()
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    with db.engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+
+    if current == heads:
+        click.echo(f"Schema is up to date ({', '.join(sorted(heads))}).")
+        return
+    if not upgrade:
+        raise click.ClickException(
+            f"Schema is at {', '.join(sorted(current)) or 'no revision'}, expected "
+            f"{', '.join(sorted(heads))}. Run `flask db upgrade` or `flask setup --upgrade`.")
+    upgrade_schema()
+    click.echo(f"Schema upgraded to {', '.join(sorted(heads))}.")
+
+
+@click.command('render-content')
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+def render_content_command(batch_size):
+    """Render content_html for posts and comments written before it existed."""
+    from app import db
+    from models.post import Post
+    from models.comment import Comment
+
+    for model in (Post, Comment):
+        rendered = 0
+        while True:
+            rows = model.query.filter(model.content_html.is_(None)).limit(batch_size).all()
+            if not rows:
+                break
+            for row in rows:
+                row.render_html()  # no notifications: these mentions were never linked before
+            db.session.commit()
+            rendered += len(rows)
+        click.echo(f'Rendered {rendered} {model.__tablename__} rows.')
+
+
+@click.command('index-duplicates')
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+def index_duplicates_command(batch_size):
+    """Store MinHash signatures for posts written before near-duplicate detection."""
+    from app import db, near_duplicates
+    from models.post import Post
+    from sqlalchemy import bindparam
+    from utils.near_duplicates import signature
+
+    posts = Post.__table__
+    min_tokens = current_app.config['DUPLICATE_MIN_TOKENS']
+    last_id, indexed = 0, 0
+    while True:
+        rows = db.session.query(Post.id, Post.content)\
+                         .filter(Post.id > last_id, Post.content_minhash.is_(None))\
+                         .order_by(Post.id).limit(batch_size).all()
+        if not rows:
+            break
+        updates = [{'b_id': post_id, 'b_minhash': value} for post_id, value in
+                   ((post_id, signature(content, min_tokens)) for post_id, content in rows)
+                   if value is not None]
+        if updates:
+            # updated_at is kept: it versions the content, which has not changed
+            db.session.execute(posts.update().where(posts.c.id == bindparam('b_id'))
+                               .values(content_minhash=bindparam('b_minhash'),
+                                       updated_at=posts.c.updated_at), updates)
+        db.session.commit()
+        indexed += len(updates)
+        last_id = rows[-1].id
+    near_duplicates.reset()
+    click.echo(f'Indexed {indexed} posts.')
+
+
+shards_cli = AppGroup('shards', help='Manage the databases that likes and notifications are sharded over.')
+
+
+def _shard_name(shard):
+    return 'main' if shard is None else f'shard {shard}'
+
+
+@shards_cli.command('init')
+def shards_init_command():
+    """Create the sharded tables on every shard in SHARD_DATABASE_URIS."""
+    from app import shards
+
+    if not shards.count:
+        raise click.ClickException('No shards configured (SHARD_DATABASE_URIS).')
+    for shard in range(shards.count):
+        shards.create_tables(shard)
+        click.echo(f"{_shard_name(shard)}: {', '.join(table.name for table in shards.tables())}")
+
+
+@shards_cli.command('status')
+def shards_status_command():
+    """Show how many rows each database holds."""
+    from app import shards
+
+    for table, counts in shards.counts().items():
+        click.echo(f"{table}: " + ', '.join(f'{_shard_name(shard)} {rows}' for shard, rows in counts.items()))
+
+
+@shards_cli.command('rebalance')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Count the rows that would move.')
+def shards_rebalance_command(batch_size, dry_run):
+    """Move rows to the shard SHARD_MAP now assigns their user to."""
+    from app import shards
+
+    if not shards.count:
+        raise click.ClickException('No shards configured (SHARD_DATABASE_URIS).')
+    total = 0
+    for table, source, target, rows in shards.rebalance(batch_size, dry_run):
+        click.echo(f'{table}: {rows} rows {_shard_name(source)} -> {_shard_name(target)}')
+        total += rows
+    click.echo(f"{'Would move' if dry_run else 'Moved'} {total} rows.")
+
+
+@click.command('worker')
+@click.option('--threads', type=int, help='Jobs run at once per process [default: JOBS_WORKER_THREADS].')
+@click.option('--processes', default=1, show_default=True, help='Forked worker processes.')
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of polling.')
+@click.option('--metrics-port', type=int, help='Serve job metrics on this port (+1 per process).')
+@with_appcontext
+def worker_command(threads, processes, once, metrics_port):
+    """Run background jobs from the database queue."""
+    from app import jobs
+    from utils.jobs import run_workers
+
+    app = current_app._get_current_object()
+    click.echo(f"Worker: {processes} process(es) x {threads or app.config['JOBS_WORKER_THREADS']} "
+               f"threads, tasks: {', '.join(sorted(jobs.tasks))}")
+    run_workers(app, jobs, processes=processes, threads=threads, once=once, metrics_port=metrics_port)
+
+
+def register_commands(app):
+    app.cli.add_command(setup_command)
+    app.cli.add_command(render_content_command)
+    app.cli.add_command(index_duplicates_command)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(shards_cli)
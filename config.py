@@ -19,9 +19,219 @@ class Config:
     # Session settings
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
-    # Mail settings (for notifications - optional)
+    # Password hashing runs on a bounded process pool (0 workers = inline).
+    # Hashes not matching PASSWORD_HASH_METHOD are upgraded on the next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or max(1, (os.cpu_count() or 2) // 2))
+    PASSWORD_HASH_QUEUE_SIZE = None  # defaults to 4 jobs per worker
+    PASSWORD_HASH_QUEUE_TIMEOUT = 0.5
+    
+    # Token-bucket limits on views decorated with utils.decorators.rate_limit.
+    # 'memory://' limits each worker separately; point several workers at one
+    # 'sqlite:////path/ratelimit.db' to share buckets. Keys use request.remote_addr,
+    # so run behind werkzeug's ProxyFix when there is a reverse proxy.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or 'memory://'
+    
+    # ETag/Last-Modified revalidation (304) on views decorated with utils.conditional
+    CONDITIONAL_GET_ENABLED = True
+    
+    # Response compression (utils.compression). Brotli is used when the optional
+    # `brotli` package is installed. Higher levels save bytes at a CPU cost:
+    # see `python -m benchmarks.compression`.
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    COMPRESS_ALGORITHMS = ['br', 'gzip']
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)  # gzip, 1-9
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL') or 4)  # brotli, 0-11
+    COMPRESS_MIN_SIZE = 500  # bytes
+    
+    # ASGI mode (`uvicorn asgi:application`): polled /api endpoints run as coroutines
+    # on an asyncio engine (derived from SQLALCHEMY_DATABASE_URI unless set);
+    # everything else runs on a pool of ASGI_WSGI_THREADS threads.
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS') or 32)
+    LONG_POLL_TIMEOUT = 25  # seconds a /api/notifications/wait request may stay open
+    LONG_POLL_INTERVAL = 2
+    
+    # Concurrent identical computations share one run (utils.single_flight).
+    # (fresh, stale) seconds per name: results are reused while fresh and served
+    # stale while one request refreshes them; (0, 0) only coalesces overlapping calls.
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SINGLE_FLIGHT_TTLS = {
+        'post.detail': (2, 30),  # anonymous viewers only
+        'post.detail.validator': (2, 30),
+        'trending_posts': (30, 300),
+        'trending_posts.validator': (30, 300),
+        'trending_tags': (60, 600),
+    }
+    SINGLE_FLIGHT_WAIT_TIMEOUT = 10  # seconds before a waiter gives up and computes itself
+    
+    # Post views are buffered per process and written every UNIQUE_VIEWS_FLUSH_INTERVAL
+    # seconds; unique viewers are estimated with 2**UNIQUE_VIEWS_PRECISION-register
+    # HyperLogLog sketches (12: ~1.6% error, <= 4 KB per post). Changing the
+    # precision restarts the unique counts.
+    UNIQUE_VIEWS_FLUSH_INTERVAL = int(os.environ.get('UNIQUE_VIEWS_FLUSH_INTERVAL') or 30)
+    UNIQUE_VIEWS_PRECISION = 12
+    
+    # Background jobs (utils.jobs), run by `flask worker`. JOBS_RUN_INLINE runs them
+    # in the request instead, for development without a worker.
+    JOBS_RUN_INLINE = os.environ.get('JOBS_RUN_INLINE', 'false').lower() in ['true', 'on', '1']
+    JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS') or 4)
+    JOBS_POLL_INTERVAL = 1.0  # seconds between polls of an idle queue
+    JOBS_LEASE_SECONDS = 300  # a claimed job is retried if its worker stops renewing this
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_BACKOFF_BASE = 10  # seconds before the first retry, doubling per attempt
+    JOBS_BACKOFF_MAX = 3600
+    JOBS_RETENTION_DAYS = 7
+    
+    # Uploaded images (utils.images): one decode per upload produces every size
+    # listed for its folder; '' is the stored file, other names get a suffix
+    # (post_1_ab_thumb.jpg). Larger images are rejected before decoding.
+    IMAGE_SIZES = {
+        'posts': {'': (1200, 1200)},
+        'profiles': {'': (1200, 1200)},
+    }
+    IMAGE_MAX_PIXELS = 64_000_000  # 48MP phone photos fit
+    IMAGE_QUALITY = 85
+    
+    # Uploaded videos are processed by the process_video job with a local ffmpeg:
+    # a poster frame, a faststart MP4 and HLS renditions (height, video, audio bitrate)
+    # no taller than the source. Without ffmpeg the original file is served as is.
+    FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY') or 'ffmpeg'
+    FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY') or 'ffprobe'
+    VIDEO_RENDITIONS = [(360, '800k', '96k'), (720, '2800k', '128k')]
+    VIDEO_MP4_MAX_HEIGHT = 1080
+    VIDEO_SEGMENT_SECONDS = 4
+    VIDEO_TIMEOUT = 1800  # seconds per ffmpeg run
+    
+    # Account export (/user/export): rows fetched per batch while the zip streams
+    EXPORT_BATCH_SIZE = 500
+    
+    # Engagement events (views, likes, unlikes, comments, follows) are appended to
+    # per-process columnar chunk files in EVENTS_FOLDER, which the web processes and
+    # the worker must share, and folded into hourly and daily EngagementRollup rows
+    # by the rollup_events job every 5 minutes.
+    EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    EVENTS_FOLDER = os.environ.get('EVENTS_FOLDER') or 'instance/events'
+    EVENTS_FLUSH_INTERVAL = int(os.environ.get('EVENTS_FLUSH_INTERVAL') or 60)
+    EVENTS_CHUNK_ROWS = 100_000  # a chunk is written early once this many events are buffered
+    EVENTS_ROLLUP_CHUNKS = 100  # chunk files per rollup run
+    EVENTS_LEDGER_DAYS = 7  # how long rolled-up chunk names are remembered
+    INSIGHTS_MAX_DAYS = {'hour': 14, 'day': 90}
+    
+    # New posts are compared with the last DUPLICATE_WINDOW seconds of posts through
+    # a MinHash index (utils.near_duplicates). With DUPLICATE_MIN_MATCHES or more
+    # copies at DUPLICATE_SIMILARITY (estimated word overlap), DUPLICATE_ACTION
+    # decides: 'flag' (kept, but left out of trending, explore and search),
+    # 'rate_limit' (flagged, DUPLICATE_RATE_LIMIT per user, then rejected),
+    # 'reject' or 'off'. The index holds up to DUPLICATE_INDEX_SIZE posts, ~1 KB each.
+    DUPLICATE_ACTION = os.environ.get('DUPLICATE_ACTION') or 'flag'
+    DUPLICATE_SIMILARITY = 0.6
+    DUPLICATE_MIN_TOKENS = 8  # distinct words; shorter posts are not checked
+    DUPLICATE_MIN_MATCHES = 2
+    DUPLICATE_WINDOW = 86400
+    DUPLICATE_INDEX_SIZE = 20_000
+    DUPLICATE_RATE_LIMIT = (3, 3600)  # (posts, seconds)
+    
+    # Likes and notifications can live on several databases (utils.sharding), keyed
+    # by the liked post's author and the recipient. Shards are numbered by position:
+    # only append. SHARD_MAP ranges [(first user id, shard), ...] place users;
+    # without them user_id % number of shards does. After adding a shard or
+    # changing the map run `flask shards init` and `flask shards rebalance`.
+    SHARD_DATABASE_URIS = [uri for uri in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if uri]
+    SHARD_MAP = []
+    
+    # Per viewer, the ids of users they blocked or muted or who blocked them, cached
+    # per process and dropped on change; the TTL bounds staleness across workers
+    HIDDEN_USERS_CACHE_SIZE = 10000
+    HIDDEN_USERS_CACHE_TTL = 60
+    
+    # current_user snapshots cached per process; TTL bounds staleness across workers
+    SESSION_USER_CACHE_SIZE = 10000
+    SESSION_USER_CACHE_TTL = 60
+    LAST_SEEN_UPDATE_INTERVAL = 300  # seconds between last_seen writes per user
+    
+    # Instrumentation: per-endpoint histograms on /metrics; the sampling profiler
+    # dumps folded stacks of requests slower than PROFILER_SLOW_MS
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_ENDPOINT = '/metrics'
+    # Scrapes are allowed from these addresses (request.remote_addr; behind a proxy that is
+    # the proxy's) or with "Authorization: Bearer $METRICS_TOKEN"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = (os.environ.get('METRICS_ALLOWED_IPS') or '127.0.0.1,::1').split(',')
+    METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'false').lower() in ['true', 'on', '1']
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() in ['true', 'on', '1']
+    PROFILER_SLOW_MS = int(os.environ.get('PROFILER_SLOW_MS') or 500)
+    PROFILER_INTERVAL = 0.005
+    
+    # Query budgets: (max statements, max repeats of one statement) per endpoint.
+    # QUERY_BUDGET_MODE is 'log' (staging), 'raise' (tests) or unset (off).
+    # Numbers are measured on full pages, including the user loader query, without
+    # shards; a statement sent to several shards counts once per shard.
+    QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE')
+    QUERY_BUDGET_DEFAULT = (20, 5)
+    QUERY_BUDGETS = {
+        'auth.login': (3, 1),
+        'auth.register': (4, 1),
+        'auth.logout': (2, 1),
+        'main.index': (7, 1),
+        'main.explore': (9, 1),
+        'main.search': (7, 1),
+        'main.notifications': (8, 1),
+        'user.profile': (8, 2),
+        'user.edit_profile': (4, 2),
+        'user.followers': (5, 1),
+        'user.following': (5, 1),
+        'user.follow': (10, 2),
+        'user.unfollow': (8, 2),
+        'user.block': (6, 2),
+        'user.unblock': (4, 2),
+        'user.mute': (4, 2),
+        'user.unmute': (4, 2),
+        'user.export_data': (12, 2),
+        'user.insights': (6, 2),
+        'post.create': (5, 1),
+        'post.detail': (8, 1),
+        'post.toggle_like': (9, 2),
+        'post.add_comment': (13, 3),
+        'post.delete': (8, 1),
+        'post.posts_by_tag': (4, 1),
+        'api.unread_notifications_count': (3, 1),
+        'api.wait_for_notifications': (3, 1),
+        'api.search_users': (3, 1),
+        'api.trending_posts': (4, 1),
+        'api.user_stats': (4, 1),
+        'api_v2.feed': (5, 1),
+        'api_v2.batch': (4, 2),
+        'api_v2.insights': (4, 2),
+        'metrics': (3, 1),
+    }
+    
+    # Fragment cache for rendered post cards and comment threads (per process)
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 5000
+    FRAGMENT_CACHE_TTL = 300
+    
+    # Mail settings (for notification digests - optional; no MAIL_SERVER, no mail).
+    # utils.mail keeps up to MAIL_MAX_CONNECTIONS SMTP connections open per process
+    # and retries dropped connections and 4xx replies MAIL_RETRIES times with backoff.
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
+    MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL', 'false').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'SocialApp <noreply@localhost>'
+    MAIL_TIMEOUT = 10
+    MAIL_MAX_CONNECTIONS = 2
+    MAIL_MAX_MESSAGES_PER_CONNECTION = 100
+    MAIL_IDLE_TIMEOUT = 60  # seconds a pooled connection may sit unused
+    MAIL_RETRIES = 3
+    MAIL_BACKOFF_BASE = 1.0
+    MAIL_BACKOFF_MAX = 30
+    
+    # Unread notifications are mailed as one digest per user at the frequency they
+    # chose (User.digest_frequency), by the worker's send_digests job
+    DIGEST_BATCH_SIZE = 200  # users per query round and per SMTP batch
+    DIGEST_MAX_ITEMS = 20  # notifications listed in one digest; the rest are counted
+    SITE_URL = os.environ.get('SITE_URL') or 'http://localhost:5000'  # for links in mail
@@ -0,0 +1,59 @@
+"""hot query indexes
+
+Revision ID: 3c9a1e5d7b20
+Revises: fd47bbba234d
+Create Date: 2026-10-19 12:20:41.118032
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1e5d7b20'
+down_revision = 'fd47bbba234d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Profile feed
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.create_index('ix_post_user_id_created_at', ['user_id', 'created_at'], unique=False)
+
+    # Comment pages and replies
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_post_id_parent_id_created_at', ['post_id', 'parent_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_comment_parent_id', ['parent_id'], unique=False)
+
+    # Like counts and liked-by-viewer lookups
+    with op.batch_alter_table('like', schema=None) as batch_op:
+        batch_op.create_index('ix_like_post_id_user_id', ['post_id', 'user_id'], unique=False)
+
+    # Follower lists
+    with op.batch_alter_table('follow', schema=None) as batch_op:
+        batch_op.create_index('ix_follow_followed_id_follower_id', ['followed_id', 'follower_id'], unique=False)
+
+    # Unread counts and the notifications page
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.create_index('ix_notification_recipient_id_is_read', ['recipient_id', 'is_read'], unique=False)
+        batch_op.create_index('ix_notification_recipient_id_created_at', ['recipient_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_recipient_id_created_at')
+        batch_op.drop_index('ix_notification_recipient_id_is_read')
+
+    with op.batch_alter_table('follow', schema=None) as batch_op:
+        batch_op.drop_index('ix_follow_followed_id_follower_id')
+
+    with op.batch_alter_table('like', schema=None) as batch_op:
+        batch_op.drop_index('ix_like_post_id_user_id')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_parent_id')
+        batch_op.drop_index('ix_comment_post_id_parent_id_created_at')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_user_id_created_at')
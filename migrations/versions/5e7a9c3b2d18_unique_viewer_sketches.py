@@ -0,0 +1,35 @@
+"""unique viewer sketches
+
+Revision ID: 5e7a9c3b2d18
+Revises: 8b2d4f6a1c93
+Create Date: 2026-10-19 17:32:48.915203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a9c3b2d18'
+down_revision = '8b2d4f6a1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_view_sketch',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('sketch', sa.LargeBinary(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('post_id')
+    )
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unique_views_count', sa.Integer(), nullable=True, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('unique_views_count')
+
+    op.drop_table('post_view_sketch')
@@ -0,0 +1,28 @@
+"""near duplicate posts
+
+Revision ID: 6b1e4a8c2f75
+Revises: d9f2b7c4e816
+Create Date: 2026-10-19 21:12:40.382916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b1e4a8c2f75'
+down_revision = 'd9f2b7c4e816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_minhash', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('duplicate_of', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('duplicate_of')
+        batch_op.drop_column('content_minhash')
@@ -0,0 +1,32 @@
+"""rendered content html
+
+Revision ID: 8b2d4f6a1c93
+Revises: 3c9a1e5d7b20
+Create Date: 2026-10-19 16:05:12.402917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4f6a1c93'
+down_revision = '3c9a1e5d7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_html', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_column('content_html')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('content_html')
@@ -0,0 +1,28 @@
+"""user digest preferences
+
+Revision ID: a7c41e9d3f58
+Revises: e5a3c9d71b42
+Create Date: 2026-10-20 10:12:37.904211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c41e9d3f58'
+down_revision = 'e5a3c9d71b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('digest_frequency', sa.String(length=10), server_default='daily', nullable=False))
+        batch_op.add_column(sa.Column('last_digest_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('last_digest_at')
+        batch_op.drop_column('digest_frequency')
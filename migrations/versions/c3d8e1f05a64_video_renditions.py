@@ -0,0 +1,30 @@
+"""video renditions
+
+Revision ID: c3d8e1f05a64
+Revises: a41f6d2e9b57
+Create Date: 2026-10-19 19:58:26.740519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8e1f05a64'
+down_revision = 'a41f6d2e9b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('video_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('video_poster', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('video_playlist', sa.String(length=200), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('video_playlist')
+        batch_op.drop_column('video_poster')
+        batch_op.drop_column('video_status')
@@ -0,0 +1,44 @@
+"""engagement rollups
+
+Revision ID: d9f2b7c4e816
+Revises: c3d8e1f05a64
+Create Date: 2026-10-19 20:31:07.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f2b7c4e816'
+down_revision = 'c3d8e1f05a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('event_chunk',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('rolled_up_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('engagement_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=10), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('likes', sa.Integer(), nullable=False),
+    sa.Column('unlikes', sa.Integer(), nullable=False),
+    sa.Column('comments', sa.Integer(), nullable=False),
+    sa.Column('follows', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'period', 'bucket', 'post_id', name='uq_engagement_rollup_key')
+    )
+
+
+def downgrade():
+    op.drop_table('engagement_rollup')
+    op.drop_table('event_chunk')
@@ -0,0 +1,33 @@
+"""like owner id
+
+Revision ID: e5a3c9d71b42
+Revises: 6b1e4a8c2f75
+Create Date: 2026-10-19 23:05:12.418377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a3c9d71b42'
+down_revision = '6b1e4a8c2f75'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('like', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('owner_id', sa.Integer(), nullable=True))
+
+    # Likes are placed on the liked post's author's shard; existing rows get the author
+    op.execute('DELETE FROM "like" WHERE post_id NOT IN (SELECT id FROM post)')
+    op.execute('UPDATE "like" SET owner_id = (SELECT post.user_id FROM post WHERE post.id = "like".post_id)')
+
+    with op.batch_alter_table('like', schema=None) as batch_op:
+        batch_op.alter_column('owner_id', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('like', schema=None) as batch_op:
+        batch_op.drop_column('owner_id')
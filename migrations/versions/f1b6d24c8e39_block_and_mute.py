@@ -0,0 +1,55 @@
+"""block and mute
+
+Revision ID: f1b6d24c8e39
+Revises: a7c41e9d3f58
+Create Date: 2026-10-19 13:19:28.249079
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d24c8e39'
+down_revision = 'a7c41e9d3f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('block',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('blocker_id', sa.Integer(), nullable=False),
+    sa.Column('blocked_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['blocked_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['blocker_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('blocker_id', 'blocked_id', name='unique_blocker_blocked')
+    )
+    with op.batch_alter_table('block', schema=None) as batch_op:
+        batch_op.create_index('ix_block_blocked_id_blocker_id', ['blocked_id', 'blocker_id'], unique=False)
+
+    op.create_table('mute',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('muter_id', sa.Integer(), nullable=False),
+    sa.Column('muted_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['muted_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['muter_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('muter_id', 'muted_id', name='unique_muter_muted')
+    )
+    with op.batch_alter_table('mute', schema=None) as batch_op:
+        batch_op.create_index('ix_mute_muted_id_muter_id', ['muted_id', 'muter_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('mute', schema=None) as batch_op:
+        batch_op.drop_index('ix_mute_muted_id_muter_id')
+
+    op.drop_table('mute')
+    with op.batch_alter_table('block', schema=None) as batch_op:
+        batch_op.drop_index('ix_block_blocked_id_blocker_id')
+
+    op.drop_table('block')
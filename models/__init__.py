@@ -3,6 +3,11 @@ from .post import Post
 from .comment import Comment
 from .like import Like
 from .follow import Follow
+from .block import Block, Mute
 from .notification import Notification
+from .view_sketch import PostViewSketch
+from .job import Job
+from .engagement import EngagementRollup, EventChunk
 
-__all__ = ['User', 'Post', 'Comment', 'Like', 'Follow', 'Notification']
+__all__ = ['User', 'Post', 'Comment', 'Like', 'Follow', 'Block', 'Mute', 'Notification', 'PostViewSketch',
+           'Job', 'EngagementRollup', 'EventChunk']
@@ -0,0 +1,124 @@
+from app import db
+from datetime import datetime
+from sqlalchemy import and_, event, or_, select, union
+from sqlalchemy.orm import Session
+from utils.cache import LRUCache
+
+class Block(db.Model):
+    """``blocker`` and ``blocked`` no longer see each other's posts, comments or notifications"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    blocker_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    blocked_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+    # blocked_id index serves "who blocked me" in hidden_user_ids
+    __table_args__ = (
+        db.UniqueConstraint('blocker_id', 'blocked_id', name='unique_blocker_blocked'),
+        db.Index('ix_block_blocked_id_blocker_id', 'blocked_id', 'blocker_id'),
+    )
+
+    @staticmethod
+    def between(user_id, other_id):
+        """True when either user blocked the other"""
+        return db.session.query(Block.id).filter(or_(
+            and_(Block.blocker_id == user_id, Block.blocked_id == other_id),
+            and_(Block.blocker_id == other_id, Block.blocked_id == user_id),
+        )).first() is not None
+
+    def __repr__(self):
+        return f'<Block {self.blocker_id} -> {self.blocked_id}>'
+
+
+class Mute(db.Model):
+    """``muter`` stops seeing ``muted``'s posts, comments and notifications; ``muted`` isn't told"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    muter_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    muted_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+
+    # muted_id index serves silenced_recipients
+    __table_args__ = (
+        db.UniqueConstraint('muter_id', 'muted_id', name='unique_muter_muted'),
+        db.Index('ix_mute_muted_id_muter_id', 'muted_id', 'muter_id'),
+    )
+
+    def __repr__(self):
+        return f'<Mute {self.muter_id} -> {self.muted_id}>'
+
+
+# Per viewer, the ids of the users hidden from them, as a frozenset
+hidden_ids_cache = LRUCache(maxsize=10000, ttl=60)
+_NONE_HIDDEN = frozenset()
+
+
+def hidden_user_ids(user_id):
+    """Users hidden from ``user_id``: those they blocked or muted and those who blocked them.
+
+    One query per viewer, then served from hidden_ids_cache until a block or
+    mute involving them changes (or the TTL runs out, for other processes).
+    """
+    if user_id is None:
+        return _NONE_HIDDEN
+    ids = hidden_ids_cache.get(user_id)
+    if ids is None:
+        ids = frozenset(db.session.scalars(hidden_ids_query(user_id))) or _NONE_HIDDEN
+        hidden_ids_cache.set(user_id, ids)
+    return ids
+
+
+def hidden_ids_query(user_id):
+    """The statement behind hidden_user_ids; routes/api_async.py runs it on its own sessions"""
+    return union(select(Block.blocked_id).where(Block.blocker_id == user_id),
+                 select(Block.blocker_id).where(Block.blocked_id == user_id),
+                 select(Mute.muted_id).where(Mute.muter_id == user_id))
+
+
+def without_hidden(query, column, viewer):
+    """``query`` minus the rows whose ``column`` is a user hidden from ``viewer`` (may be anonymous)"""
+    if not viewer.is_authenticated:
+        return query
+    hidden = hidden_user_ids(viewer.id)
+    if not hidden:
+        return query
+    # A literal id list from the cache, sorted so the statement stays the same
+    return query.filter(column.notin_(sorted(hidden)))
+
+
+def silenced_recipients(sender_id, recipient_ids):
+    """The recipients ``sender_id`` may not notify (blocked either way, or muted), in one query"""
+    if not recipient_ids:
+        return set()
+    recipient_ids = sorted(recipient_ids)
+    query = union(
+        select(Block.blocker_id).where(Block.blocked_id == sender_id, Block.blocker_id.in_(recipient_ids)),
+        select(Block.blocked_id).where(Block.blocker_id == sender_id, Block.blocked_id.in_(recipient_ids)),
+        select(Mute.muter_id).where(Mute.muted_id == sender_id, Mute.muter_id.in_(recipient_ids)),
+    )
+    return set(db.session.scalars(query))
+
+
+# Both sides of a block see a different set; drop them now and again after the commit
+@event.listens_for(Block, 'after_insert')
+@event.listens_for(Block, 'after_delete')
+def _invalidate_block(mapper, connection, target):
+    _invalidate(target, target.blocker_id, target.blocked_id)
+
+
+@event.listens_for(Mute, 'after_insert')
+@event.listens_for(Mute, 'after_delete')
+def _invalidate_mute(mapper, connection, target):
+    _invalidate(target, target.muter_id)
+
+
+def _invalidate(target, *user_ids):
+    for user_id in user_ids:
+        hidden_ids_cache.pop(user_id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('hidden_ids_users', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_hidden_ids(session):
+    for user_id in session.info.pop('hidden_ids_users', ()):
+        hidden_ids_cache.pop(user_id)
@@ -1,9 +1,12 @@
 from app import db
 from datetime import datetime
+from markupsafe import Markup, escape
+from sqlalchemy.orm import joinedload
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text, nullable=True)  # rendered once at write time
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -17,12 +20,42 @@ class Comment(db.Model):
     # Self-referential relationship for nested comments
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
     
+    # Comment pages (top-level comments of a post, newest first) and reply lookups
+    __table_args__ = (
+        db.Index('ix_comment_post_id_parent_id_created_at', 'post_id', 'parent_id', 'created_at'),
+        db.Index('ix_comment_parent_id', 'parent_id'),
+    )
+    
+    def render_html(self):
+        """Store linkified content; returns the mentioned users as (id, username)"""
+        from utils.content import render_content
+        self.content_html, mentioned = render_content(self.content)
+        return mentioned
+
+    @property
+    def html(self):
+        if self.content_html is None:
+            return escape(self.content)
+        return Markup(self.content_html)
+
     def is_reply(self):
         return self.parent_id is not None
     
     def replies_count(self):
         return self.replies.count()
     
+    @staticmethod
+    def replies_by_parent(comments):
+        """Replies to ``comments`` with their authors, in one query: {parent id: [replies]}"""
+        replies = {}
+        if not comments:
+            return replies
+        for reply in Comment.query.options(joinedload(Comment.author))\
+                                  .filter(Comment.parent_id.in_([comment.id for comment in comments]))\
+                                  .order_by(Comment.id):
+            replies.setdefault(reply.parent_id, []).append(reply)
+        return replies
+    
     def time_ago(self):
         now = datetime.utcnow()
         diff = now - self.created_at
@@ -0,0 +1,85 @@
+from app import db
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+class EngagementRollup(db.Model):
+    """Engagement counts per user, post and hour or day, folded in from the event log.
+
+    ``post_id`` 0 holds account-level events (follows). Written only by the
+    rollup_events job (utils.engagement.roll_up_chunks).
+    """
+
+    METRICS = ('views', 'likes', 'unlikes', 'comments', 'follows')
+    PERIODS = ('hour', 'day')
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, nullable=False, default=0)  # no FK: rollups outlive posts
+    period = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket = db.Column(db.DateTime, nullable=False)  # UTC start of the period
+
+    views = db.Column(db.Integer, nullable=False, default=0)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    unlikes = db.Column(db.Integer, nullable=False, default=0)
+    comments = db.Column(db.Integer, nullable=False, default=0)
+    follows = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'bucket', 'post_id', name='uq_engagement_rollup_key'),
+    )
+
+    @classmethod
+    def series(cls, user_id, period, since, post_id=None):
+        """Totals per bucket since ``since``, over all posts or one"""
+        query = db.session.query(cls.bucket, *(func.sum(getattr(cls, m)).label(m) for m in cls.METRICS))\
+                          .filter(cls.user_id == user_id, cls.period == period, cls.bucket >= since)
+        if post_id is not None:
+            query = query.filter(cls.post_id == post_id)
+        return query.group_by(cls.bucket).order_by(cls.bucket).all()
+
+    @classmethod
+    def top_posts(cls, user_id, since, limit=5):
+        """(post_id, views, likes, comments) of the most viewed posts since ``since``"""
+        views = func.sum(cls.views).label('views')
+        return db.session.query(cls.post_id, views, func.sum(cls.likes).label('likes'),
+                                func.sum(cls.comments).label('comments'))\
+                         .filter(cls.user_id == user_id, cls.period == 'day', cls.bucket >= since,
+                                 cls.post_id != 0)\
+                         .group_by(cls.post_id).order_by(views.desc()).limit(limit).all()
+
+    @classmethod
+    def summary(cls, user_id, period, days, post_id=None):
+        """Series (one entry per bucket, gaps filled with zeros), totals and top posts"""
+        step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+        now = datetime.utcnow()
+        end = now.replace(minute=0, second=0, microsecond=0)
+        if period == 'day':
+            end = end.replace(hour=0)
+        since = end - step * ((days * 24 if period == 'hour' else days) - 1)
+
+        rows = {row.bucket: row for row in cls.series(user_id, period, since, post_id)}
+        series, bucket = [], since
+        while bucket <= end:
+            row = rows.get(bucket)
+            series.append({'bucket': bucket, **{m: int(getattr(row, m) or 0) if row else 0
+                                                 for m in cls.METRICS}})
+            bucket += step
+        totals = {m: sum(entry[m] for entry in series) for m in cls.METRICS}
+        top = [] if post_id is not None else [
+            {'post_id': row.post_id, 'views': int(row.views or 0), 'likes': int(row.likes or 0),
+             'comments': int(row.comments or 0)}
+            for row in cls.top_posts(user_id, since.replace(hour=0))]
+        return {'period': period, 'since': since, 'series': series, 'totals': totals, 'top_posts': top}
+
+    def __repr__(self):
+        return f'<EngagementRollup {self.user_id}/{self.post_id} {self.period} {self.bucket}>'
+
+
+class EventChunk(db.Model):
+    """An event chunk file that has been rolled up, so it is never counted twice"""
+
+    name = db.Column(db.String(100), primary_key=True)
+    rolled_up_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<EventChunk {self.name}>'
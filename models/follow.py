@@ -11,8 +11,19 @@ class Follow(db.Model):
     follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
-    # Unique constraint to prevent duplicate follows
-    __table_args__ = (db.UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed'),)
+    # Unique constraint to prevent duplicate follows; followed_id index serves follower lists
+    __table_args__ = (
+        db.UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed'),
+        db.Index('ix_follow_followed_id_follower_id', 'followed_id', 'follower_id'),
+    )
+    
+    @staticmethod
+    def followed_ids(follower_id, users):
+        """Ids of ``users`` the follower follows, in one query"""
+        if not users:
+            return set()
+        return {followed_id for (followed_id,) in db.session.query(Follow.followed_id).filter(
+            Follow.follower_id == follower_id, Follow.followed_id.in_([user.id for user in users]))}
     
     def __repr__(self):
         return f'<Follow {self.follower.username} -> {self.followed.username}>'
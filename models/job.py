@@ -0,0 +1,36 @@
+from app import db
+from datetime import datetime
+
+class Job(db.Model):
+    """A queued call of a task registered with utils.jobs.JobQueue"""
+    
+    STATUSES = ('queued', 'running', 'done', 'failed')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    
+    # Retries: attempts counts claims, so a job whose worker died is retried too
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    # Lease: the claiming worker's token, renewed while the job runs
+    locked_by = db.Column(db.String(32), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    
+    # Periodic jobs use '<name>:<slot>' so only one worker enqueues each run
+    unique_key = db.Column(db.String(200), nullable=True, unique=True)
+    
+    # Timestamps
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Claiming due jobs, oldest first
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
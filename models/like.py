@@ -2,6 +2,10 @@ from app import db
 from datetime import datetime
 
 class Like(db.Model):
+    # Stored on the shard of the liked post's author (utils.sharding), next to
+    # the likes counted for the post
+    __shard_key__ = 'owner_id'
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # Timestamps
@@ -10,9 +14,23 @@ class Like(db.Model):
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    owner_id = db.Column(db.Integer, nullable=False)  # the post's author, denormalized for routing
+    
+    # Unique constraint to prevent duplicate likes; post_id index serves like counts
+    # and the per-viewer liked lookup from the post side
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_user_post_like'),
+        db.Index('ix_like_post_id_user_id', 'post_id', 'user_id'),
+    )
     
-    # Unique constraint to prevent duplicate likes
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_user_post_like'),)
+    @staticmethod
+    def liked_post_ids(user_id, posts):
+        """Ids of ``posts`` the user likes: one query per shard holding their likes"""
+        if not posts:
+            return set()
+        return {post_id for (post_id,) in db.session.query(Like.post_id).filter(
+            Like.owner_id.in_(sorted({post.user_id for post in posts})), Like.user_id == user_id,
+            Like.post_id.in_([post.id for post in posts]))}
     
     def __repr__(self):
         return f'<Like {self.user.username} -> Post {self.post_id}>'
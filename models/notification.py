@@ -1,7 +1,12 @@
-from app import db
+from app import db, shards
+from models.block import hidden_user_ids, silenced_recipients
+from sqlalchemy import insert
 from datetime import datetime
 
 class Notification(db.Model):
+    # Stored on the recipient's shard (utils.sharding)
+    __shard_key__ = 'recipient_id'
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # Notification types
@@ -31,10 +36,18 @@ class Notification(db.Model):
     post = db.relationship('Post', backref='notifications')
     comment = db.relationship('Comment', backref='notifications')
     
+    # Unread counts and the notifications page (newest first)
+    __table_args__ = (
+        db.Index('ix_notification_recipient_id_is_read', 'recipient_id', 'is_read'),
+        db.Index('ix_notification_recipient_id_created_at', 'recipient_id', 'created_at'),
+    )
+    
     @staticmethod
     def create_notification(sender, recipient, type, post=None, comment=None):
         if sender == recipient:
             return None  # Don't notify yourself
+        if sender.id in hidden_user_ids(recipient.id):
+            return None  # Blocked either way, or muted: dropped, not hidden later
         
         message = f"{sender.username} {Notification.NOTIFICATION_TYPES.get(type, 'interacted with you')}"
         
@@ -50,6 +63,30 @@ class Notification(db.Model):
         db.session.add(notification)
         return notification
     
+    @staticmethod
+    def create_mention_notifications(sender, mentioned, post, comment=None, exclude=()):
+        """Notify mentioned users, (id, username) pairs, with one bulk INSERT per shard"""
+        skip = {sender.id, *exclude}
+        recipients = {user_id for user_id, _ in mentioned if user_id not in skip}
+        recipients -= silenced_recipients(sender.id, recipients)
+        if not recipients:
+            return 0
+        where = 'a comment' if comment else 'a post'
+        now = datetime.utcnow()
+        rows = [{
+            'sender_id': sender.id,
+            'recipient_id': recipient_id,
+            'type': 'mention',
+            'message': f"{sender.username} mentioned you in {where}",
+            'post_id': post.id,
+            'comment_id': comment.id if comment else None,
+            'is_read': False,
+            'created_at': now,
+        } for recipient_id in sorted(recipients)]
+        for _, shard_rows in shards.partition(rows, 'recipient_id'):
+            db.session.execute(insert(Notification), shard_rows)
+        return len(recipients)
+    
     def mark_as_read(self):
         self.is_read = True
     
@@ -1,15 +1,30 @@
 from app import db
 from datetime import datetime
+from markupsafe import Markup, escape
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text, nullable=True)  # rendered once at write time
     
     # Media files
     image_filename = db.Column(db.String(200), nullable=True)
     video_filename = db.Column(db.String(200), nullable=True)
     
+    # Video renditions made by the process_video job: None (no video or made before
+    # processing existed), 'processing', 'ready', 'unprocessed' (no ffmpeg) or
+    # 'failed' (ffmpeg could not process it); the original is served unless 'ready'
+    video_status = db.Column(db.String(20), nullable=True)
+    video_poster = db.Column(db.String(200), nullable=True)
+    video_playlist = db.Column(db.String(200), nullable=True)  # HLS master playlist
+    
+    # Near-duplicate detection (utils.near_duplicates): the content's MinHash
+    # signature, and the earlier post this one nearly copies when it was flagged
+    content_minhash = db.Column(db.LargeBinary, nullable=True)
+    duplicate_of = db.Column(db.Integer, nullable=True)
+    
     # Metadata
     tags = db.Column(db.String(500), nullable=True)  # Comma-separated tags
     location = db.Column(db.String(200), nullable=True)
@@ -19,6 +34,7 @@ class Post(db.Model):
     comments_count = db.Column(db.Integer, default=0)
     shares_count = db.Column(db.Integer, default=0)
     views_count = db.Column(db.Integer, default=0)
+    unique_views_count = db.Column(db.Integer, default=0)  # estimated, see utils.unique_views
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -30,6 +46,23 @@ class Post(db.Model):
     # Relationships
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='post', lazy='dynamic', cascade='all, delete-orphan')
+    view_sketch = db.relationship('PostViewSketch', uselist=False, cascade='all, delete-orphan')
+
+    # Profile feed: posts by author, newest first
+    __table_args__ = (db.Index('ix_post_user_id_created_at', 'user_id', 'created_at'),)
+
+    def render_html(self):
+        """Store linkified content; returns the mentioned users as (id, username)"""
+        from utils.content import render_content
+        self.content_html, mentioned = render_content(self.content)
+        return mentioned
+
+    @property
+    def html(self):
+        # Posts not yet rendered (see `flask render-content`) fall back to the escaped source
+        if self.content_html is None:
+            return escape(self.content)
+        return Markup(self.content_html)
 
     def get_image_url(self):
         if self.image_filename:
@@ -41,6 +74,16 @@ class Post(db.Model):
             return f'/static/uploads/posts/{self.video_filename}'
         return None
 
+    def get_video_poster_url(self):
+        if self.video_poster:
+            return f'/static/uploads/posts/{self.video_poster}'
+        return None
+
+    def get_video_playlist_url(self):
+        if self.video_playlist:
+            return f'/static/uploads/posts/{self.video_playlist}'
+        return None
+
     def get_tags_list(self):
         if self.tags:
             return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
@@ -52,20 +95,40 @@ class Post(db.Model):
         else:
             self.tags = None
 
+    # Likes are filtered by owner_id too, so they are read from one shard (utils.sharding)
+
     def is_liked_by(self, user):
         if user.is_anonymous:
             return False
-        return self.likes.filter_by(user_id=user.id).first() is not None
+        return self.get_like_by_user(user) is not None
 
     def get_like_by_user(self, user):
-        return self.likes.filter_by(user_id=user.id).first()
+        return self.likes.filter_by(owner_id=self.user_id, user_id=user.id).first()
 
     def update_likes_count(self):
-        self.likes_count = self.likes.count()
+        self.likes_count = self.likes.filter_by(owner_id=self.user_id).count()
 
     def update_comments_count(self):
         self.comments_count = self.comments.count()
 
+    def delete(self):
+        """Delete the post, its comments, likes and view sketch in one statement per table.
+
+        Notifications about it are kept with their post and comment cleared,
+        as the ORM cascade did a row at a time.
+        """
+        from models.comment import Comment
+        from models.like import Like
+        from models.notification import Notification
+        from models.view_sketch import PostViewSketch
+        Notification.query.filter_by(post_id=self.id).update(
+            {'post_id': None, 'comment_id': None}, synchronize_session=False)
+        Like.query.filter_by(owner_id=self.user_id, post_id=self.id).delete(synchronize_session=False)
+        Comment.query.filter_by(post_id=self.id).delete(synchronize_session=False)
+        PostViewSketch.query.filter_by(post_id=self.id).delete(synchronize_session=False)
+        Post.query.filter_by(id=self.id).delete(synchronize_session=False)
+        db.session.expunge(self)
+
     def increment_views(self):
         self.views_count = Post.views_count + 1
 
@@ -88,7 +151,8 @@ class Post(db.Model):
         from datetime import datetime, timedelta
         recent_date = datetime.utcnow() - timedelta(days=7)
         
-        return Post.query.filter(Post.created_at >= recent_date)\
+        return Post.query.filter(Post.created_at >= recent_date, Post.duplicate_of.is_(None))\
+                        .options(joinedload(Post.author))\
                         .order_by((Post.likes_count + Post.comments_count).desc())\
                         .limit(limit).all()
 
@@ -98,7 +162,8 @@ class Post(db.Model):
         from datetime import datetime, timedelta
         recent_date = datetime.utcnow() - timedelta(days=7)
         
-        posts = Post.query.filter(Post.created_at >= recent_date, Post.tags.isnot(None)).all()
+        posts = Post.query.filter(Post.created_at >= recent_date, Post.tags.isnot(None),
+                                  Post.duplicate_of.is_(None)).all()
         tag_count = {}
         
         for post in posts:
@@ -1,7 +1,9 @@
-from app import db
+from app import db, password_hasher
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session
 from datetime import datetime
+from utils.cache import LRUCache
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,6 +25,11 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_admin = db.Column(db.Boolean, default=False)  # Added for decorators
     
+    # Notification digest mail (utils.digests): how often, and when the last one went out
+    DIGEST_FREQUENCIES = {'off': None, 'hourly': 3600, 'daily': 86400, 'weekly': 7 * 86400}
+    digest_frequency = db.Column(db.String(10), nullable=False, default='daily', server_default='daily')
+    last_digest_at = db.Column(db.DateTime, nullable=True)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
@@ -57,10 +64,13 @@ class User(UserMixin, db.Model):
                                            cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def follow(self, user):
         if not self.is_following(user) and user != self:
@@ -80,6 +90,58 @@ class User(UserMixin, db.Model):
     def is_following(self, user):
         return self.following.filter_by(followed_id=user.id).first() is not None
 
+    def block(self, user):
+        """Block ``user``; follows between the two are removed"""
+        from models.block import Block
+        from models.follow import Follow
+        if user == self or self.is_blocking(user):
+            return None
+        follows = Follow.query.filter(or_(
+            and_(Follow.follower_id == self.id, Follow.followed_id == user.id),
+            and_(Follow.follower_id == user.id, Follow.followed_id == self.id)))
+        for follow in follows:
+            db.session.delete(follow)
+        block = Block(blocker_id=self.id, blocked_id=user.id)
+        db.session.add(block)
+        return block
+
+    def unblock(self, user):
+        from models.block import Block
+        block = Block.query.filter_by(blocker_id=self.id, blocked_id=user.id).first()
+        if block:
+            db.session.delete(block)
+            return True
+        return False
+
+    def is_blocking(self, user):
+        from models.block import Block
+        return Block.query.filter_by(blocker_id=self.id, blocked_id=user.id).first() is not None
+
+    def mute(self, user):
+        from models.block import Mute
+        if user == self or self.is_muting(user):
+            return None
+        mute = Mute(muter_id=self.id, muted_id=user.id)
+        db.session.add(mute)
+        return mute
+
+    def unmute(self, user):
+        from models.block import Mute
+        mute = Mute.query.filter_by(muter_id=self.id, muted_id=user.id).first()
+        if mute:
+            db.session.delete(mute)
+            return True
+        return False
+
+    def is_muting(self, user):
+        from models.block import Mute
+        return Mute.query.filter_by(muter_id=self.id, muted_id=user.id).first() is not None
+
+    def hidden_user_ids(self):
+        """Ids of the users blocked or muted by this user or blocking them (cached)"""
+        from models.block import hidden_user_ids
+        return hidden_user_ids(self.id)
+
     def followers_count(self):
         return self.followers.count()
 
@@ -97,14 +159,157 @@ class User(UserMixin, db.Model):
     def get_followed_posts(self):
         from models.post import Post  # Import here to avoid circular import
         from models.follow import Follow
+        from models.block import without_hidden
         followed = Post.query.join(Follow, Follow.followed_id == Post.user_id)\
                            .filter(Follow.follower_id == self.id)
+        followed = without_hidden(followed, Post.user_id, self)  # muted users stay followed
         own = Post.query.filter_by(user_id=self.id)
         return followed.union(own).order_by(Post.created_at.desc())
 
     def unread_notifications_count(self):
         return self.notifications_received.filter_by(is_read=False).count()
 
+    def get_user(self):
+        return self
+
     def __repr__(self):
         return f'<User {self.username}>'
 
+
+# Snapshots of the User columns that current_user needs, keyed by user id
+session_user_cache = LRUCache(maxsize=10000, ttl=60)
+
+
+class SessionUser:
+    """Compact, read-only stand-in for User used as current_user.
+
+    Holds only the columns the views and base.html read, so loading it skips
+    the wide user row. Relationship-style helpers run the same queries as User
+    by id. Views that modify the user call get_user() for the ORM object.
+    """
+
+    FIELDS = ('id', 'username', 'full_name', 'profile_picture', 'is_active', 'is_admin',
+              'is_private', 'is_verified', 'last_seen')
+    __slots__ = FIELDS + ('_user',)
+
+    def __init__(self, values):
+        for name, value in zip(self.FIELDS, values):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_user', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'SessionUser is read-only; set {name!r} on current_user.get_user()')
+
+    def __getattr__(self, name):
+        # Anything outside the snapshot comes from the full row
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def get_user(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self.id))
+        return self._user
+
+    # Flask-Login interface, matching UserMixin
+    @property
+    def is_authenticated(self):
+        return self.is_active
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, (User, SessionUser)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def posts(self):
+        from models.post import Post
+        return Post.query.filter_by(user_id=self.id)
+
+    @property
+    def following(self):
+        from models.follow import Follow
+        return Follow.query.filter_by(follower_id=self.id)
+
+    @property
+    def followers(self):
+        from models.follow import Follow
+        return Follow.query.filter_by(followed_id=self.id)
+
+    @property
+    def notifications_received(self):
+        from models.notification import Notification
+        return Notification.query.filter_by(recipient_id=self.id)
+
+    follow = User.follow
+    unfollow = User.unfollow
+    is_following = User.is_following
+    block = User.block
+    unblock = User.unblock
+    is_blocking = User.is_blocking
+    mute = User.mute
+    unmute = User.unmute
+    is_muting = User.is_muting
+    hidden_user_ids = User.hidden_user_ids
+    followers_count = User.followers_count
+    following_count = User.following_count
+    posts_count = User.posts_count
+    get_profile_picture_url = User.get_profile_picture_url
+    get_followed_posts = User.get_followed_posts
+    unread_notifications_count = User.unread_notifications_count
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+
+def load_session_user(user_id):
+    """Return a SessionUser from the snapshot cache, querying only its columns on a miss"""
+    values = session_user_cache.get(user_id)
+    if values is None:
+        columns = [getattr(User, name) for name in SessionUser.FIELDS]
+        row = db.session.query(*columns).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        values = tuple(row)
+        session_user_cache.set(user_id, values)
+    return SessionUser(values)
+
+
+def touch_session_user(user_id, last_seen):
+    """Record a last_seen update in the cached snapshot without reloading it"""
+    values = session_user_cache.get(user_id)
+    if values is not None:
+        index = SessionUser.FIELDS.index('last_seen')
+        session_user_cache.set(user_id, values[:index] + (last_seen,) + values[index + 1:])
+
+
+# Profile edits, password changes and deactivation all flush an UPDATE of the
+# user row; drop the snapshot then and again once the change is committed.
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_session_user(mapper, connection, target):
+    session_user_cache.pop(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('session_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_session_users(session):
+    for user_id in session.info.pop('session_user_ids', ()):
+        session_user_cache.pop(user_id)
+
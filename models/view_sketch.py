@@ -0,0 +1,14 @@
+from app import db
+from datetime import datetime
+
+class PostViewSketch(db.Model):
+    """HyperLogLog sketch of a post's viewers (utils.hyperloglog), at most a few KB"""
+    
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    sketch = db.Column(db.LargeBinary, nullable=False)
+    
+    # Timestamps
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PostViewSketch {self.post_id}>'
@@ -1,28 +1,34 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, g, jsonify, request
 from flask_login import login_required, current_user
-from app import db
+from app import db, flights, shards
 from models.user import User
 from models.post import Post
+from models.follow import Follow
 from models.notification import Notification
+from utils.conditional import conditional
+from utils.decorators import rate_limit
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
 
 api_bp = Blueprint('api', __name__)
 
-@api_bp.route('/notifications/unread-count')
-@login_required
-def unread_notifications_count():
-    count = current_user.unread_notifications_count()
-    return jsonify({'count': count})
+# Shared with the async search endpoint (routes/api_async.py)
+SEARCH_USERS_LIMIT = {'max_requests': 30, 'per_seconds': 10}
 
-@api_bp.route('/users/search')
-def search_users():
-    query = request.args.get('q', '')
+# Resources are plain functions returning dicts so /api/v2/batch can reuse them
+
+def unread_count_resource():
+    return {'count': current_user.unread_notifications_count()}
+
+def search_users_resource(query):
     if len(query) < 2:
-        return jsonify({'users': []})
+        return {'users': []}
     
     users = User.query.filter(
         User.username.contains(query) | 
         User.full_name.contains(query)
     ).limit(10).all()
+    following = Follow.followed_ids(current_user.id, users) if current_user.is_authenticated else set()
     
     result = []
     for user in users:
@@ -31,13 +37,16 @@ def search_users():
             'username': user.username,
             'full_name': user.full_name,
             'avatar': user.get_profile_picture_url(),
-            'is_following': current_user.is_following(user) if current_user.is_authenticated else False
+            'is_following': user.id in following
         })
     
-    return jsonify({'users': result})
+    return {'users': result}
 
-@api_bp.route('/posts/trending')
-def trending_posts():
+def trending_posts_resource():
+    # The same for every viewer, so concurrent requests share one computation
+    return flights.get('trending_posts', None, _trending_posts)
+
+def _trending_posts():
     posts = Post.get_trending_posts(limit=10)
     result = []
     
@@ -52,14 +61,89 @@ def trending_posts():
             'image_url': post.get_image_url()
         })
     
-    return jsonify({'posts': result})
+    return {'posts': result}
+
+def user_stats_resource():
+    posts_count, followers_count, following_count, notifications_count = _stats_counts()
+    return {
+        'posts_count': posts_count,
+        'followers_count': followers_count,
+        'following_count': following_count,
+        'notifications_count': notifications_count
+    }
+
+def _stats_counts():
+    """current_user's posts, followers, following and unread notifications, once per request"""
+    # The ETag validator and the payload both need them
+    if '_stats_counts' not in g:
+        g._stats_counts = _query_stats_counts()
+    return g._stats_counts
+
+def _query_stats_counts():
+    # One statement of scalar subqueries, unless notifications are on a shard
+    def count(column, value, *criteria):
+        return select(func.count()).where(column == value, *criteria).scalar_subquery()
+    
+    user_id = current_user.id
+    counts = [
+        count(Post.user_id, user_id),
+        count(Follow.followed_id, user_id),
+        count(Follow.follower_id, user_id),
+    ]
+    if not shards.count:
+        counts.append(count(Notification.recipient_id, user_id, Notification.is_read.is_(False)))
+    row = tuple(db.session.query(*counts).one())
+    if shards.count:
+        # Notifications are on the recipient's shard (utils.sharding): a second statement there
+        row += (current_user.unread_notifications_count(),)
+    return row
+
+# name -> (resource function, login required)
+RESOURCES = {
+    'unread_count': (unread_count_resource, True),
+    'trending_posts': (trending_posts_resource, False),
+    'stats': (user_stats_resource, True),
+}
+
+@api_bp.route('/notifications/unread-count')
+@login_required
+def unread_notifications_count():
+    return jsonify(unread_count_resource())
+
+@api_bp.route('/notifications/wait')
+@login_required
+def wait_for_notifications():
+    # Answers immediately here; served as a real long poll in ASGI mode (asgi.py)
+    data = unread_count_resource()
+    since = request.args.get('since', type=int)
+    return jsonify({'count': data['count'], 'changed': data['count'] != since})
+
+@api_bp.route('/users/search')
+@rate_limit(**SEARCH_USERS_LIMIT)
+def search_users():
+    return jsonify(search_users_resource(request.args.get('q', '')))
+
+# Validators for conditional GET: one query instead of building the payload
+
+def _trending_validator():
+    return flights.get('trending_posts.validator', None, _trending_row)
+
+def _trending_row():
+    recent_date = datetime.utcnow() - timedelta(days=7)
+    row = db.session.query(func.count(Post.id), func.max(Post.updated_at))\
+                    .filter(Post.created_at >= recent_date).one()
+    return tuple(row), row[1]
+
+def _stats_validator():
+    return _stats_counts(), None
+
+@api_bp.route('/posts/trending')
+@conditional(_trending_validator, time_bucket=60)
+def trending_posts():
+    return jsonify(trending_posts_resource())
 
 @api_bp.route('/stats')
 @login_required
+@conditional(_stats_validator)
 def user_stats():
-    return jsonify({
-        'posts_count': current_user.posts_count(),
-        'followers_count': current_user.followers_count(),
-        'following_count': current_user.following_count(),
-        'notifications_count': current_user.unread_notifications_count()
-    })
+    return jsonify(user_stats_resource())
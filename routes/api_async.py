@@ -0,0 +1,210 @@
+"""Async versions of the polled /api endpoints, served by asgi.py.
+
+Each handler takes a utils.asgi.Request and returns (status, payload,
+headers); the payloads match routes/api.py so the frontend can't tell
+which server answered.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from werkzeug.http import http_date, parse_date, parse_etags
+from app import flights, rate_limiter, shards
+from models.user import User, SessionUser, session_user_cache
+from models.post import Post
+from models.follow import Follow
+from models.notification import Notification
+from models.block import hidden_ids_cache, hidden_ids_query
+from routes.api import SEARCH_USERS_LIMIT
+from utils.conditional import make_validators, not_modified, viewer_key
+
+LOGIN_REQUIRED = (401, {'error': 'Login required'}, None)
+
+
+async def load_user(request, session):
+    """The logged-in user as a SessionUser, sharing the sync app's snapshot cache"""
+    user_id = request.app.session_user_id(request)
+    if user_id is None:
+        return None
+    values = session_user_cache.get(user_id)
+    if values is None:
+        columns = [getattr(User, name) for name in SessionUser.FIELDS]
+        row = (await session.execute(select(*columns).where(User.id == user_id))).first()
+        if row is None:
+            return None
+        values = tuple(row)
+        session_user_cache.set(user_id, values)
+    user = SessionUser(values)
+    return user if user.is_active else None
+
+
+async def load_hidden_ids(session, user_id):
+    """models.block.hidden_user_ids on an async session, sharing its cache"""
+    ids = hidden_ids_cache.get(user_id)
+    if ids is None:
+        ids = frozenset(await session.scalars(hidden_ids_query(user_id)))
+        hidden_ids_cache.set(user_id, ids)
+    return ids
+
+
+def conditional(request, parts, last_modified=None, viewer=('anon',), time_bucket=None):
+    """(not modified, response headers) for a conditional GET, as utils.conditional answers the sync views"""
+    app = request.app.flask_app
+    if not app.config['CONDITIONAL_GET_ENABLED']:
+        return False, None
+    etag, last_modified = make_validators(app, request.full_path, viewer, parts, last_modified, time_bucket)
+    headers = {'ETag': f'W/"{etag}"', 'Cache-Control': 'private, no-cache', 'Vary': 'Cookie'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    cached = not_modified(etag, last_modified, parse_etags(request.headers.get('if-none-match')),
+                          parse_date(request.headers.get('if-modified-since')))
+    return cached, headers
+
+
+def _unread_count_query(user_id):
+    return select(func.count()).select_from(Notification).where(
+        Notification.recipient_id == user_id, Notification.is_read.is_(False))
+
+
+async def unread_count(request):
+    async with request.app.session() as session:
+        user = await load_user(request, session)
+        if user is None:
+            return LOGIN_REQUIRED
+    # Notifications are on the recipient's shard, when there are shards
+    async with request.app.session(shards.shard_for(user.id)) as session:
+        count = await session.scalar(_unread_count_query(user.id))
+    return 200, {'count': count}, None
+
+
+async def wait_for_notifications(request):
+    """Long poll: answers when the unread count differs from ?since= or on timeout"""
+    config = request.app.flask_app.config
+    since = request.args.get('since')
+    since = int(since) if since and since.isdigit() else None
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config['LONG_POLL_TIMEOUT']
+    async with request.app.session() as session:
+        user = await load_user(request, session)
+        if user is None:
+            return LOGIN_REQUIRED
+        user_id = user.id
+    while True:
+        # A short session per check, so waiting requests hold no connection
+        async with request.app.session(shards.shard_for(user_id)) as session:
+            count = await session.scalar(_unread_count_query(user_id))
+        if count != since or loop.time() >= deadline:
+            return 200, {'count': count, 'changed': count != since}, None
+        await asyncio.sleep(config['LONG_POLL_INTERVAL'])
+
+
+async def user_stats(request):
+    def count(column, value, *criteria):
+        return select(func.count()).where(column == value, *criteria).scalar_subquery()
+
+    async with request.app.session() as session:
+        user = await load_user(request, session)
+        if user is None:
+            return LOGIN_REQUIRED
+        counts = [
+            count(Post.user_id, user.id),
+            count(Follow.followed_id, user.id),
+            count(Follow.follower_id, user.id),
+        ]
+        if not shards.count:
+            counts.append(_unread_count_query(user.id).scalar_subquery())
+        row = tuple((await session.execute(select(*counts))).one())
+        viewer = viewer_key(user, await load_hidden_ids(session, user.id))
+    if shards.count:
+        # Notifications are on the recipient's shard: a second statement there
+        async with request.app.session(shards.shard_for(user.id)) as session:
+            row += (await session.scalar(_unread_count_query(user.id)),)
+    # The counts are the whole payload, so they are the validator too
+    cached, headers = conditional(request, row, viewer=viewer)
+    if cached:
+        return 304, None, headers
+    return 200, {
+        'posts_count': row[0],
+        'followers_count': row[1],
+        'following_count': row[2],
+        'notifications_count': row[3],
+    }, headers
+
+
+async def trending_posts(request):
+    # Validator and result are shared with the sync resource in routes/api.py
+    parts, last_modified = await flights.aget('trending_posts.validator', None, lambda: _trending_row(request))
+    cached, headers = conditional(request, parts, last_modified, time_bucket=60)
+    if cached:
+        return 304, None, headers
+    return 200, await flights.aget('trending_posts', None, lambda: _trending_posts(request)), headers
+
+
+async def _trending_row(request):
+    recent_date = datetime.utcnow() - timedelta(days=7)
+    async with request.app.session() as session:
+        row = (await session.execute(select(func.count(Post.id), func.max(Post.updated_at))
+                                     .where(Post.created_at >= recent_date))).one()
+    return tuple(row), row[1]
+
+
+async def _trending_posts(request):
+    recent_date = datetime.utcnow() - timedelta(days=7)
+    async with request.app.session() as session:
+        rows = (await session.execute(
+            select(Post, User.username).join(User, User.id == Post.user_id)
+            .where(Post.created_at >= recent_date, Post.duplicate_of.is_(None))
+            .order_by((Post.likes_count + Post.comments_count).desc())
+            .limit(10))).all()
+    return {'posts': [{
+        'id': post.id,
+        'content': post.content[:100] + '...' if len(post.content) > 100 else post.content,
+        'author': username,
+        'likes_count': post.likes_count,
+        'comments_count': post.comments_count,
+        'time_ago': post.time_ago(),
+        'image_url': post.get_image_url(),
+    } for post, username in rows]}
+
+
+async def search_users(request):
+    query = request.args.get('q', '')
+    async with request.app.session() as session:
+        viewer = await load_user(request, session)
+
+        # Every request counts, short queries too; buckets are shared with @rate_limit on the sync
+        # view, and the SQLite backend blocks, so the hit runs on the thread pool
+        headers = None
+        if request.app.flask_app.config['RATELIMIT_ENABLED']:
+            identity = f'user:{viewer.id}' if viewer else f'ip:{request.remote_addr}'
+            limit = await request.app.run_sync(rate_limiter.hit, f'api.search_users:{identity}',
+                                               **SEARCH_USERS_LIMIT)
+            if not limit.allowed:
+                return 429, {'error': 'Too many requests', 'retry_after': limit.retry_after}, \
+                    {'Retry-After': limit.retry_after}
+            headers = {'X-RateLimit-Limit': limit.limit, 'X-RateLimit-Remaining': limit.remaining}
+        if len(query) < 2:
+            return 200, {'users': []}, headers
+
+        users = (await session.scalars(
+            select(User).where(User.username.contains(query) | User.full_name.contains(query))
+            .limit(10))).all()
+        following = set()
+        if viewer and users:
+            following = set(await session.scalars(select(Follow.followed_id).where(
+                Follow.follower_id == viewer.id, Follow.followed_id.in_([u.id for u in users]))))
+    return 200, {'users': [{
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.full_name,
+        'avatar': user.get_profile_picture_url(),
+        'is_following': user.id in following,
+    } for user in users]}, headers
+
+
+ROUTES = {
+    '/api/notifications/unread-count': unread_count,
+    '/api/notifications/wait': wait_for_notifications,
+    '/api/stats': user_stats,
+    '/api/posts/trending': trending_posts,
+    '/api/users/search': search_users,
+}
@@ -0,0 +1,141 @@
+from datetime import datetime
+from flask import Blueprint, request, current_app
+from flask_login import current_user
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
+from models.post import Post
+from models.like import Like
+from models.engagement import EngagementRollup
+from routes.api import RESOURCES
+from routes.user import insights_args
+from utils.serializers import json_response
+
+api_v2_bp = Blueprint('api_v2', __name__)
+
+# Fields a client may ask for with ?fields=; 'author' is a nested object
+POST_FIELDS = ('id', 'content', 'content_html', 'author', 'image_url', 'video_url',
+               'video_poster_url', 'video_playlist_url', 'tags',
+               'location', 'likes_count', 'comments_count', 'views_count', 'unique_views_count',
+               'created_at', 'time_ago', 'liked')
+DEFAULT_POST_FIELDS = ('id', 'content', 'author', 'image_url', 'likes_count', 'comments_count',
+                       'created_at', 'liked')
+MAX_FEED_LIMIT = 50
+
+def _error(message, status):
+    return json_response({'error': message}, status)
+
+def _parse_fields(allowed, default):
+    raw = request.args.get('fields')
+    if not raw:
+        return default
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+def _encode_cursor(post):
+    return f'{post.created_at.isoformat()}_{post.id}'
+
+def _decode_cursor(cursor):
+    created_at, _, post_id = cursor.rpartition('_')
+    return datetime.fromisoformat(created_at), int(post_id)
+
+def _serialize_post(post, fields, liked_ids):
+    data = {}
+    for field in fields:
+        if field == 'author':
+            author = post.author
+            data['author'] = {
+                'id': author.id,
+                'username': author.username,
+                'full_name': author.full_name,
+                'avatar': author.get_profile_picture_url(),
+                'is_verified': author.is_verified,
+            }
+        elif field == 'content_html':
+            data['content_html'] = str(post.html)
+        elif field == 'image_url':
+            data['image_url'] = post.get_image_url()
+        elif field == 'video_url':
+            data['video_url'] = post.get_video_url()
+        elif field == 'video_poster_url':
+            data['video_poster_url'] = post.get_video_poster_url()
+        elif field == 'video_playlist_url':
+            data['video_playlist_url'] = post.get_video_playlist_url()
+        elif field == 'tags':
+            data['tags'] = post.get_tags_list()
+        elif field == 'time_ago':
+            data['time_ago'] = post.time_ago()
+        elif field == 'liked':
+            data['liked'] = post.id in liked_ids
+        else:
+            data[field] = getattr(post, field)
+    return data
+
+@api_v2_bp.route('/feed')
+def feed():
+    """Keyset-paginated feed for infinite scroll: ?cursor=&limit=&fields="""
+    try:
+        fields = _parse_fields(POST_FIELDS, DEFAULT_POST_FIELDS)
+        cursor = request.args.get('cursor')
+        cursor = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return _error(str(e), 400)
+    limit = min(max(request.args.get('limit', current_app.config['POSTS_PER_PAGE'], type=int), 1),
+                MAX_FEED_LIMIT)
+
+    if current_user.is_authenticated:
+        query = current_user.get_followed_posts()
+    else:
+        query = Post.query.order_by(Post.created_at.desc())
+    if cursor:
+        created_at, post_id = cursor
+        query = query.filter(or_(Post.created_at < created_at,
+                                 and_(Post.created_at == created_at, Post.id < post_id)))
+    if 'author' in fields:
+        query = query.options(selectinload(Post.author))
+    posts = query.order_by(Post.id.desc()).limit(limit + 1).all()
+
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+
+    # One query for the viewer's likes on this page instead of one per post
+    liked_ids = set()
+    if 'liked' in fields and posts and current_user.is_authenticated:
+        liked_ids = Like.liked_post_ids(current_user.id, posts)
+
+    return json_response({
+        'posts': [_serialize_post(post, fields, liked_ids) for post in posts],
+        'next_cursor': _encode_cursor(posts[-1]) if has_more else None,
+    })
+
+@api_v2_bp.route('/batch')
+def batch():
+    """Resolve several /api resources in one request: ?resources=unread_count,stats"""
+    names = [n.strip() for n in request.args.get('resources', '').split(',') if n.strip()]
+    if not names:
+        return _error('No resources requested', 400)
+    unknown = [n for n in names if n not in RESOURCES]
+    if unknown:
+        return _error(f"Unknown resource(s): {', '.join(unknown)}", 400)
+
+    result = {}
+    for name in dict.fromkeys(names):
+        resource, login_required = RESOURCES[name]
+        if login_required and not current_user.is_authenticated:
+            result[name] = {'error': 'Login required', 'status': 401}
+        else:
+            result[name] = resource()
+    return json_response(result)
+
+@api_v2_bp.route('/insights')
+def insights():
+    """Engagement on the viewer's posts per hour or day: ?period=&days=&post_id="""
+    if not current_user.is_authenticated:
+        return _error('Login required', 401)
+    try:
+        period, days, post_id = insights_args()
+    except ValueError as e:
+        return _error(str(e), 400)
+    return json_response(EngagementRollup.summary(current_user.id, period, days, post_id))
@@ -3,11 +3,14 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.urls import url_parse
 from app import db
 from models.user import User
+from utils.decorators import rate_limit
+from utils.hashing import HashingBusy
 import os
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit(max_requests=10, per_seconds=60, key='ip', methods=['POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -23,7 +26,15 @@ def login():
             (User.email == username_or_email)
         ).first()
         
-        if user and user.check_password(password):
+        try:
+            password_ok = user is not None and user.check_password(password)
+            if password_ok and user.is_active and user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+        except HashingBusy as e:
+            return _hashing_busy('auth/login.html', e)
+        
+        if password_ok:
             if not user.is_active:
                 flash('Your account has been deactivated.', 'error')
                 return render_template('auth/login.html')
@@ -39,6 +50,7 @@ def login():
     return render_template('auth/login.html')
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limit(max_requests=5, per_seconds=3600, key='ip', methods=['POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -82,7 +94,10 @@ def register():
             email=email,
             full_name=full_name
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy as e:
+            return _hashing_busy('auth/register.html', e)
         
         db.session.add(user)
         db.session.commit()
@@ -92,6 +107,10 @@ def register():
     
     return render_template('auth/register.html')
 
+def _hashing_busy(template, error):
+    flash('We are getting a lot of sign-ins right now. Please try again in a moment.', 'error')
+    return render_template(template), 503, {'Retry-After': str(error.retry_after)}
+
 @auth_bp.route('/logout')
 @login_required
 def logout():
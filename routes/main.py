@@ -1,10 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required, current_user
-from app import db
+from app import db, flights
 from models.post import Post
-from models.user import User
+from models.like import Like
+from models.user import User, touch_session_user
+from models.block import without_hidden
 from models.notification import Notification
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, selectinload
 
 main_bp = Blueprint('main', __name__)
 
@@ -13,22 +16,27 @@ def index():
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['POSTS_PER_PAGE']
     
+    liked_ids = set()
     if current_user.is_authenticated:
         # Show posts from followed users and own posts
-        posts = current_user.get_followed_posts().paginate(
+        posts = current_user.get_followed_posts().options(joinedload(Post.author)).paginate(
             page=page, per_page=per_page, error_out=False
         )
+        # The viewer's likes on the page, gathered from the shards holding them in one
+        # query each instead of one query per card
+        liked_ids = Like.liked_post_ids(current_user.id, posts.items)
     else:
         # Show recent public posts for non-authenticated users
-        posts = Post.query.order_by(Post.created_at.desc()).paginate(
+        posts = Post.query.options(joinedload(Post.author)).order_by(Post.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
     
     # Get trending tags for sidebar
-    trending_tags = Post.get_trending_tags(limit=5)
+    trending_tags = flights.get('trending_tags', 5, lambda: Post.get_trending_tags(limit=5))
     
     return render_template('main/index.html', 
                          posts=posts, 
+                         liked_ids=liked_ids,
                          trending_tags=trending_tags)
 
 @main_bp.route('/explore')
@@ -37,22 +45,27 @@ def explore():
     per_page = current_app.config['POSTS_PER_PAGE']
     
     # Show trending posts
-    posts = Post.query.order_by(
+    posts = without_hidden(Post.query.filter(Post.duplicate_of.is_(None)), Post.user_id, current_user)
+    # Authors joined in: cards rendered on a fragment cache miss need them
+    posts = posts.options(joinedload(Post.author)).order_by(
         (Post.likes_count + Post.comments_count).desc()
     ).paginate(page=page, per_page=per_page, error_out=False)
     
-    trending_tags = Post.get_trending_tags(limit=10)
+    trending_tags = flights.get('trending_tags', 10, lambda: Post.get_trending_tags(limit=10))
     suggested_users = []
+    liked_ids = set()
     
     if current_user.is_authenticated:
+        liked_ids = Like.liked_post_ids(current_user.id, posts.items)
         # Get users not followed by current user
-        suggested_users = User.query.filter(
+        suggested_users = without_hidden(User.query.filter(
             ~User.id.in_([f.followed_id for f in current_user.following.all()]),
             User.id != current_user.id
-        ).limit(5).all()
+        ), User.id, current_user).limit(5).all()
     
     return render_template('main/explore.html', 
                          posts=posts, 
+                         liked_ids=liked_ids,
                          trending_tags=trending_tags,
                          suggested_users=suggested_users)
 
@@ -62,12 +75,13 @@ def search():
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['POSTS_PER_PAGE']
     
-    posts = Post.query.filter(
+    posts = without_hidden(Post.query.filter(
         or_(
             Post.content.contains(query),
             Post.tags.contains(query)
-        )
-    ).order_by(Post.created_at.desc()).paginate(
+        ),
+        Post.duplicate_of.is_(None)
+    ), Post.user_id, current_user).options(joinedload(Post.author)).order_by(Post.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
@@ -77,9 +91,11 @@ def search():
             User.full_name.contains(query)
         )
     ).limit(10).all()
+    liked_ids = Like.liked_post_ids(current_user.id, posts.items) if current_user.is_authenticated else set()
     
     return render_template('main/search.html', 
                          posts=posts, 
+                         liked_ids=liked_ids,
                          users=users, 
                          query=query)
 
@@ -87,21 +103,32 @@ def search():
 @login_required
 def notifications():
     page = request.args.get('page', 1, type=int)
-    notifications = current_user.notifications_received.order_by(
+    # Older notifications from users blocked or muted since are hidden too
+    # Senders and posts live in the main database: one IN query each, not one per row
+    notifications = without_hidden(current_user.notifications_received, Notification.sender_id,
+                                   current_user).options(
+        selectinload(Notification.sender), selectinload(Notification.post)
+    ).order_by(
         Notification.created_at.desc()
     ).paginate(page=page, per_page=20, error_out=False)
     
-    # Mark notifications as read
-    unread_notifications = current_user.notifications_received.filter_by(is_read=False).all()
-    for notification in unread_notifications:
-        notification.mark_as_read()
+    # Mark notifications as read in one UPDATE; the loaded rows are updated in place
+    current_user.notifications_received.filter_by(is_read=False).update(
+        {'is_read': True}, synchronize_session='evaluate')
+    # Rendered before the commit expires the rows, which would reload each one
+    html = render_template('main/notifications.html', notifications=notifications)
     db.session.commit()
     
-    return render_template('main/notifications.html', notifications=notifications)
+    return html
 
 @main_bp.before_request
 def before_request():
     if current_user.is_authenticated:
         from datetime import datetime
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        now = datetime.utcnow()
+        last_seen = current_user.last_seen
+        # Throttled, and written without loading the full user row
+        if last_seen is None or (now - last_seen).total_seconds() > current_app.config['LAST_SEEN_UPDATE_INTERVAL']:
+            User.query.filter_by(id=current_user.id).update({'last_seen': now})
+            db.session.commit()
+            touch_session_user(current_user.id, now)
@@ -1,13 +1,20 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+import functools
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, session
 from flask_login import login_required, current_user
-from app import db
+from app import db, engagement_log, fragment_cache, flights, jobs, near_duplicates, rate_limiter, \
+    unique_views
 from models.post import Post
+from models.block import Block, without_hidden
 from models.comment import Comment
 from models.like import Like
 from models.notification import Notification
-from utils.helpers import allowed_file, save_picture
-import bleach
-import os
+from models.user import User
+from utils.conditional import conditional
+from utils.decorators import rate_limit
+from utils.content import POST_TAGS, sanitize
+from utils.helpers import allowed_file, save_picture, extract_hashtags
+from utils.images import ImageTooLarge, variant_filename
+from sqlalchemy.orm import joinedload
 
 post_bp = Blueprint('post', __name__)
 
@@ -24,25 +31,47 @@ def create():
             return render_template('post/create.html')
         
         # Clean the content
-        content = bleach.clean(content, tags=['p', 'br', 'strong', 'em', 'u'], strip=True)
+        content = sanitize(content, POST_TAGS)
+        
+        # Near-copies of recent posts (spam waves) are flagged, rate limited or rejected
+        minhash, copies = near_duplicates.check(content)
+        duplicate_of = None
+        if len(copies) >= current_app.config['DUPLICATE_MIN_MATCHES']:
+            action = current_app.config['DUPLICATE_ACTION']
+            allowed = action == 'flag'
+            if action == 'rate_limit':
+                max_requests, per_seconds = current_app.config['DUPLICATE_RATE_LIMIT']
+                allowed = rate_limiter.hit(f'post.duplicate:{current_user.id}',
+                                           max_requests, per_seconds).allowed
+            if not allowed:
+                flash('This post is too similar to posts that were just published.', 'error')
+                return render_template('post/create.html'), 429 if action == 'rate_limit' else 422
+            duplicate_of = copies[0]
         
         # Create new post
         post = Post(
             content=content,
             location=location if location else None,
-            user_id=current_user.id
+            user_id=current_user.id,
+            content_minhash=minhash,
+            duplicate_of=duplicate_of
         )
         
-        # Handle tags
-        if tags:
-            tags_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
-            post.set_tags(tags_list)
+        # Handle tags; #hashtags in the text are tags too, so their links find the post
+        tags_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        tags_list += [tag for tag in extract_hashtags(content) if tag not in tags_list]
+        post.set_tags(tags_list)
+        mentioned = post.render_html()
         
         # Handle image upload
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename and allowed_file(file.filename):
-                filename = save_picture(file, 'posts', f"post_{current_user.id}")
+                try:
+                    filename = save_picture(file, 'posts', f"post_{current_user.id}")
+                except ImageTooLarge:
+                    flash('That image is too large to upload.', 'error')
+                    return render_template('post/create.html')
                 if filename:
                     post.image_filename = filename
         
@@ -53,36 +82,71 @@ def create():
                 filename = save_picture(file, 'posts', f"video_{current_user.id}", is_video=True)
                 if filename:
                     post.video_filename = filename
+                    post.video_status = 'processing'
         
         db.session.add(post)
+        db.session.flush()
+        post_id = post.id  # read before the commit expires it
+        Notification.create_mention_notifications(current_user, mentioned, post)
+        if post.video_status == 'processing':
+            # Poster and streaming renditions; the original is served until they are ready
+            jobs.enqueue('process_video', post_id=post_id)
         db.session.commit()
+        near_duplicates.add(post_id, minhash)
         
         flash('Your post has been created!', 'success')
         return redirect(url_for('main.index'))
     
     return render_template('post/create.html')
 
+def _shared_page():
+    """Anonymous viewers without pending flashes all get the same page"""
+    return current_user.is_anonymous and not session.get('_flashes')
+
+def _detail_validator(post_id):
+    if _shared_page():
+        return flights.get('post.detail.validator', post_id, lambda: _detail_row(post_id))
+    return _detail_row(post_id)
+
+def _detail_row(post_id):
+    # views_count is left out: every render bumps it, so it would defeat the ETag
+    row = db.session.query(Post.updated_at, Post.likes_count, Post.comments_count, User.username,
+                           User.full_name, User.profile_picture, User.is_verified)\
+                    .join(User, User.id == Post.user_id).filter(Post.id == post_id).first()
+    if row is None:
+        return None
+    return tuple(row), row.updated_at
+
 @post_bp.route('/<int:post_id>')
+@conditional(_detail_validator, time_bucket=60)
 def detail(post_id):
-    post = Post.query.get_or_404(post_id)
-    
-    # Increment views
-    from sqlalchemy import text
-    db.session.execute(text('UPDATE post SET views_count = views_count + 1 WHERE id = :post_id'), 
-                      {'post_id': post_id})
-    db.session.commit()
+    # Buffered and written in batches, with the viewer added to the unique-viewer sketch
+    unique_views.record(post_id)
+    engagement_log.record('view', post_id=post_id)
     
     page = request.args.get('page', 1, type=int)
+    if _shared_page():
+        # A viral post's anonymous readers share one query-and-render
+        return flights.get('post.detail', (post_id, page), lambda: _render_detail(post_id, page))
+    return _render_detail(post_id, page)
+
+def _render_detail(post_id, page):
+    post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
     per_page = current_app.config['COMMENTS_PER_PAGE']
     
-    comments = post.comments.filter_by(parent_id=None)\
+    # Replies by hidden users are left out when the cached thread is overlaid (utils.fragments)
+    comments = without_hidden(post.comments.filter_by(parent_id=None), Comment.user_id, current_user)\
+                           .options(joinedload(Comment.author))\
                            .order_by(Comment.created_at.desc())\
                            .paginate(page=page, per_page=per_page, error_out=False)
+    # Threads missing from the fragment cache share one query for their replies
+    replies = functools.cache(lambda: Comment.replies_by_parent(comments.items))
     
-    return render_template('post/detail.html', post=post, comments=comments)
+    return render_template('post/detail.html', post=post, comments=comments, replies=replies)
 
 @post_bp.route('/<int:post_id>/like', methods=['POST'])
 @login_required
+@rate_limit(max_requests=30, per_seconds=60)
 def toggle_like(post_id):
     post = Post.query.get_or_404(post_id)
     
@@ -95,7 +159,7 @@ def toggle_like(post_id):
         message = 'Post unliked'
     else:
         # Like the post
-        like = Like(user_id=current_user.id, post_id=post.id)
+        like = Like(user_id=current_user.id, post_id=post.id, owner_id=post.user_id)
         db.session.add(like)
         liked = True
         message = 'Post liked'
@@ -104,19 +168,23 @@ def toggle_like(post_id):
         if post.author != current_user:
             Notification.create_notification(current_user, post.author, 'like', post=post)
     
-    # Update likes count
-    post.likes_count = post.likes.count()
+    # Update likes count; read before the commit expires the post
+    post.update_likes_count()
+    post_id, likes_count = post.id, post.likes_count
     db.session.commit()
+    engagement_log.record('like' if liked else 'unlike', post_id=post_id)
+    fragment_cache.invalidate('post', post_id)
     
     return jsonify({
         'success': True,
         'liked': liked,
-        'likes_count': post.likes_count,
+        'likes_count': likes_count,
         'message': message
     })
 
 @post_bp.route('/<int:post_id>/comment', methods=['POST'])
 @login_required
+@rate_limit(max_requests=10, per_seconds=60)
 def add_comment(post_id):
     post = Post.query.get_or_404(post_id)
     content = request.form.get('content', '').strip()
@@ -125,8 +193,11 @@ def add_comment(post_id):
     if not content:
         return jsonify({'success': False, 'message': 'Comment cannot be empty'}), 400
     
+    if post.user_id in current_user.hidden_user_ids() and Block.between(current_user.id, post.user_id):
+        return jsonify({'success': False, 'message': 'You cannot comment on this post'}), 403
+    
     # Clean the content
-    content = bleach.clean(content, tags=[], strip=True)
+    content = sanitize(content)
     
     comment = Comment(
         content=content,
@@ -135,16 +206,25 @@ def add_comment(post_id):
         parent_id=parent_id if parent_id else None
     )
     
+    mentioned = comment.render_html()
     db.session.add(comment)
+    db.session.flush()
     
     # Update comments count
-    post.comments_count = post.comments.count() + 1  # Add 1 for the new comment
+    post.update_comments_count()  # the new comment is already flushed
     
     # Create notification
     if post.author != current_user:
         Notification.create_notification(current_user, post.author, 'comment', post=post, comment=comment)
+    # The post's author already hears about the comment
+    Notification.create_mention_notifications(current_user, mentioned, post, comment=comment,
+                                              exclude={post.user_id})
     
     db.session.commit()
+    engagement_log.record('comment', post_id=post.id)
+    fragment_cache.invalidate('post', post.id)
+    if comment.parent_id:
+        fragment_cache.invalidate('comment', comment.parent_id)
     
     return jsonify({
         'success': True,
@@ -152,6 +232,7 @@ def add_comment(post_id):
         'comment': {
             'id': comment.id,
             'content': comment.content,
+            'content_html': str(comment.html),
             'author': comment.author.username,
             'author_avatar': comment.author.get_profile_picture_url(),
             'time_ago': comment.time_ago(),
@@ -169,25 +250,19 @@ def delete(post_id):
         flash('You can only delete your own posts.', 'error')
         return redirect(url_for('post.detail', post_id=post_id))
     
-    # Delete associated files
+    # Associated files are removed by a background job once the delete is committed
+    filenames = [f'posts/{post.video_filename}'] if post.video_filename else []
+    if post.video_poster:
+        filenames.append(f"posts/{post.video_poster.rsplit('/', 1)[0]}")  # rendition directory
     if post.image_filename:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'posts', post.image_filename)
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except OSError:
-            pass
-    
-    if post.video_filename:
-        video_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'posts', post.video_filename)
-        try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-        except OSError:
-            pass
-    
-    db.session.delete(post)
+        filenames += [f'posts/{variant_filename(post.image_filename, name)}'
+                      for name in current_app.config['IMAGE_SIZES']['posts']]
+    if filenames:
+        jobs.enqueue('remove_uploads', filenames=filenames)
+    
+    post.delete()
     db.session.commit()
+    fragment_cache.invalidate('post', post_id)
     
     flash('Your post has been deleted.', 'success')
     return redirect(url_for('main.index'))
@@ -198,7 +273,9 @@ def posts_by_tag(tag_name):
     per_page = current_app.config['POSTS_PER_PAGE']
     
     posts = Post.query.filter(Post.tags.contains(tag_name))\
+                     .options(joinedload(Post.author))\
                      .order_by(Post.created_at.desc())\
                      .paginate(page=page, per_page=per_page, error_out=False)
+    liked_ids = Like.liked_post_ids(current_user.id, posts.items) if current_user.is_authenticated else set()
     
-    return render_template('main/index.html', posts=posts, tag=tag_name)
+    return render_template('main/index.html', posts=posts, liked_ids=liked_ids, tag=tag_name)
@@ -1,15 +1,42 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify, \
+    stream_with_context
 from flask_login import login_required, current_user
-from app import db
+from app import db, engagement_log, fragment_cache
 from models.user import User
 from models.post import Post
 from models.follow import Follow
+from models.block import Block
 from models.notification import Notification
+from models.engagement import EngagementRollup
+from utils.conditional import conditional
+from utils.decorators import rate_limit
+from utils.export import stream_export
 from utils.helpers import allowed_file, save_picture
+from utils.images import ImageTooLarge
+from sqlalchemy import exists, func, select
+from datetime import datetime
 
 user_bp = Blueprint('user', __name__)
 
+def _profile_validator(username):
+    def count(column, value):
+        return select(func.count()).where(column == value).scalar_subquery()
+    
+    columns = [User.full_name, User.bio, User.location, User.website, User.profile_picture,
+               User.cover_photo, User.is_private, User.is_verified,
+               count(Post.user_id, User.id), count(Follow.followed_id, User.id),
+               count(Follow.follower_id, User.id),
+               select(func.max(Post.updated_at)).where(Post.user_id == User.id).scalar_subquery()]
+    if current_user.is_authenticated:
+        columns.append(exists().where(Follow.follower_id == current_user.id,
+                                      Follow.followed_id == User.id))
+    row = db.session.query(*columns).filter(User.username == username).first()
+    if row is None:
+        return None
+    return tuple(row), row[11]
+
 @user_bp.route('/<username>')
+@conditional(_profile_validator, time_bucket=60)
 def profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     page = request.args.get('page', 1, type=int)
@@ -25,42 +52,100 @@ def profile(username):
         if current_user.is_anonymous or not current_user.is_following(user):
             can_view = False
     
+    # Only users in the viewer's cached hidden set need the block and mute lookups
+    blocking = muting = False
+    if current_user.is_authenticated and user.id in current_user.hidden_user_ids():
+        blocking, muting = current_user.is_blocking(user), current_user.is_muting(user)
+        if blocking or user.is_blocking(current_user):
+            can_view = False
+    
     return render_template('user/profile.html', 
                          user=user, 
                          posts=posts, 
-                         can_view=can_view)
+                         can_view=can_view,
+                         blocking=blocking,
+                         muting=muting)
 
 @user_bp.route('/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
+    user = current_user.get_user()
+    
     if request.method == 'POST':
-        current_user.full_name = request.form.get('full_name', '')
-        current_user.bio = request.form.get('bio', '')
-        current_user.location = request.form.get('location', '')
-        current_user.website = request.form.get('website', '')
-        current_user.is_private = bool(request.form.get('is_private'))
-        
-        # Handle profile picture upload
-        if 'profile_picture' in request.files:
-            file = request.files['profile_picture']
-            if file and file.filename and allowed_file(file.filename):
-                filename = save_picture(file, 'profiles', current_user.username)
-                if filename:
-                    current_user.profile_picture = filename
+        user.full_name = request.form.get('full_name', '')
+        user.bio = request.form.get('bio', '')
+        user.location = request.form.get('location', '')
+        user.website = request.form.get('website', '')
+        user.is_private = bool(request.form.get('is_private'))
+        if request.form.get('digest_frequency') in User.DIGEST_FREQUENCIES:
+            user.digest_frequency = request.form['digest_frequency']
         
-        # Handle cover photo upload
-        if 'cover_photo' in request.files:
-            file = request.files['cover_photo']
-            if file and file.filename and allowed_file(file.filename):
-                filename = save_picture(file, 'profiles', f"{current_user.username}_cover")
-                if filename:
-                    current_user.cover_photo = filename
+        try:
+            # Handle profile picture upload
+            if 'profile_picture' in request.files:
+                file = request.files['profile_picture']
+                if file and file.filename and allowed_file(file.filename):
+                    filename = save_picture(file, 'profiles', user.username)
+                    if filename:
+                        user.profile_picture = filename
+            
+            # Handle cover photo upload
+            if 'cover_photo' in request.files:
+                file = request.files['cover_photo']
+                if file and file.filename and allowed_file(file.filename):
+                    filename = save_picture(file, 'profiles', f"{user.username}_cover")
+                    if filename:
+                        user.cover_photo = filename
+        except ImageTooLarge:
+            flash('That image is too large to upload.', 'error')
+            return render_template('user/edit_profile.html', user=user)
         
         db.session.commit()
+        fragment_cache.invalidate('user', user.id)
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('user.profile', username=current_user.username))
+        return redirect(url_for('user.profile', username=user.username))
     
-    return render_template('user/edit_profile.html')
+    return render_template('user/edit_profile.html', user=user)
+
+@user_bp.route('/export')
+@login_required
+@rate_limit(max_requests=3, per_seconds=3600)
+def export_data():
+    """Download everything in the account as a zip, streamed as it is built"""
+    user = current_user.get_user()
+    archive = stream_export(user, current_app.config['UPLOAD_FOLDER'],
+                            current_app.config['EXPORT_BATCH_SIZE'])
+    filename = f"{user.username}-{datetime.utcnow():%Y%m%d}.zip"
+    return current_app.response_class(
+        stream_with_context(archive), mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                 'Cache-Control': 'private, no-store'})
+
+def insights_args():
+    """(period, days, post_id) from ?period=hour|day&days=&post_id=, clamped to INSIGHTS_MAX_DAYS"""
+    period = request.args.get('period', 'day')
+    if period not in EngagementRollup.PERIODS:
+        raise ValueError(f'Unknown period: {period}')
+    max_days = current_app.config['INSIGHTS_MAX_DAYS'][period]
+    days = min(max(request.args.get('days', 7, type=int), 1), max_days)
+    return period, days, request.args.get('post_id', type=int)
+
+@user_bp.route('/insights')
+@login_required
+def insights():
+    """Creator dashboard: engagement on the user's posts, read from the rollups"""
+    try:
+        period, days, post_id = insights_args()
+    except ValueError:
+        period, days, post_id = 'day', 7, None
+    summary = EngagementRollup.summary(current_user.id, period, days, post_id)
+    posts = {}
+    if summary['top_posts']:
+        ids = [row['post_id'] for row in summary['top_posts']]
+        posts = {post.id: post for post in Post.query.filter(Post.id.in_(ids))}
+    peak = max([entry['views'] for entry in summary['series']] + [1])
+    return render_template('user/insights.html', summary=summary, posts=posts, peak=peak,
+                           days=days, period=period)
 
 @user_bp.route('/<username>/followers')
 def followers(username):
@@ -72,9 +157,13 @@ def followers(username):
                                 .filter(Follow.followed_id == user.id)\
                                 .paginate(page=page, per_page=per_page, error_out=False)
     
+    following_ids = Follow.followed_ids(current_user.id, followers_query.items) \
+        if current_user.is_authenticated else set()
+    
     return render_template('user/followers.html', 
                          user=user, 
                          users=followers_query, 
+                         following_ids=following_ids,
                          title='Followers')
 
 @user_bp.route('/<username>/following')
@@ -87,9 +176,13 @@ def following(username):
                                 .filter(Follow.follower_id == user.id)\
                                 .paginate(page=page, per_page=per_page, error_out=False)
     
+    following_ids = Follow.followed_ids(current_user.id, following_query.items) \
+        if current_user.is_authenticated else set()
+    
     return render_template('user/followers.html', 
                          user=user, 
                          users=following_query, 
+                         following_ids=following_ids,
                          title='Following')
 
 @user_bp.route('/follow/<username>', methods=['POST'])
@@ -105,11 +198,15 @@ def follow(username):
     if current_user.is_following(user):
         return jsonify({'success': False, 'message': 'Already following this user'}), 400
     
+    if user.id in current_user.hidden_user_ids() and Block.between(current_user.id, user.id):
+        return jsonify({'success': False, 'message': 'You cannot follow this user'}), 403
+    
     follow_obj = current_user.follow(user)
     if follow_obj:
         # Create notification
         Notification.create_notification(current_user, user, 'follow')
         db.session.commit()
+        engagement_log.record('follow', user_id=user.id)
         
         return jsonify({
             'success': True, 
@@ -141,3 +238,37 @@ def unfollow(username):
         })
     
     return jsonify({'success': False, 'message': 'Failed to unfollow user'}), 500
+
+def _change_user_filter(username, change, message):
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    if user == current_user:
+        return jsonify({'success': False, 'message': 'You cannot do that to yourself'}), 400
+    
+    if not change(user):
+        return jsonify({'success': False, 'message': 'Nothing to change'}), 400
+    
+    db.session.commit()
+    return jsonify({'success': True, 'message': message.format(username)})
+
+@user_bp.route('/block/<username>', methods=['POST'])
+@login_required
+def block(username):
+    return _change_user_filter(username, current_user.block, 'You blocked {}')
+
+@user_bp.route('/unblock/<username>', methods=['POST'])
+@login_required
+def unblock(username):
+    return _change_user_filter(username, current_user.unblock, 'You unblocked {}')
+
+@user_bp.route('/mute/<username>', methods=['POST'])
+@login_required
+def mute(username):
+    return _change_user_filter(username, current_user.mute, 'You muted {}')
+
+@user_bp.route('/unmute/<username>', methods=['POST'])
+@login_required
+def unmute(username):
+    return _change_user_filter(username, current_user.unmute, 'You unmuted {}')
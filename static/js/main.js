@@ -156,7 +156,7 @@ function createCommentHTML(comment) {
             <img src="${comment.author_avatar}" alt="${comment.author}" class="comment-avatar">
             <div class="comment-content">
                 <div class="comment-author">${comment.author}</div>
-                <div class="comment-text">${comment.content}</div>
+                <div class="comment-text">${comment.content_html}</div>
                 <div class="comment-time">${comment.time_ago}</div>
             </div>
         </div>
@@ -265,6 +265,30 @@ function unfollowUser(username) {
     });
 }
 
+// Block, unblock, mute or unmute; what the page lists changes, so reload it
+function changeUserFilter(action, username) {
+  fetch(`/user/${action}/${username}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-CSRFToken": csrfToken,
+    },
+  })
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.success) {
+        showToast(data.message);
+        window.location.reload();
+      } else {
+        showToast(data.message, "error");
+      }
+    })
+    .catch((error) => {
+      console.error("Error:", error);
+      showToast("An error occurred", "error");
+    });
+}
+
 function updateFollowerCount(count) {
   const followerCount = document.querySelector(".stat-number");
   if (followerCount) {
@@ -0,0 +1,89 @@
+"""Background tasks, run by `flask worker` (see utils.jobs)."""
+import os
+import shutil
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db, jobs, mailer
+
+
+@jobs.task(max_attempts=3)
+def remove_uploads(filenames):
+    """Delete files or directories under UPLOAD_FOLDER, e.g. the media of a deleted post"""
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    for filename in filenames:
+        path = os.path.abspath(os.path.join(upload_folder, filename))
+        if os.path.commonpath([upload_folder, path]) != upload_folder:
+            current_app.logger.warning('Refusing to remove %s outside the upload folder', path)
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@jobs.task(max_attempts=3)
+def process_video(post_id):
+    """Make the poster, faststart MP4 and HLS renditions of a post's uploaded video"""
+    from models.post import Post
+    from utils.video import VideoProcessingError, VideoToolsMissing, process_video as render_video
+
+    post = db.session.get(Post, post_id)
+    if post is None or post.video_status != 'processing':
+        return
+    config = current_app.config
+    folder = os.path.join(config['UPLOAD_FOLDER'], 'posts')
+    original = post.video_filename
+    media_dir = os.path.splitext(original)[0]
+    try:
+        render_video(os.path.join(folder, original), os.path.join(folder, media_dir),
+                     config['FFMPEG_BINARY'], config['FFPROBE_BINARY'], config['VIDEO_RENDITIONS'],
+                     mp4_height=config['VIDEO_MP4_MAX_HEIGHT'],
+                     segment_seconds=config['VIDEO_SEGMENT_SECONDS'], timeout=config['VIDEO_TIMEOUT'])
+    except VideoToolsMissing as e:
+        current_app.logger.warning('Serving the original video of post %s: %s', post_id, e)
+        post.video_status = 'unprocessed'
+        return
+    except VideoProcessingError as e:
+        # Not retried: ffmpeg fails the same way on the same input, and a timeout would
+        # only rerun the whole transcode
+        current_app.logger.warning('Serving the original video of post %s: %s', post_id, e)
+        shutil.rmtree(os.path.join(folder, media_dir), ignore_errors=True)
+        post.video_status = 'failed'
+        return
+
+    post.video_filename = f'{media_dir}/video.mp4'
+    post.video_poster = f'{media_dir}/poster.jpg'
+    post.video_playlist = f'{media_dir}/master.m3u8'
+    post.video_status = 'ready'
+    jobs.enqueue('remove_uploads', filenames=[f'posts/{original}'])
+
+
+@jobs.periodic(every=300)
+def rollup_events():
+    """Fold engagement event chunks into hourly and daily rollups"""
+    from utils.engagement import roll_up_chunks
+
+    config = current_app.config
+    roll_up_chunks(config['EVENTS_FOLDER'], config['EVENTS_ROLLUP_CHUNKS'], config['EVENTS_LEDGER_DAYS'])
+
+
+@jobs.periodic(every=600)
+def send_digests():
+    """Mail notification digests to the users whose digest is due"""
+    from utils.digests import send_digests as send
+
+    if mailer.enabled:
+        send(mailer)
+
+
+@jobs.periodic(every=3600)
+def purge_jobs():
+    """Drop finished jobs older than JOBS_RETENTION_DAYS"""
+    from models.job import Job
+
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['JOBS_RETENTION_DAYS'])
+    Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff)\
+             .delete(synchronize_session=False)
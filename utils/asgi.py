@@ -0,0 +1,262 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from flask_login.config import COOKIE_NAME
+from flask_login.utils import decode_cookie
+from itsdangerous import BadSignature
+from utils.serializers import dumps
+
+# Sync driver -> asyncio driver used by the async endpoints
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_url(url):
+    """The app's SQLAlchemy URL with its driver swapped for the asyncio one"""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver configured for {backend!r}; set ASYNC_DATABASE_URI')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class Request:
+    """What an async endpoint needs from the ASGI scope"""
+
+    __slots__ = ('app', 'scope', 'args', '_cookies', '_headers')
+
+    def __init__(self, app, scope):
+        self.app = app
+        self.scope = scope
+        self.args = {k: v[-1] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self._cookies = None
+        self._headers = None
+
+    @property
+    def headers(self):
+        """Request headers by lower-case name; repeated headers are joined with commas"""
+        if self._headers is None:
+            headers = {}
+            for name, value in self.scope['headers']:
+                name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+                headers[name] = f'{headers[name]},{value}' if name in headers else value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def full_path(self):
+        # Same form as Flask's request.full_path, so ETags hash the same URL
+        return f"{self.scope['path']}?{self.scope['query_string'].decode('latin-1')}"
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            cookie = SimpleCookie()
+            for name, value in self.scope['headers']:
+                if name == b'cookie':
+                    cookie.load(value.decode('latin-1'))
+            self._cookies = {key: morsel.value for key, morsel in cookie.items()}
+        return self._cookies
+
+    @property
+    def remote_addr(self):
+        client = self.scope.get('client')
+        return client[0] if client else None
+
+
+class AsyncApp:
+    """ASGI entry point: native async endpoints in front of the Flask app.
+
+    Paths in ``routes`` are served by coroutines with an asyncio database
+    engine, so an idle long-poll costs a coroutine rather than a thread.
+    Every other request goes to the WSGI app on a bounded thread pool, so
+    the sync blueprints keep working unchanged.
+    """
+
+    def __init__(self, flask_app, routes):
+        self.flask_app = flask_app
+        self.routes = routes
+        self.wsgi = WSGIBridge(flask_app, flask_app.config['ASGI_WSGI_THREADS'])
+        self.engine = None
+        self.sessionmaker = None
+        self.shard_engines = {}
+        self.shard_sessionmakers = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await send({'type': 'websocket.close', 'code': 1000})
+        handler = self.routes.get(scope['path'])
+        if handler is None or scope['method'] not in ('GET', 'HEAD'):
+            return await self.wsgi(scope, receive, send)
+        status, payload, headers = await handler(Request(self, scope))
+        if payload is None:  # 304 Not Modified
+            body, response_headers = b'', []
+        else:
+            body = dumps(payload)
+            response_headers = [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]
+        response_headers += [(k.lower().encode(), str(v).encode()) for k, v in (headers or {}).items()]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                for engine in self.shard_engines.values():
+                    await engine.dispose()
+                self.wsgi.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def startup(self):
+        # Imported here: the WSGI deployment never needs the asyncio extension or its drivers
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from app import db, shards
+
+        url = self.flask_app.config['ASYNC_DATABASE_URI']
+        if url is None:
+            with self.flask_app.app_context():
+                url = async_database_url(db.engine.url)
+        self.engine = create_async_engine(url, pool_pre_ping=True)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        # Likes and notifications on shards (utils.sharding) get an engine per shard
+        with self.flask_app.app_context():
+            for shard in range(shards.count):
+                engine = create_async_engine(async_database_url(shards.engine(shard).url), pool_pre_ping=True)
+                self.shard_engines[shard] = engine
+                self.shard_sessionmakers[shard] = async_sessionmaker(engine, expire_on_commit=False)
+
+    def session(self, shard=None):
+        """A session on the main database, or on ``shard`` (Shards.shard_for)"""
+        if self.sessionmaker is None:
+            self.startup()
+        return self.sessionmaker() if shard is None else self.shard_sessionmakers[shard]()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Run blocking ``fn`` (e.g. a SQLite-backed call) on the WSGI thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.wsgi.executor, partial(fn, *args, **kwargs))
+
+    def session_user_id(self, request):
+        """User id from the Flask session cookie or the remember-me cookie, or None when anonymous"""
+        app = self.flask_app
+        cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        serializer = app.session_interface.get_signing_serializer(app)
+        session = {}
+        if cookie and serializer is not None:
+            try:
+                session = serializer.loads(cookie, max_age=int(app.permanent_session_lifetime.total_seconds()))
+            except BadSignature:
+                pass
+        user_id = session.get('_user_id')
+        # As Flask-Login does: fall back to the remember cookie unless logout cleared it
+        if user_id is None and session.get('_remember') != 'clear':
+            remember = request.cookies.get(app.config.get('REMEMBER_COOKIE_NAME', COOKIE_NAME))
+            if remember and app.secret_key:
+                user_id = decode_cookie(remember, key=app.secret_key)
+        try:
+            return int(user_id) if user_id else None
+        except ValueError:
+            return None
+
+
+class WSGIBridge:
+    """Runs a WSGI app for ASGI requests on a bounded thread pool.
+
+    Response chunks are handed back to the event loop as the WSGI app
+    yields them, so streamed responses stay streamed.
+    """
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    async def __call__(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._run, build_environ(scope, bytes(body)), send, loop)
+
+    def _run(self, environ, send, loop):
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]),
+                           [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]]
+            return write
+
+        started = False
+
+        def write(data):
+            nonlocal started
+            if not started:
+                call({'type': 'http.response.start', 'status': response[0], 'headers': response[1]})
+                started = True
+            if data:
+                call({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        app_iter = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in app_iter:
+                write(chunk)
+            write(b'')
+            call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 strings are latin-1)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
@@ -0,0 +1,188 @@
+import re
+import zlib
+from werkzeug.http import parse_accept_header
+from utils.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson',
+    'application/xml', 'image/svg+xml',
+)
+
+_ETAG_SUFFIX = re.compile(r'-(?:gzip|br)"')
+
+
+class Compress:
+    """gzip/brotli response compression as WSGI middleware.
+
+    Responses with a known length are compressed in one go and get a
+    Content-Length; streamed responses (no Content-Length) are compressed
+    chunk by chunk with a sync flush so each chunk still reaches the client
+    straight away. Strong ETags get a ``-gzip``/``-br`` suffix, which is
+    stripped again from If-None-Match before the app sees it; weak ETags
+    from ``utils.conditional`` describe the content, not the bytes, and are
+    left alone. Compressed bodies with a strong ETag (static files) are
+    cached, so they are only compressed once per process.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_ALGORITHMS', ['br', 'gzip'])
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_CACHE_SIZE', 256)
+        app.extensions['compress'] = self
+        if app.config['COMPRESS_ENABLED']:
+            app.wsgi_app = CompressionMiddleware(
+                app.wsgi_app,
+                algorithms=app.config['COMPRESS_ALGORITHMS'],
+                gzip_level=app.config['COMPRESS_LEVEL'],
+                br_level=app.config['COMPRESS_BR_LEVEL'],
+                min_size=app.config['COMPRESS_MIN_SIZE'],
+                mimetypes=app.config['COMPRESS_MIMETYPES'],
+                cache_size=app.config['COMPRESS_CACHE_SIZE'],
+            )
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app, algorithms=('br', 'gzip'), gzip_level=6, br_level=4, min_size=500,
+                 mimetypes=DEFAULT_MIMETYPES, cache_size=256):
+        self.app = app
+        self.algorithms = [a for a in algorithms if a == 'gzip' or (a == 'br' and brotli is not None)]
+        self.gzip_level = gzip_level
+        self.br_level = br_level
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+        self.cache = LRUCache(cache_size)
+
+    def __call__(self, environ, start_response):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = _ETAG_SUFFIX.sub('"', if_none_match)
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return _no_write
+
+        app_iter = self.app(environ, capture)
+        status, headers, exc_info = captured
+        encoding = self._choose_encoding(environ, status, headers)
+
+        if encoding is None:
+            if status.startswith('304') and if_none_match:
+                # Re-tag the 304 the way the cached compressed response was tagged
+                suffix = re.search(r'-(gzip|br)"', if_none_match)
+                if suffix:
+                    headers = _tag_etag(headers, suffix.group(1))
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        streaming = _header(headers, 'content-length') is None
+        headers = [(k, v) for k, v in _tag_etag(headers, encoding) if k.lower() != 'content-length']
+        headers.append(('Content-Encoding', encoding))
+        if streaming:
+            start_response(status, headers, exc_info)
+            return self._stream(app_iter, encoding)
+
+        etag = _header(headers, 'etag')
+        cache_key = (etag, encoding) if etag and not etag.startswith('W/') else None
+        body = self.cache.get(cache_key) if cache_key else None
+        if body is None:
+            try:
+                body = self.compress(b''.join(app_iter), encoding)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+            if cache_key:
+                self.cache.set(cache_key, body)
+        elif hasattr(app_iter, 'close'):
+            app_iter.close()
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers, exc_info)
+        return [body]
+
+    def _choose_encoding(self, environ, status, headers):
+        content_type = (_header(headers, 'content-type') or '').split(';', 1)[0].strip()
+        if content_type not in self.mimetypes:
+            return None
+        _add_vary(headers)
+        if (environ['REQUEST_METHOD'] == 'HEAD' or not status.startswith('200')
+                or _header(headers, 'content-encoding')
+                or 'no-transform' in (_header(headers, 'cache-control') or '')):
+            return None
+        length = _header(headers, 'content-length')
+        if length is not None and int(length) < self.min_size:
+            return None
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for algorithm in self.algorithms:
+            if accept[algorithm]:
+                return algorithm
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.br_level)
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def _stream(self, app_iter, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.br_level)
+            process, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            process = compressor.compress
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            finish = compressor.flush
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    yield process(chunk) + flush()
+            yield finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def _no_write(data):
+    raise RuntimeError('CompressionMiddleware does not support the WSGI write() callable')
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _add_vary(headers):
+    for i, (key, value) in enumerate(headers):
+        if key.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers[i] = (key, f'{value}, Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+def _tag_etag(headers, encoding):
+    """Give strong ETags a per-encoding suffix; the bytes differ per encoding"""
+    tagged = []
+    for key, value in headers:
+        if key.lower() == 'etag' and not value.startswith('W/') and value.endswith('"'):
+            value = f'{value[:-1]}-{encoding}"'
+        tagged.append((key, value))
+    return tagged
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+
+def conditional(validator, time_bucket=None):
+    """Answer If-None-Match / If-Modified-Since with 304 before running the view.
+
+    ``validator`` is called with the view's arguments and returns
+    ``(parts, last_modified)`` from a cheap query - row timestamps and
+    counters - or None to always run the view. The ETag hashes those parts
+    with the viewer's identity, the URL and the template version; pages with
+    relative times ("5m ago") pass ``time_bucket`` seconds to expire their
+    ETag periodically. Requests with pending flash messages always render.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or not current_app.config['CONDITIONAL_GET_ENABLED']
+                    or session.get('_flashes')):
+                return f(*args, **kwargs)
+            validated = validator(*args, **kwargs)
+            if validated is None:
+                return f(*args, **kwargs)
+
+            parts, last_modified = validated
+            etag, last_modified = make_validators(current_app._get_current_object(), request.full_path,
+                                                  _viewer(), parts, last_modified, time_bucket)
+
+            if not_modified(etag, last_modified, request.if_none_match, request.if_modified_since):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
+
+
+def _viewer():
+    if current_user.is_authenticated:
+        return viewer_key(current_user, current_user.hidden_user_ids())
+    return ('anon',)
+
+
+def viewer_key(user, hidden_ids):
+    """The logged-in viewer's part of the ETag; shared with routes/api_async.py"""
+    # base.html shows the viewer's name and avatar; blocks and mutes change what is listed
+    return (user.id, user.username, user.profile_picture, sorted(hidden_ids))
+
+
+def make_validators(app, full_path, viewer, parts, last_modified=None, time_bucket=None):
+    """The ETag and Last-Modified for ``parts`` as seen by ``viewer``; shared with routes/api_async.py"""
+    if time_bucket:
+        parts = tuple(parts) + (int(time.time() // time_bucket),)
+    key = repr((_template_version(app), full_path, viewer, tuple(parts)))
+    etag = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """True when the request's If-None-Match (werkzeug ETags) or If-Modified-Since still holds"""
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if if_modified_since and last_modified is not None:
+        return last_modified <= if_modified_since
+    return False
+
+
+def _template_version(app):
+    """Newest template mtime, so a deploy with changed templates changes every ETag"""
+    version = app.extensions.get('conditional_get_version')
+    if version is None:
+        version = app.config.get('CONDITIONAL_GET_VERSION')
+    if version is None:
+        template_dir = os.path.join(app.root_path, app.template_folder)
+        version = max((os.path.getmtime(os.path.join(root, name))
+                       for root, _, names in os.walk(template_dir) for name in names), default=0)
+        app.extensions['conditional_get_version'] = version
+    return version
@@ -0,0 +1,38 @@
+from utils.helpers import MENTION_RE, HASHTAG_RE
+
+POST_TAGS = ['p', 'br', 'strong', 'em', 'u']
+
+
+def sanitize(text, tags=()):
+    import bleach  # imported on first use to keep worker startup fast
+    return bleach.clean(text, tags=list(tags), strip=True)
+
+
+def render_content(text):
+    """Link @mentions and #hashtags in sanitized text.
+
+    Mentioned usernames are resolved with one IN query; unknown names stay
+    plain text. Returns the HTML and the mentioned users as (id, username).
+    """
+    from models.user import User
+
+    names = set(MENTION_RE.findall(text))
+    mentioned = []
+    if names:
+        mentioned = User.query.with_entities(User.id, User.username)\
+                        .filter(User.username.in_(names), User.is_active.is_(True)).all()
+    known = {username for _, username in mentioned}
+
+    def mention(match):
+        username = match.group(1)
+        if username not in known:
+            return match.group(0)
+        return f'<a href="/user/{username}" class="mention">@{username}</a>'
+
+    def hashtag(match):
+        tag = match.group(1)
+        return f'<a href="/post/tag/{tag}" class="hashtag">#{tag}</a>'
+
+    html = MENTION_RE.sub(mention, text)
+    html = HASHTAG_RE.sub(hashtag, html)
+    return html, mentioned
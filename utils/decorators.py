@@ -1,6 +1,7 @@
 from functools import wraps
-from flask import abort, request, jsonify
+from flask import abort, request, jsonify, current_app, make_response
 from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
 
 def admin_required(f):
     """Require admin privileges"""
@@ -20,13 +21,31 @@ def ajax_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def rate_limit(max_requests=100, per_seconds=3600):
-    """Simple rate limiting decorator"""
+def rate_limit(max_requests=100, per_seconds=3600, key='user', methods=None):
+    """Limit requests per user (or per IP when anonymous, or with key='ip')"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            # Simple rate limiting could be implemented here
-            # For production, consider using Flask-Limiter
-            return f(*args, **kwargs)
+            limiter = current_app.extensions.get('rate_limiter')
+            if (limiter is None or not current_app.config['RATELIMIT_ENABLED']
+                    or (methods and request.method not in methods)):
+                return f(*args, **kwargs)
+
+            if key == 'user' and current_user.is_authenticated:
+                identity = f'user:{current_user.id}'
+            else:
+                identity = f'ip:{request.remote_addr}'
+            result = limiter.hit(f'{request.endpoint}:{identity}', max_requests, per_seconds)
+
+            if not result.allowed:
+                headers = {'Retry-After': str(result.retry_after)}
+                if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+                    raise TooManyRequests(retry_after=result.retry_after)
+                return jsonify({'error': 'Too many requests', 'retry_after': result.retry_after}), 429, headers
+
+            response = make_response(f(*args, **kwargs))
+            response.headers['X-RateLimit-Limit'] = str(result.limit)
+            response.headers['X-RateLimit-Remaining'] = str(result.remaining)
+            return response
         return decorated_function
     return decorator
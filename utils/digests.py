@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app, render_template
+from sqlalchemy import and_, or_, select, update
+from utils.mail import MailUnavailable
+
+
+def build_digest(user, items, total, site_url):
+    """EmailMessage (text and HTML) listing ``items``, the newest of ``total`` unread notifications"""
+    context = {'user': user, 'items': items, 'total': total, 'site_url': site_url}
+    message = EmailMessage()
+    message['To'] = user.email
+    message['Subject'] = f"You have {total} new notification{'s' if total != 1 else ''}"
+    message['List-Unsubscribe'] = f'<{site_url}/user/edit>'
+    message.set_content(render_template('email/digest.txt', **context))
+    message.add_alternative(render_template('email/digest.html', **context), subtype='html')
+    return message
+
+
+def send_digests(mailer, now=None):
+    """Mail each user whose digest is due their unread notifications since the last one.
+
+    Users are read in batches of DIGEST_BATCH_SIZE: one notification query
+    per shard, one ``mailer.send_many`` over a pooled SMTP connection and
+    one UPDATE of ``last_digest_at`` per batch, committed before the next
+    batch. Users without new notifications get no mail but are marked done
+    too. If the SMTP server goes away, the batch so far is recorded and
+    MailUnavailable is raised; the rest are picked up on the next run.
+    Returns the number of digests sent.
+    """
+    from app import db, shards
+    from models.notification import Notification
+    from models.user import User
+
+    config = current_app.config
+    now = now or datetime.utcnow()
+    periods = {name: timedelta(seconds=seconds) for name, seconds in User.DIGEST_FREQUENCIES.items() if seconds}
+    due = or_(*(and_(User.digest_frequency == name,
+                     or_(User.last_digest_at.is_(None), User.last_digest_at <= now - period))
+                for name, period in periods.items()))
+    users_table = User.__table__
+    last_id, sent = 0, 0
+    while True:
+        users = db.session.execute(
+            select(User.id, User.username, User.email, User.digest_frequency, User.last_digest_at)
+            .where(due, User.is_active.is_(True), User.id > last_id)
+            .order_by(User.id).limit(config['DIGEST_BATCH_SIZE'])).all()
+        if not users:
+            return sent
+        last_id = users[-1].id
+        since = {user.id: user.last_digest_at or now - periods[user.digest_frequency] for user in users}
+
+        # Notifications live on the recipient's shard; each query stays on one
+        unread = {}
+        for _, group in shards.partition([{'id': user.id} for user in users], 'id'):
+            ids = [row['id'] for row in group]
+            rows = db.session.execute(
+                select(Notification.recipient_id, Notification.type, Notification.message,
+                       Notification.post_id, Notification.created_at)
+                .where(Notification.recipient_id.in_(ids), Notification.is_read.is_(False),
+                       Notification.created_at > min(since[user_id] for user_id in ids),
+                       Notification.created_at <= now)
+                .order_by(Notification.recipient_id, Notification.created_at.desc()))
+            for row in rows:
+                if row.created_at > since[row.recipient_id]:
+                    unread.setdefault(row.recipient_id, []).append(row)
+
+        recipients = [user for user in users if user.id in unread]
+        messages = [build_digest(user, unread[user.id][:config['DIGEST_MAX_ITEMS']], len(unread[user.id]),
+                                 config['SITE_URL'])
+                    for user in recipients]
+        done = [user.id for user in users if user.id not in unread]
+        try:
+            refused = mailer.send_many(messages)
+        except MailUnavailable as e:
+            done += [user.id for user in recipients[:e.position]]
+            raise
+        else:
+            done += [user.id for user in recipients]
+            sent += len(messages) - len(refused)
+            for message in refused:
+                current_app.logger.warning('Digest to %s was refused by the SMTP server', message['To'])
+        finally:
+            db.session.execute(update(users_table).where(users_table.c.id.in_(done))
+                               .values(last_digest_at=now))
+            db.session.commit()
@@ -0,0 +1,304 @@
+import array
+import atexit
+import itertools
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import after_this_request, current_app
+from sqlalchemy import bindparam, select, tuple_
+
+try:
+    import numpy
+except ImportError:  # optional; the pure-Python rollup gives the same numbers, more slowly
+    numpy = None
+
+KINDS = ('view', 'like', 'unlike', 'comment', 'follow')
+PERIODS = {'hour': 3600, 'day': 86400}
+
+# Chunk file: magic, row count, then each column as little-endian int64 (ts, kind, post_id, user_id)
+COLUMNS = ('ts', 'kind', 'post_id', 'user_id')
+_MAGIC = b'EVT1'
+_HEADER = struct.Struct('<4sQ')
+
+
+def write_chunk(path, columns):
+    """Write equal-length int64 columns to ``path``, atomically"""
+    rows = len(columns['ts'])
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, rows))
+        for name in COLUMNS:
+            column = array.array('q', columns[name])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            f.write(column.tobytes())
+    os.replace(tmp, path)
+
+
+def read_chunk(path):
+    """Columns of a chunk file: numpy int64 arrays, or array('q') without numpy"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, rows = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError(f'{path} is not an event chunk')
+    columns, offset = {}, _HEADER.size
+    for name in COLUMNS:
+        if numpy is not None:
+            columns[name] = numpy.frombuffer(data, '<i8', rows, offset)
+        else:
+            column = array.array('q', data[offset:offset + rows * 8])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = column
+        offset += rows * 8
+    return columns
+
+
+def rollup(columns):
+    """Count events per (user, post, period start, kind) for every period in PERIODS.
+
+    ``columns`` must already carry the owning ``user_id`` of post events.
+    Returns ``{(period, user_id, post_id, bucket): [count per KINDS]}``.
+    """
+    if numpy is not None:
+        return _rollup_numpy(columns)
+    counts = {}
+    for ts, kind, post_id, user_id in zip(*(columns[name] for name in COLUMNS)):
+        for period, seconds in PERIODS.items():
+            key = (period, user_id, post_id, ts - ts % seconds)
+            counts.setdefault(key, [0] * len(KINDS))[kind] += 1
+    return counts
+
+
+def _rollup_numpy(columns):
+    # Sort once per period by (user, post, bucket), cut at the key changes and
+    # count kinds per group with one bincount; Python only sees the output rows
+    ts, kind, post_id, user_id = (numpy.asarray(columns[name]) for name in COLUMNS)
+    counts = {}
+    if not len(ts):
+        return counts
+    for period, seconds in PERIODS.items():
+        bucket = ts - ts % seconds
+        order = numpy.lexsort((bucket, post_id, user_id))
+        keys = numpy.stack([user_id[order], post_id[order], bucket[order]])
+        starts = numpy.ones(len(order), dtype=bool)
+        starts[1:] = (keys[:, 1:] != keys[:, :-1]).any(axis=0)
+        group = numpy.cumsum(starts) - 1
+        groups = int(group[-1]) + 1
+        totals = numpy.bincount(group * len(KINDS) + kind[order],
+                                minlength=groups * len(KINDS)).reshape(groups, len(KINDS))
+        for (user, post, start), row in zip(keys[:, starts].T.tolist(), totals.tolist()):
+            counts[(period, user, post, start)] = row
+    return counts
+
+
+def _with_owners(columns, owners):
+    """Fill in the author of each post event; events of deleted posts are dropped"""
+    follow = KINDS.index('follow')
+    if numpy is not None:
+        kind, post_id = numpy.asarray(columns['kind']), numpy.asarray(columns['post_id'])
+        unique, inverse = numpy.unique(post_id, return_inverse=True)
+        authors = numpy.array([owners.get(p, 0) for p in unique.tolist()], dtype=numpy.int64)[inverse]
+        user_id = numpy.where(kind == follow, numpy.asarray(columns['user_id']), authors)
+        keep = user_id > 0
+        return {'ts': numpy.asarray(columns['ts'])[keep], 'kind': kind[keep],
+                'post_id': numpy.where(kind == follow, 0, post_id)[keep], 'user_id': user_id[keep]}
+    result = {name: [] for name in COLUMNS}
+    for ts, k, post, user in zip(*(columns[name] for name in COLUMNS)):
+        if k != follow:
+            user = owners.get(post, 0)
+        if user > 0:
+            for name, value in zip(COLUMNS, (ts, k, post if k != follow else 0, user)):
+                result[name].append(value)
+    return result
+
+
+def roll_up_chunks(folder, max_chunks=100, retention_days=7):
+    """Fold event chunk files into EngagementRollup rows and delete them.
+
+    Chunks are read one at a time; only the running counts are kept. The
+    chunk names go into EventChunk in the same transaction as the counts,
+    so a chunk whose file outlives the commit is deleted without being
+    counted again, and an overlapping run fails on the ledger's primary key
+    instead of double counting. Returns the number of events rolled up.
+    """
+    from app import db
+    from models.engagement import EngagementRollup, EventChunk
+    from models.post import Post
+
+    try:
+        names = sorted(name for name in os.listdir(folder) if name.endswith('.chunk'))[:max_chunks]
+    except FileNotFoundError:
+        return 0
+    if not names:
+        return 0
+    ledger, rollups, posts = EventChunk.__table__, EngagementRollup.__table__, Post.__table__
+    done = set(db.session.scalars(select(ledger.c.name).where(ledger.c.name.in_(names))))
+
+    counts, owners, rolled, events = {}, {}, [], 0
+    for name in names:
+        if name in done:
+            continue
+        path = os.path.join(folder, name)
+        try:
+            columns = read_chunk(path)
+        except (OSError, ValueError, struct.error):
+            current_app.logger.warning('Skipping unreadable event chunk %s', path, exc_info=True)
+            os.replace(path, f'{path}.bad')
+            continue
+        post_ids = numpy.unique(columns['post_id']).tolist() if numpy is not None \
+            else set(columns['post_id'])
+        missing = sorted(p for p in post_ids if p and p not in owners)
+        for start in range(0, len(missing), 500):
+            owners.update(db.session.execute(select(posts.c.id, posts.c.user_id)
+                                             .where(posts.c.id.in_(missing[start:start + 500]))).all())
+        columns = _with_owners(columns, owners)
+        events += len(columns['ts'])
+        for key, kinds in rollup(columns).items():
+            total = counts.setdefault(key, [0] * len(KINDS))
+            for i, count in enumerate(kinds):
+                total[i] += count
+        rolled.append(name)
+
+    now = datetime.utcnow()
+    metrics = EngagementRollup.METRICS
+    rows = {(period, user_id, post_id, datetime.utcfromtimestamp(bucket)): kinds
+            for (period, user_id, post_id, bucket), kinds in counts.items()}
+    key_columns = (rollups.c.period, rollups.c.user_id, rollups.c.post_id, rollups.c.bucket)
+    with db.engine.begin() as connection:
+        if rolled:
+            connection.execute(ledger.insert(), [{'name': name, 'rolled_up_at': now} for name in rolled])
+        keys, existing = list(rows), set()
+        for start in range(0, len(keys), 200):
+            existing.update(tuple(row) for row in connection.execute(
+                select(*key_columns).where(tuple_(*key_columns).in_(keys[start:start + 200]))))
+
+        params = {'inserts': [], 'updates': []}
+        for key, kinds in rows.items():
+            row = dict(zip(('b_period', 'b_user_id', 'b_post_id', 'b_bucket'), key))
+            row.update((f'b_{metric}', count) for metric, count in zip(metrics, kinds))
+            params['updates' if key in existing else 'inserts'].append(row)
+        if params['inserts']:
+            values = key_columns + tuple(rollups.c[metric] for metric in metrics)
+            connection.execute(rollups.insert().values(
+                {column: bindparam(f'b_{column.name}') for column in values}), params['inserts'])
+        if params['updates']:
+            connection.execute(rollups.update()
+                               .where(*(column == bindparam(f'b_{column.name}') for column in key_columns))
+                               .values({metric: rollups.c[metric] + bindparam(f'b_{metric}')
+                                        for metric in metrics}), params['updates'])
+        connection.execute(ledger.delete()
+                           .where(ledger.c.rolled_up_at < now - timedelta(days=retention_days)))
+
+    for name in rolled + sorted(done):
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+    return events
+
+
+class EngagementLog:
+    """Append-only log of engagement events, written as columnar chunk files.
+
+    ``record(kind, post_id=..., user_id=...)`` appends to in-process column
+    buffers - no database write on the request path. The buffers are written
+    out as a chunk file in EVENTS_FOLDER every ``EVENTS_FLUSH_INTERVAL``
+    seconds (after the response of the request that notices it) or once
+    ``EVENTS_CHUNK_ROWS`` events are buffered, and at exit. Each process
+    writes its own files, so nothing is shared or locked. The rollup_events
+    job (tasks.py) folds the chunks into EngagementRollup rows and deletes them.
+
+    Post events carry only the post id; the post's author is looked up when
+    the chunk is rolled up. Follow events carry the followed user's id.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.interval = None
+        self.chunk_rows = None
+        self._columns = self._empty()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._sequence = itertools.count()
+        self._exit_apps = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_ENABLED', True)
+        app.config.setdefault('EVENTS_FOLDER', os.path.join(app.instance_path, 'events'))
+        app.config.setdefault('EVENTS_FLUSH_INTERVAL', 60)
+        app.config.setdefault('EVENTS_CHUNK_ROWS', 100_000)
+        self.enabled = app.config['EVENTS_ENABLED']
+        self.folder = app.config['EVENTS_FOLDER']
+        self.interval = app.config['EVENTS_FLUSH_INTERVAL']
+        self.chunk_rows = app.config['EVENTS_CHUNK_ROWS']
+        if not self._exit_apps:
+            atexit.register(self._flush_at_exit)
+        self._exit_apps.append(app)
+        app.extensions['engagement_log'] = self
+
+    @staticmethod
+    def _empty():
+        return {name: array.array('q') for name in COLUMNS}
+
+    def reset_after_fork(self):
+        # The parent flushes what it buffered; a child starts empty
+        self._columns = self._empty()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, kind, post_id=0, user_id=0):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            columns = self._columns
+            columns['ts'].append(int(time.time()))
+            columns['kind'].append(KINDS.index(kind))
+            columns['post_id'].append(post_id or 0)
+            columns['user_id'].append(user_id or 0)
+            due = now - self._last_flush >= self.interval or len(columns['ts']) >= self.chunk_rows
+            if due:
+                self._last_flush = now
+
+        if due:
+            app = current_app._get_current_object()
+
+            @after_this_request
+            def flush_after_response(response):
+                response.call_on_close(lambda: self._flush_in(app))
+                return response
+
+    def _flush_in(self, app):
+        with app.app_context():
+            self.flush()
+
+    def _flush_at_exit(self):
+        if len(self._columns['ts']) and self._exit_apps:
+            self._flush_in(self._exit_apps[-1])
+
+    def flush(self):
+        """Write buffered events to a new chunk file; returns its path, or None"""
+        with self._lock:
+            columns, self._columns = self._columns, self._empty()
+        if not len(columns['ts']):
+            return None
+        path = os.path.join(self.folder, f'{time.time_ns()}-{os.getpid()}-{next(self._sequence)}.chunk')
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            write_chunk(path, columns)
+        except OSError:
+            current_app.logger.warning('Writing engagement events failed; retrying on the next flush',
+                                       exc_info=True)
+            with self._lock:
+                for name in COLUMNS:
+                    columns[name].extend(self._columns[name])
+                self._columns = columns
+            return None
+        return path
@@ -0,0 +1,141 @@
+import os
+import zipfile
+from datetime import datetime
+from utils.serializers import dumps
+
+CHUNK_SIZE = 256 * 1024
+
+
+class _Sink:
+    """Write-only file object for ZipFile; what is written is drained by the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _tables(user_id):
+    """(archive name, select) pairs; rows are plain column tuples, not ORM objects.
+
+    Likes and notifications may be on other databases than users
+    (utils.sharding), so they are not joined with them: likes are gathered
+    from every shard, unordered, and senders are looked up per batch.
+    """
+    from sqlalchemy import select
+    from models import Comment, Follow, Like, Notification, Post, User
+
+    return [
+        ('posts.ndjson', select(Post.id, Post.content, Post.tags, Post.location, Post.image_filename,
+                                Post.video_filename, Post.likes_count, Post.comments_count,
+                                Post.views_count, Post.created_at, Post.updated_at)
+            .where(Post.user_id == user_id).order_by(Post.id)),
+        ('comments.ndjson', select(Comment.id, Comment.post_id, Comment.parent_id, Comment.content,
+                                   Comment.created_at, Comment.updated_at)
+            .where(Comment.user_id == user_id).order_by(Comment.id)),
+        ('likes.ndjson', select(Like.post_id, Like.created_at).where(Like.user_id == user_id)),
+        ('following.ndjson', select(User.username, Follow.created_at)
+            .join(Follow, Follow.followed_id == User.id)
+            .where(Follow.follower_id == user_id).order_by(Follow.id)),
+        ('followers.ndjson', select(User.username, Follow.created_at)
+            .join(Follow, Follow.follower_id == User.id)
+            .where(Follow.followed_id == user_id).order_by(Follow.id)),
+        ('notifications.ndjson', select(Notification.type, Notification.message,
+                                        Notification.sender_id.label('sender'), Notification.post_id,
+                                        Notification.comment_id, Notification.is_read,
+                                        Notification.created_at)
+            .where(Notification.recipient_id == user_id).order_by(Notification.id)),
+    ]
+
+
+def _with_senders(rows):
+    """Notification rows as dicts, the sender id replaced by the username"""
+    from app import db
+    from models import User
+
+    rows = [row._asdict() for row in rows]
+    ids = {row['sender'] for row in rows}
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(ids))) if ids else {}
+    for row in rows:
+        row['sender'] = names.get(row['sender'])
+    return rows
+
+
+def _media(user, user_id, upload_folder):
+    """(path on disk, archive name) for the account's uploads, read in batches"""
+    from sqlalchemy import select
+    from models import Post
+
+    for filename in (user.profile_picture, user.cover_photo):
+        if filename and filename != 'default-avatar.png':
+            yield os.path.join(upload_folder, 'profiles', filename), f'media/profiles/{filename}'
+    rows = select(Post.image_filename, Post.video_filename).where(
+        Post.user_id == user_id, (Post.image_filename.isnot(None)) | (Post.video_filename.isnot(None)))
+    for image, video in _execute(rows.order_by(Post.id)):
+        for filename in (image, video):
+            if filename:
+                yield os.path.join(upload_folder, 'posts', filename), f'media/posts/{filename}'
+
+
+def _execute(statement, batch_size=500):
+    from app import db
+    return db.session.execute(statement.execution_options(yield_per=batch_size))
+
+
+def stream_export(user, upload_folder, batch_size=500):
+    """Yield a zip of the user's profile, activity (as NDJSON) and uploads, chunk by chunk.
+
+    Rows are fetched ``batch_size`` at a time and written straight into the
+    archive; media files are copied in CHUNK_SIZE pieces and stored without
+    recompression. Whatever the account size, at most a batch of rows and a
+    chunk of output are held in memory. The zip is written with data
+    descriptors since the output cannot seek back to patch headers.
+    """
+    sink = _Sink()
+    for _ in _write_archive(sink, user, upload_folder, batch_size):
+        data = sink.drain()
+        if data:  # an empty chunk would end a chunked response
+            yield data
+
+
+def _write_archive(sink, user, upload_folder, batch_size):
+    """Write the archive into ``sink``, yielding whenever there is output to send"""
+    user_id = user.id
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        profile = {column: getattr(user, column) for column in (
+            'username', 'email', 'full_name', 'bio', 'location', 'website', 'is_private',
+            'created_at')}
+        profile['exported_at'] = datetime.utcnow()
+        archive.writestr('profile.json', dumps(profile))
+        yield
+
+        for name, statement in _tables(user_id):
+            with archive.open(name, 'w') as out:
+                for rows in _execute(statement, batch_size).partitions():
+                    rows = _with_senders(rows) if name == 'notifications.ndjson' else \
+                        [row._asdict() for row in rows]
+                    out.write(b''.join(dumps(row) + b'\n' for row in rows))
+                    yield
+            yield
+
+        for path, name in _media(user, user_id, upload_folder):
+            if not os.path.isfile(path):
+                continue
+            info = zipfile.ZipInfo.from_file(path, name)
+            info.compress_type = zipfile.ZIP_STORED  # images and video are already compressed
+            with open(path, 'rb') as source, archive.open(info, 'w') as out:
+                while chunk := source.read(CHUNK_SIZE):
+                    out.write(chunk)
+                    yield
+            yield
+    yield  # central directory
@@ -51,10 +51,9 @@ class FileHandler:
     def create_thumbnail(image_path, thumbnail_path, size=(300, 300)):
         """Create thumbnail for images"""
         try:
-            from PIL import Image
-            with Image.open(image_path) as img:
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, optimize=True, quality=85)
-                return True
+            from utils.images import render_sizes
+            thumbnail = render_sizes(image_path, {'': size}, current_app.config['IMAGE_MAX_PIXELS'])['']
+            thumbnail.save(thumbnail_path, optimize=True, quality=current_app.config['IMAGE_QUALITY'])
+            return True
         except Exception:
             return False
@@ -0,0 +1,160 @@
+import re
+import secrets
+from datetime import datetime
+from itertools import count
+from flask import current_app
+from flask_login import current_user
+from markupsafe import Markup, escape
+from utils.cache import LRUCache
+from utils.helpers import format_datetime
+
+
+class FragmentCache:
+    """Caches rendered post cards and comment threads.
+
+    Fragments are rendered once without any viewer context and stored as a
+    list of segments. Viewer-specific bits are left as markers in the cached
+    HTML and filled in by a cheap overlay on every render:
+
+    * ``fragment_slot(name)`` - a value supplied at overlay time (liked state, views)
+    * ``fragment_time(dt)`` - relative time ("5m ago"), computed at overlay time
+    * ``fragment_region(name)`` / ``fragment_end()`` - markup shown only to the
+      ``owner`` of the object, ``auth``-enticated viewers or ``anon``-ymous ones;
+      ``author:<user id>`` regions are skipped for viewers that user is hidden from
+
+    Keys include the row's ``updated_at`` and counters, so edits, likes and
+    comments produce new keys; write paths also call ``invalidate`` to bump a
+    per-object version (``'user'`` versions cover author names and avatars).
+    Versions live in the same LRU as the fragments: every render touches its
+    versions, so a version outlives the fragments it made stale and both are
+    evicted rather than kept for every object ever invalidated.
+    """
+
+    def __init__(self, app=None):
+        self.cache = None
+        self._counter = count(1)
+        self._nonce = secrets.token_hex(8)
+        self._marker = re.compile(r'<!--frag:%s:([^>]*)-->' % self._nonce)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 5000)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+        self.cache = LRUCache(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'])
+        app.jinja_env.globals.update(
+            render_post_card=self.render_post_card,
+            render_comment_thread=self.render_comment_thread,
+            fragment_slot=self.slot,
+            fragment_time=self.time,
+            fragment_region=self.region,
+            fragment_end=self.end,
+        )
+        app.extensions['fragment_cache'] = self
+
+    # Markers used inside cached templates
+
+    def _tag(self, value):
+        return Markup(f'<!--frag:{self._nonce}:{value}-->')
+
+    def slot(self, name):
+        return self._tag(f'slot:{name}')
+
+    def time(self, dt):
+        return self._tag(f'time:{dt.isoformat()}' if dt else 'slot:')
+
+    def region(self, name):
+        return self._tag(f'region:{name}')
+
+    def end(self):
+        return self._tag('end')
+
+    # Invalidation
+
+    def invalidate(self, kind, object_id):
+        """Drop cached fragments of a post, comment thread or user's content"""
+        self.cache.set(('version', kind, object_id), next(self._counter))
+
+    def _version(self, kind, object_id):
+        return self.cache.get(('version', kind, object_id), 0)
+
+    # Rendering
+
+    def render_post_card(self, post, liked_ids=None):
+        """``liked_ids``: the viewer's liked post ids for the page, when the view fetched them in one go"""
+        key = ('post', post.id, post.updated_at, post.likes_count, post.comments_count,
+               self._version('post', post.id), self._version('user', post.user_id))
+        segments = self._segments(key, 'post/components/post_card.html', post=post)
+        authenticated = current_user.is_authenticated
+        if liked_ids is not None:
+            liked = post.id in liked_ids
+        else:
+            liked = authenticated and post.is_liked_by(current_user)
+        slots = {
+            'liked': ' liked' if liked else '',
+            'views': str(post.views_count or 0),
+            'unique_views': str(post.unique_views_count or 0),
+            'viewer_avatar': str(escape(current_user.get_profile_picture_url())) if authenticated else '',
+        }
+        return self._overlay(segments, slots, owner=authenticated and current_user.id == post.user_id)
+
+    def render_comment_thread(self, comment, replies=None):
+        """``replies``: returns {parent id: replies} for the page; only called on a cache miss"""
+        key = ('comment', comment.id, comment.updated_at,
+               self._version('comment', comment.id), self._version('user', comment.user_id))
+        segments = self._segments(key, 'post/components/comment.html', comment=comment, replies=replies)
+        authenticated = current_user.is_authenticated
+        return self._overlay(segments, {}, owner=authenticated and current_user.id == comment.user_id)
+
+    def _segments(self, key, template_name, **context):
+        enabled = current_app.config['FRAGMENT_CACHE_ENABLED']
+        segments = self.cache.get(key) if enabled else None
+        if segments is None:
+            html = current_app.jinja_env.get_template(template_name).render(**context)
+            segments = self._compile(html)
+            if enabled:
+                self.cache.set(key, segments)
+        return segments
+
+    def _compile(self, html):
+        """Split rendered HTML into (kind, value) segments around the markers"""
+        parts = self._marker.split(html)
+        segments = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                if part:
+                    segments.append(('text', part))
+                continue
+            kind, _, value = part.partition(':')
+            if kind == 'time':
+                value = datetime.fromisoformat(value)
+            segments.append((kind, value))
+        return tuple(segments)
+
+    def _overlay(self, segments, slots, owner=False):
+        authenticated = current_user.is_authenticated
+        visible = {'owner': owner, 'auth': authenticated, 'anon': not authenticated}
+        out = []
+        hidden = 0
+        for kind, value in segments:
+            if kind == 'region':
+                if value not in visible and value.startswith('author:'):
+                    visible[value] = not authenticated or \
+                        int(value[len('author:'):]) not in current_user.hidden_user_ids()
+                if hidden or not visible.get(value, False):
+                    hidden += 1
+                continue
+            if kind == 'end':
+                if hidden:
+                    hidden -= 1
+                continue
+            if hidden:
+                continue
+            if kind == 'text':
+                out.append(value)
+            elif kind == 'time':
+                out.append(format_datetime(value))
+            else:
+                out.append(slots.get(value, ''))
+        return Markup(''.join(out))
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing queue is full')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    PBKDF2/scrypt are pure CPU; running them in request threads holds the GIL
+    and a worker for hundreds of milliseconds. Here requests wait (without
+    the GIL) for a pool slot; at most PASSWORD_HASH_QUEUE_SIZE jobs may be
+    queued or running, beyond that HashingBusy is raised after
+    PASSWORD_HASH_QUEUE_TIMEOUT seconds. With PASSWORD_HASH_WORKERS = 0
+    hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256:600000'
+        self.salt_length = 16
+        self.workers = 0
+        self.queue_timeout = 0.5
+        self._slots = None
+        self._queue_size = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', self.method)
+        app.config.setdefault('PASSWORD_HASH_SALT_LENGTH', self.salt_length)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', None)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_TIMEOUT', self.queue_timeout)
+        self.configure(
+            method=app.config['PASSWORD_HASH_METHOD'],
+            salt_length=app.config['PASSWORD_HASH_SALT_LENGTH'],
+            workers=app.config['PASSWORD_HASH_WORKERS'],
+            queue_size=app.config['PASSWORD_HASH_QUEUE_SIZE'],
+            queue_timeout=app.config['PASSWORD_HASH_QUEUE_TIMEOUT'],
+        )
+        app.extensions['password_hasher'] = self
+
+    def configure(self, method=None, salt_length=None, workers=None, queue_size=None, queue_timeout=None):
+        self.shutdown()
+        if method is not None:
+            self.method = method
+            self._method_prefix = None
+        if salt_length is not None:
+            self.salt_length = salt_length
+        if workers is not None:
+            self.workers = workers
+        if queue_timeout is not None:
+            self.queue_timeout = queue_timeout
+        self._queue_size = queue_size or self.workers * 4
+        self._slots = threading.BoundedSemaphore(self._queue_size) if self.workers else None
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def reset_after_fork(self):
+        """Forget the parent's pool and locks in a forked child; a new pool starts on first use"""
+        self._lock = threading.Lock()
+        self._executor = None
+        if self._slots is not None:
+            self._slots = threading.BoundedSemaphore(self._queue_size)
+
+    def _get_executor(self):
+        # Created on first use so that forked app workers each get their own pool
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash uses a different algorithm or cost than PASSWORD_HASH_METHOD"""
+        if self._method_prefix is None:
+            # Let Werkzeug expand defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1'
+            self._method_prefix = generate_password_hash('', self.method, 1).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
@@ -1,15 +1,21 @@
 import os
+import re
 import secrets
-from PIL import Image
 from flask import current_app
 from werkzeug.utils import secure_filename
+from utils.images import ImageTooLarge
+
+# Shared by extract_* and utils.content. The lookbehinds skip e-mail addresses
+# and character references such as '&#39;'.
+MENTION_RE = re.compile(r'(?<![\w@])@(\w+)')
+HASHTAG_RE = re.compile(r'(?<![\w&#])#(\w+)')
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 def save_picture(form_picture, folder, prefix, is_video=False):
-    """Save uploaded file and return filename"""
+    """Save uploaded file and return filename; raises ImageTooLarge for images over IMAGE_MAX_PIXELS"""
     try:
         random_hex = secrets.token_hex(8)
         _, f_ext = os.path.splitext(form_picture.filename)
@@ -24,23 +30,18 @@ def save_picture(form_picture, folder, prefix, is_video=False):
             # For videos, save directly without processing
             form_picture.save(picture_path)
         else:
-            # For images, resize and optimize
-            img = Image.open(form_picture)
-            
-            # Convert RGBA to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Resize image if too large
-            max_size = (1200, 1200)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Save with optimization
-            img.save(picture_path, optimize=True, quality=85)
+            # For images, decode once near the target size and write every configured
+            # size; Pillow is only imported on upload
+            from utils.images import render_sizes, save_variants
+            config = current_app.config
+            variants = render_sizes(form_picture, config['IMAGE_SIZES'][folder], config['IMAGE_MAX_PIXELS'])
+            save_variants(variants, upload_path, picture_fn, quality=config['IMAGE_QUALITY'])
         
         return picture_fn
-    except Exception as e:
-        print(f"Error saving file: {e}")
+    except ImageTooLarge:
+        raise
+    except Exception:
+        current_app.logger.exception('Error saving file %s', form_picture.filename)
         return None
 
 def format_datetime(dt):
@@ -70,14 +71,12 @@ def truncate_text(text, length=100):
 
 def extract_mentions(text):
     """Extract @mentions from text"""
-    import re
-    mentions = re.findall(r'@(\w+)', text)
+    mentions = MENTION_RE.findall(text)
     return list(set(mentions))  # Remove duplicates
 
 def extract_hashtags(text):
     """Extract #hashtags from text"""
-    import re
-    hashtags = re.findall(r'#(\w+)', text)
+    hashtags = HASHTAG_RE.findall(text)
     return list(set(hashtags))  # Remove duplicates
 
 def format_number(num):
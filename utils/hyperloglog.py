@@ -0,0 +1,72 @@
+import hashlib
+import math
+import struct
+
+DEFAULT_PRECISION = 12  # 4096 registers: ~1.6% standard error, at most 4 KB stored
+
+_DENSE = 0
+_SPARSE = 1
+
+
+class HyperLogLog:
+    """Approximate distinct counter in ``2 ** precision`` one-byte registers.
+
+    Each item hashes to a register and a run of leading zero bits; the
+    register keeps the longest run seen. Sketches of the same precision merge
+    by taking register-wise maxima, so per-worker sketches can be combined
+    with the stored one without double counting repeat viewers.
+    """
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, item):
+        if isinstance(item, str):
+            item = item.encode()
+        value = int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'big')
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """Sparse (index, rank) pairs while few registers are set, dense bytes after"""
+        used = [(i, r) for i, r in enumerate(self.registers) if r]
+        if len(used) * 3 < len(self.registers):
+            pairs = b''.join(struct.pack('>HB', i, r) for i, r in used)
+            return bytes((_SPARSE, self.precision)) + pairs
+        return bytes((_DENSE, self.precision)) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        kind, precision = data[0], data[1]
+        if kind == _DENSE:
+            return cls(precision, bytearray(data[2:]))
+        sketch = cls(precision)
+        for i, r in struct.iter_unpack('>HB', data[2:]):
+            sketch.registers[i] = r
+        return sketch
+
+    def __len__(self):
+        return self.count()
@@ -0,0 +1,67 @@
+import os
+
+# EXIF orientations that swap width and height
+_ROTATED = {5, 6, 7, 8}
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImageTooLarge(ValueError):
+    """The image's pixel count is over the configured limit"""
+
+
+def variant_filename(filename, name):
+    """'post_1_ab.jpg', 'thumb' -> 'post_1_ab_thumb.jpg'; the '' variant is the file itself"""
+    if not name:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}_{name}{ext}'
+
+
+def render_sizes(source, sizes, max_pixels):
+    """Decode an image once and scale it to every box in ``sizes``.
+
+    ``sizes`` maps variant names to (width, height) boxes. The pixel count
+    is checked from the header before anything is decoded; JPEGs are then
+    decoded with DCT scaling (``draft``) straight to the smallest scale that
+    still covers the largest box, so a 48MP photo never exists in memory at
+    full size. EXIF orientation is applied and each smaller size is scaled
+    down from the previous one. Returns ``{name: PIL.Image}`` in RGB.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        width, height = img.size
+        if width * height > max_pixels:
+            raise ImageTooLarge(f'{width}x{height} is over the {max_pixels} pixel limit')
+
+        largest = max(sizes.values(), key=lambda box: box[0] * box[1])
+        if img.format == 'JPEG':
+            rotated = img.getexif().get(_EXIF_ORIENTATION) in _ROTATED
+            img.draft('RGB', (largest[1], largest[0]) if rotated else largest)
+
+        image = ImageOps.exif_transpose(img)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+    variants = {}
+    for name, box in sorted(sizes.items(), key=lambda item: -item[1][0] * item[1][1]):
+        image = image.copy() if image.width <= box[0] and image.height <= box[1] else \
+            image.resize(_fit(image.size, box), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        variants[name] = image
+    return variants
+
+
+def _fit(size, box):
+    width, height = size
+    scale = min(box[0] / width, box[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def save_variants(variants, directory, filename, quality=85):
+    """Write each variant next to ``filename``; returns the written filenames"""
+    written = []
+    for name, image in variants.items():
+        path = os.path.join(directory, variant_filename(filename, name))
+        image.save(path, optimize=True, quality=quality)
+        written.append(os.path.basename(path))
+    return written
@@ -0,0 +1,347 @@
+import json
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from utils.metrics import CounterMetric, GaugeMetric, Histogram, LATENCY_BUCKETS
+
+JOB_LATENCY_BUCKETS = LATENCY_BUCKETS + (30.0, 60.0, 300.0, 900.0, 3600.0)
+
+Task = namedtuple('Task', 'func max_attempts')
+Periodic = namedtuple('Periodic', 'name every')
+ClaimedJob = namedtuple('ClaimedJob', 'id name payload attempts max_attempts run_at token')
+
+
+class JobQueue:
+    """Durable background jobs stored in the app's own database.
+
+    Tasks are plain functions registered with ``@jobs.task()`` and queued
+    with ``jobs.enqueue(name, **kwargs)``; the job row is added to the
+    current session, so it is committed (or rolled back) with the request's
+    own changes. ``flask worker`` claims due jobs under a lease, runs them on
+    a thread pool and retries failures with exponential backoff. A worker
+    that dies loses its lease and the job is claimed again once it expires.
+
+    ``@jobs.periodic(seconds)`` runs a task on a schedule; each run is
+    enqueued once across all workers through the job's unique key.
+    """
+
+    def __init__(self, app=None):
+        self.tasks = {}
+        self.schedule = []
+        self._periodic_slots = {}  # last slot this process enqueued, per periodic task
+        self.wait_time = Histogram('job_wait_seconds', 'Time from run_at until a worker started the job',
+                                   JOB_LATENCY_BUCKETS)
+        self.run_time = Histogram('job_duration_seconds', 'Job run time', JOB_LATENCY_BUCKETS)
+        self.jobs_total = CounterMetric('jobs_total', 'Jobs run, by outcome')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_RUN_INLINE', False)
+        app.config.setdefault('JOBS_WORKER_THREADS', 4)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOBS_LEASE_SECONDS', 300)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_BACKOFF_BASE', 10)
+        app.config.setdefault('JOBS_BACKOFF_MAX', 3600)
+        app.config.setdefault('JOBS_RETENTION_DAYS', 7)
+        metrics = app.extensions.get('metrics')
+        if metrics is not None and self.collect_metrics not in metrics.collectors:
+            metrics.add_collector(self.collect_metrics)
+        app.extensions['jobs'] = self
+
+    # Registration
+
+    def task(self, name=None, max_attempts=None):
+        """Register a function as a task; its keyword arguments must be JSON-serializable"""
+        def decorator(f):
+            self.tasks[name or f.__name__] = Task(f, max_attempts)
+            return f
+        return decorator
+
+    def periodic(self, every, name=None, max_attempts=1):
+        """Register a task that runs every ``every`` seconds"""
+        def decorator(f):
+            task_name = name or f.__name__
+            self.task(task_name, max_attempts)(f)
+            self.schedule.append(Periodic(task_name, every))
+            return f
+        return decorator
+
+    # Producing
+
+    def enqueue(self, name, delay=None, run_at=None, **kwargs):
+        """Queue ``name(**kwargs)``; the row is committed with the current session"""
+        from app import db
+        from models.job import Job
+
+        task = self.tasks[name]
+        if current_app.config['JOBS_RUN_INLINE']:
+            # Development and tests: run now, inside the caller's transaction
+            try:
+                task.func(**json.loads(json.dumps(kwargs)))
+            except Exception:
+                current_app.logger.exception('Inline job %s failed', name)
+            return None
+        if run_at is None:
+            run_at = datetime.utcnow() + timedelta(seconds=delay or 0)
+        job = Job(name=name, payload=json.dumps(kwargs), run_at=run_at,
+                  max_attempts=task.max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'])
+        db.session.add(job)
+        return job
+
+    def enqueue_periodic(self, now=None):
+        """Enqueue the periodic runs that are due; safe to call from every worker"""
+        from app import db
+        from models.job import Job
+
+        now = time.time() if now is None else now
+        enqueued = 0
+        for periodic in self.schedule:
+            slot = int(now // periodic.every)
+            if self._periodic_slots.get(periodic.name) == slot:
+                continue
+            self._periodic_slots[periodic.name] = slot
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(Job.__table__.insert().values(
+                        name=periodic.name, payload='{}', status='queued', attempts=0,
+                        max_attempts=self.tasks[periodic.name].max_attempts or 1,
+                        unique_key=f'{periodic.name}:{slot}',
+                        run_at=datetime.utcfromtimestamp(slot * periodic.every),
+                        created_at=datetime.utcnow()))
+                enqueued += 1
+            except IntegrityError:
+                pass  # another worker got there first
+        return enqueued
+
+    # Consuming
+
+    def claim(self, token, limit):
+        """Lease up to ``limit`` due jobs (or jobs whose lease expired) to ``token``"""
+        from app import db
+        from models.job import Job
+
+        jobs = Job.__table__
+        now = datetime.utcnow()
+        claimable = or_(and_(jobs.c.status == 'queued', jobs.c.run_at <= now),
+                        and_(jobs.c.status == 'running', jobs.c.locked_until < now))
+        lease = timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+        claimed = []
+        with db.engine.begin() as connection:
+            candidates = connection.execute(
+                select(jobs.c.id, jobs.c.name, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts,
+                       jobs.c.run_at)
+                .where(claimable).order_by(jobs.c.run_at, jobs.c.id).limit(limit)).all()
+            for row in candidates:
+                # The condition is checked again, so two workers can't both win a job
+                result = connection.execute(
+                    update(jobs).where(jobs.c.id == row.id, claimable)
+                    .values(status='running', locked_by=token, locked_until=now + lease,
+                            attempts=jobs.c.attempts + 1, started_at=now))
+                if result.rowcount == 1:
+                    claimed.append(ClaimedJob(row.id, row.name, json.loads(row.payload),
+                                              row.attempts + 1, row.max_attempts, row.run_at, token))
+        return claimed
+
+    def renew(self, tokens):
+        """Extend the leases of jobs still running under ``tokens``"""
+        from app import db
+        from models.job import Job
+
+        if not tokens:
+            return
+        jobs = Job.__table__
+        until = datetime.utcnow() + timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+        with db.engine.begin() as connection:
+            connection.execute(update(jobs).where(jobs.c.locked_by.in_(list(tokens)),
+                                                  jobs.c.status == 'running')
+                               .values(locked_until=until))
+
+    def run(self, job):
+        """Run a claimed job and record the outcome; call inside an app context"""
+        started = time.monotonic()
+        labels = (('name', job.name),)
+        self.wait_time.observe(labels, max(0.0, (datetime.utcnow() - job.run_at).total_seconds()))
+        task = self.tasks.get(job.name)
+        try:
+            if task is None:
+                raise LookupError(f'No task registered as {job.name!r}')
+            if job.attempts > job.max_attempts:
+                raise RuntimeError(f'Lease expired while running; gave up after {job.max_attempts} attempts')
+            self._call(task, job.payload)
+        except Exception:
+            error = traceback.format_exc(limit=20)
+            retry = task is not None and job.attempts < job.max_attempts
+            if retry:
+                self._finish(job, 'queued', error, retry_in=self._backoff(job.attempts))
+            else:
+                self._finish(job, 'failed', error)
+            self.jobs_total.inc(labels + (('outcome', 'retried' if retry else 'failed'),))
+            current_app.logger.warning('Job %s (%s) failed on attempt %s/%s', job.id, job.name,
+                                       job.attempts, job.max_attempts, exc_info=True)
+        else:
+            self._finish(job, 'done')
+            self.jobs_total.inc(labels + (('outcome', 'done'),))
+        self.run_time.observe(labels, time.monotonic() - started)
+
+    def _call(self, task, kwargs):
+        from app import db
+        try:
+            task.func(**kwargs)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _backoff(self, attempts):
+        config = current_app.config
+        delay = min(config['JOBS_BACKOFF_MAX'], config['JOBS_BACKOFF_BASE'] * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    def _finish(self, job, status, error=None, retry_in=None):
+        from app import db
+        from models.job import Job
+
+        jobs = Job.__table__
+        now = datetime.utcnow()
+        values = {'status': status, 'locked_by': None, 'locked_until': None, 'last_error': error}
+        if retry_in is not None:
+            values['run_at'] = now + retry_in
+        else:
+            values['finished_at'] = now
+        with db.engine.begin() as connection:
+            # A job whose lease was taken over by another worker is left to that worker
+            connection.execute(update(jobs).where(jobs.c.id == job.id, jobs.c.locked_by == job.token)
+                               .values(**values))
+
+    # Monitoring
+
+    def collect_metrics(self):
+        """Queue depth and age of the oldest due job, read from the database on scrape"""
+        from app import db
+        from models.job import Job
+
+        depth = GaugeMetric('job_queue_depth', 'Jobs by status')
+        for status in Job.STATUSES:
+            depth.set((('status', status),), 0)
+        for status, count in db.session.query(Job.status, func.count(Job.id)).group_by(Job.status):
+            depth.set((('status', status),), count)
+        oldest = db.session.query(func.min(Job.run_at))\
+                           .filter(Job.status == 'queued', Job.run_at <= datetime.utcnow()).scalar()
+        lag = GaugeMetric('job_queue_lag_seconds', 'Age of the oldest due job still waiting')
+        lag.set((), (datetime.utcnow() - oldest).total_seconds() if oldest else 0)
+        lines = depth.expose() + lag.expose()
+        for metric in (self.wait_time, self.run_time, self.jobs_total):
+            lines.extend(metric.expose())
+        return lines
+
+
+class Worker:
+    """Claims jobs and runs them on a thread pool until stopped"""
+
+    def __init__(self, app, queue, threads=None, poll_interval=None):
+        self.app = app
+        self.queue = queue
+        self.threads = threads or app.config['JOBS_WORKER_THREADS']
+        self.poll_interval = poll_interval or app.config['JOBS_POLL_INTERVAL']
+        self.stopping = threading.Event()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Work until stopped; with ``once``, until no job is due"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        running = {}  # future -> token
+        renew_every = self.app.config['JOBS_LEASE_SECONDS'] / 3
+        last_renewal = time.monotonic()
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='job') as executor:
+            while not self.stopping.is_set():
+                with self.app.app_context():
+                    self.queue.enqueue_periodic()
+                    if time.monotonic() - last_renewal >= renew_every:
+                        self.queue.renew(set(running.values()))
+                        last_renewal = time.monotonic()
+                    free = self.threads - len(running)
+                    claimed = self.queue.claim(uuid.uuid4().hex, free) if free else []
+                for job in claimed:
+                    running[executor.submit(self._execute, job)] = job.token
+                if once and not running and not claimed:
+                    break
+                if running:
+                    done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+                elif not claimed:
+                    self.stopping.wait(self.poll_interval)
+        # Leaving the with block waits for running jobs to finish
+
+    def _execute(self, job):
+        with self.app.app_context():
+            self.queue.run(job)
+
+    def serve_metrics(self, port):
+        """Expose the worker's job metrics on ``port`` from a daemon thread"""
+        from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+        def metrics_app(environ, start_response):
+            with self.app.app_context():
+                body = ('\n'.join(self.queue.collect_metrics()) + '\n').encode()
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = make_server('', port, metrics_app, handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def run_workers(app, queue, processes=1, threads=None, once=False, metrics_port=None):
+    """Run ``processes`` forked worker processes (or one in-process worker)"""
+    if processes <= 1:
+        worker = Worker(app, queue, threads)
+        if metrics_port:
+            worker.serve_metrics(metrics_port)
+        worker.run(once=once)
+        return
+
+    if not hasattr(os, 'fork'):
+        raise RuntimeError('--processes needs os.fork; run one worker per process instead')
+    children = []
+    for i in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker = Worker(app, queue, threads)
+                if metrics_port:
+                    worker.serve_metrics(metrics_port + i)
+                worker.run(once=once)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def forward(signum, frame):
+        for pid in children:
+            os.kill(pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for pid in children:
+        os.waitpid(pid, 0)
@@ -0,0 +1,195 @@
+import random
+import smtplib
+import ssl
+import threading
+import time
+
+
+class MailUnavailable(Exception):
+    """Raised when the SMTP server stays unreachable after MAIL_RETRIES attempts.
+
+    ``position`` is the index of the message that could not be sent; every
+    message before it was sent or refused for good.
+    """
+
+    def __init__(self, position, error):
+        super().__init__(f'SMTP server unavailable: {error}')
+        self.position = position
+
+
+def _permanent(error):
+    """True for 5xx replies: sending the message again will not help"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _quit(connection):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
+
+
+class Mailer:
+    """Sends mail over a small pool of persistent SMTP connections.
+
+    Connecting costs several round trips (TCP, EHLO, STARTTLS, AUTH), so
+    ``send_many(messages)`` sends a whole batch over one connection and
+    returns it to the pool for the next batch. At most MAIL_MAX_CONNECTIONS
+    are open per process; a connection is replaced after
+    MAIL_MAX_MESSAGES_PER_CONNECTION messages or MAIL_IDLE_TIMEOUT idle
+    seconds. Dropped connections and 4xx replies are retried with
+    exponential backoff, reconnecting first; a 5xx reply fails only that
+    message. Without MAIL_SERVER nothing is sent.
+    """
+
+    def __init__(self, app=None):
+        self.server = None
+        self.max_connections = 2
+        self._idle = []  # (connection, messages sent on it, monotonic time it was returned)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_SERVER', None)
+        app.config.setdefault('MAIL_PORT', 587)
+        app.config.setdefault('MAIL_USE_TLS', True)
+        app.config.setdefault('MAIL_USE_SSL', False)
+        app.config.setdefault('MAIL_USERNAME', None)
+        app.config.setdefault('MAIL_PASSWORD', None)
+        app.config.setdefault('MAIL_DEFAULT_SENDER', 'noreply@localhost')
+        app.config.setdefault('MAIL_TIMEOUT', 10)
+        app.config.setdefault('MAIL_MAX_CONNECTIONS', 2)
+        app.config.setdefault('MAIL_MAX_MESSAGES_PER_CONNECTION', 100)
+        app.config.setdefault('MAIL_IDLE_TIMEOUT', 60)
+        app.config.setdefault('MAIL_RETRIES', 3)
+        app.config.setdefault('MAIL_BACKOFF_BASE', 1.0)
+        app.config.setdefault('MAIL_BACKOFF_MAX', 30)
+        config = app.config
+        self.close()
+        self.server = config['MAIL_SERVER']
+        self.port = config['MAIL_PORT']
+        self.use_tls = config['MAIL_USE_TLS']
+        self.use_ssl = config['MAIL_USE_SSL']
+        self.username = config['MAIL_USERNAME']
+        self.password = config['MAIL_PASSWORD']
+        self.default_sender = config['MAIL_DEFAULT_SENDER']
+        self.timeout = config['MAIL_TIMEOUT']
+        self.max_connections = config['MAIL_MAX_CONNECTIONS']
+        self.max_messages = config['MAIL_MAX_MESSAGES_PER_CONNECTION']
+        self.idle_timeout = config['MAIL_IDLE_TIMEOUT']
+        self.retries = config['MAIL_RETRIES']
+        self.backoff_base = config['MAIL_BACKOFF_BASE']
+        self.backoff_max = config['MAIL_BACKOFF_MAX']
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        app.extensions['mailer'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.server)
+
+    def reset_after_fork(self):
+        # The parent's sockets are not ours to use or QUIT; a child starts with an empty pool
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+
+    def close(self):
+        """QUIT every pooled connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _, _ in idle:
+            _quit(connection)
+
+    def _connect(self):
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout,
+                                          context=ssl.create_default_context())
+        else:
+            connection = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+            if self.use_tls:
+                connection.starttls(context=ssl.create_default_context())
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _checkout(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, sent, returned = self._idle.pop()
+            if now - returned < self.idle_timeout:
+                try:
+                    connection.noop()
+                    return connection, sent
+                except (smtplib.SMTPException, OSError):
+                    pass
+            _quit(connection)
+        return self._connect(), 0
+
+    def _checkin(self, connection, sent):
+        if sent >= self.max_messages:
+            _quit(connection)
+            return
+        with self._lock:
+            self._idle.append((connection, sent, time.monotonic()))
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def send_many(self, messages):
+        """Send EmailMessages over one pooled connection; returns those refused with a 5xx reply.
+
+        Raises MailUnavailable when the server cannot be reached, or keeps
+        answering 4xx, after MAIL_RETRIES retries.
+        """
+        refused = []
+        if not messages:
+            return refused
+        with self._slots:
+            connection, sent = None, 0
+            try:
+                for position, message in enumerate(messages):
+                    if message['From'] is None:
+                        message['From'] = self.default_sender
+                    attempt = 0
+                    while True:
+                        try:
+                            if connection is None:
+                                connection, sent = self._checkout()
+                            elif sent >= self.max_messages:
+                                _quit(connection)
+                                connection, sent = None, 0
+                                connection = self._connect()
+                            connection.send_message(message)
+                            sent += 1
+                            break
+                        except (smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError):
+                            raise  # misconfigured; no message would get through
+                        except (smtplib.SMTPException, OSError) as e:
+                            if _permanent(e):
+                                refused.append(message)
+                                break
+                            # Dropped connection or 4xx: start over on a fresh connection
+                            if connection is not None:
+                                connection.close()
+                                connection = None
+                            if attempt >= self.retries:
+                                raise MailUnavailable(position, e) from e
+                            self._backoff(attempt)
+                            attempt += 1
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                raise
+            finally:
+                if connection is not None:
+                    self._checkin(connection, sent)
+        return refused
@@ -0,0 +1,323 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, abort, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative histogram with Prometheus-style buckets, one series per label set"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted(self._series.items())
+            for labels, (counts, total, count) in items:
+                label_str = _format_labels(labels)
+                sep = ',' if label_str else ''
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label_str}{sep}le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label_str}{sep}le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label_str}}} {total}')
+                lines.append(f'{self.name}_count{{{label_str}}} {count}')
+        return lines
+
+
+class CounterMetric:
+    """Monotonic counter, one series per label set"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._series.items()):
+                lines.append(f'{self.name}{{{_format_labels(labels)}}} {value}')
+        return lines
+
+
+class GaugeMetric(CounterMetric):
+    """Point-in-time value, one series per label set"""
+
+    def set(self, labels, value):
+        with self._lock:
+            self._series[labels] = value
+
+    def expose(self):
+        lines = super().expose()
+        lines[1] = f'# TYPE {self.name} gauge'
+        return lines
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class RequestStats:
+    """Counters collected for the request being served"""
+
+    __slots__ = ('start', 'queries', 'db_time', 'render_time', 'render_starts')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_starts = []
+
+
+def current_stats():
+    """Return the RequestStats of the active request, or None"""
+    if has_request_context():
+        return g.get('_request_stats')
+    return None
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered request threads from a background thread.
+
+    Stacks are aggregated in the folded format understood by flamegraph.pl and
+    speedscope, one ``frame;frame;frame count`` line per distinct stack.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_fold_stack(frame)] += 1
+
+    @staticmethod
+    def dump(samples, path):
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _fold_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Metrics:
+    """Per-endpoint query count, DB time, template render time and latency.
+
+    SQL statements are timed through SQLAlchemy engine events, templates
+    through Flask's render signals; histograms are served in the Prometheus
+    text format on ``METRICS_ENDPOINT`` to clients in METRICS_ALLOWED_IPS or
+    sending ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+
+    def __init__(self, app=None):
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', 'Total request latency', LATENCY_BUCKETS)
+        self.db_time = Histogram(
+            'db_query_duration_seconds', 'Time spent in SQL per request', LATENCY_BUCKETS)
+        self.query_count = Histogram(
+            'db_queries_per_request', 'SQL statements executed per request', QUERY_COUNT_BUCKETS)
+        self.render_time = Histogram(
+            'template_render_duration_seconds', 'Template render time per request', LATENCY_BUCKETS)
+        self.requests_total = CounterMetric('http_requests_total', 'Requests served')
+        self.collectors = []
+        self.profiler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_ENDPOINT', '/metrics')
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+        app.config.setdefault('METRICS_SERVER_TIMING', False)
+        app.config.setdefault('PROFILER_ENABLED', False)
+        app.config.setdefault('PROFILER_SLOW_MS', 500)
+        app.config.setdefault('PROFILER_INTERVAL', 0.005)
+        app.config.setdefault('PROFILER_OUTPUT_DIR', os.path.join(app.instance_path, 'profiles'))
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+
+        if app.config['PROFILER_ENABLED']:
+            self.profiler = SamplingProfiler(app.config['PROFILER_INTERVAL'])
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(app.config['METRICS_ENDPOINT'], 'metrics', self.export)
+        app.extensions['metrics'] = self
+
+    def add_collector(self, collector):
+        """Register a callable returning extra exposition lines on scrape"""
+        self.collectors.append(collector)
+
+    def _before_request(self):
+        g._request_stats = RequestStats()
+        if self.profiler is not None:
+            g._profile_samples = self.profiler.start(threading.get_ident())
+
+    def _after_request(self, response):
+        stats = g.get('_request_stats')
+        if stats is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        if endpoint in ('static', 'metrics'):
+            return response
+
+        elapsed = time.perf_counter() - stats.start
+        labels = (('endpoint', endpoint),)
+        self.request_latency.observe(labels, elapsed)
+        self.db_time.observe(labels, stats.db_time)
+        self.query_count.observe(labels, stats.queries)
+        self.render_time.observe(labels, stats.render_time)
+        self.requests_total.inc(labels + (('status', str(response.status_code)),))
+
+        if _current_config('METRICS_SERVER_TIMING'):
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'render;dur={stats.render_time * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+            )
+        return response
+
+    def _teardown_request(self, exc):
+        # Runs even when the view or an after_request hook raised, so the profiler always stops
+        stats = g.pop('_request_stats', None)
+        samples = self._stop_profiler()
+        endpoint = request.endpoint or 'unknown'
+        if samples and stats is not None and endpoint not in ('static', 'metrics'):
+            if (time.perf_counter() - stats.start) * 1000 >= _current_config('PROFILER_SLOW_MS'):
+                self._dump_profile(endpoint, samples)
+
+    def _stop_profiler(self):
+        if self.profiler is None:
+            return None
+        g.pop('_profile_samples', None)
+        return self.profiler.stop(threading.get_ident())
+
+    def _dump_profile(self, endpoint, samples):
+        output_dir = _current_config('PROFILER_OUTPUT_DIR')
+        os.makedirs(output_dir, exist_ok=True)
+        filename = f"{int(time.time() * 1000)}_{endpoint.replace('.', '_')}.folded"
+        SamplingProfiler.dump(samples, os.path.join(output_dir, filename))
+
+    def export(self):
+        if not _scrape_allowed():
+            abort(403)
+        lines = []
+        for metric in (self.request_latency, self.db_time, self.query_count,
+                       self.render_time, self.requests_total):
+            lines.extend(metric.expose())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def _scrape_allowed():
+    token = _current_config('METRICS_TOKEN')
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    return request.remote_addr in _current_config('METRICS_ALLOWED_IPS')
+
+
+def _current_config(key):
+    from flask import current_app
+    return current_app.config[key]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def _before_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats.render_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.render_starts:
+        stats.render_time += time.perf_counter() - stats.render_starts.pop()
@@ -0,0 +1,209 @@
+import hashlib
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'\w+')
+_PRIME = (1 << 61) - 1
+
+BANDS, ROWS = 10, 3
+NUM_PERM = BANDS * ROWS
+
+
+def _permutations():
+    # Signatures are stored, so these must never change: derived from fixed labels
+    for i in range(NUM_PERM):
+        seed = hashlib.blake2b(f'minhash-{i}'.encode(), digest_size=16).digest()
+        yield (int.from_bytes(seed[:8], 'little') % (_PRIME - 1) + 1,
+               int.from_bytes(seed[8:], 'little') % _PRIME)
+
+
+_PERMUTATIONS = list(_permutations())
+_SIGNATURE = struct.Struct(f'<{NUM_PERM}I')
+
+
+def signature(text, min_tokens=8, max_tokens=256):
+    """MinHash signature of the words in ``text`` (NUM_PERM x uint32, as bytes).
+
+    The share of equal values between two signatures estimates the Jaccard
+    similarity of the two texts' word sets, so copies with a changed link or
+    a few added words still match. None when the text has fewer than
+    ``min_tokens`` distinct words; short posts look alike by chance.
+    """
+    words = list(dict.fromkeys(_WORD.findall(_TAG.sub(' ', text).lower())))[:max_tokens]
+    if len(words) < min_tokens:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+              for word in words]
+    return _SIGNATURE.pack(*(min((a * x + b) % _PRIME for x in hashes) & 0xffffffff
+                             for a, b in _PERMUTATIONS))
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(_SIGNATURE.unpack(a), _SIGNATURE.unpack(b))) / NUM_PERM
+
+
+class MinHashIndex:
+    """Signatures of recent posts, bucketed by LSH bands for lookups without a scan.
+
+    A signature is cut into BANDS bands of ROWS values; posts that agree on
+    a whole band are candidates (for a similarity of 0.6, ~90% of pairs share
+    one) and are then checked against ``threshold``. Holds at most
+    ``maxsize`` posts, about 1 KB each, dropping the oldest first.
+    """
+
+    def __init__(self, threshold=0.6, maxsize=20_000):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._buckets = {}  # band key -> post_id, or a list of them when several share it
+        self._entries = OrderedDict()  # post_id -> (signature, created timestamp), oldest first
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _keys(value):
+        values = _SIGNATURE.unpack(value)
+        return [hash((band,) + values[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def add(self, post_id, value, created):
+        if post_id in self._entries:
+            return
+        self._entries[post_id] = (value, created)
+        for key in self._keys(value):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = post_id
+            elif isinstance(bucket, list):
+                bucket.append(post_id)
+            else:
+                self._buckets[key] = [bucket, post_id]
+        while len(self._entries) > self.maxsize:
+            self.discard(next(iter(self._entries)))
+
+    def discard(self, post_id):
+        entry = self._entries.pop(post_id, None)
+        if entry is None:
+            return
+        for key in self._keys(entry[0]):
+            bucket = self._buckets.get(key)
+            if bucket == post_id:
+                del self._buckets[key]
+            elif isinstance(bucket, list) and post_id in bucket:
+                bucket.remove(post_id)
+                if len(bucket) == 1:
+                    self._buckets[key] = bucket[0]
+
+    def expire(self, before):
+        """Drop entries created before the ``before`` timestamp"""
+        while self._entries:
+            post_id, (_, created) = next(iter(self._entries.items()))
+            if created >= before:
+                break
+            self.discard(post_id)
+
+    def matches(self, value):
+        """Ids of indexed posts at least ``threshold`` similar to ``value``, oldest first"""
+        candidates = set()
+        for key in self._keys(value):
+            bucket = self._buckets.get(key)
+            if isinstance(bucket, list):
+                candidates.update(bucket)
+            elif bucket is not None:
+                candidates.add(bucket)
+        return sorted(post_id for post_id in candidates
+                      if similarity(self._entries[post_id][0], value) >= self.threshold)
+
+
+class NearDuplicates:
+    """Spots posts that are near-copies of other recent posts.
+
+    Each process keeps a MinHashIndex of the last DUPLICATE_WINDOW seconds of
+    posts. Signatures are stored in ``Post.content_minhash``, so the index
+    is rebuilt from the database on first use and picks up posts made by
+    other processes with one primary-key range query per check.
+    ``check(text)`` returns the new post's signature and the ids of the
+    recent posts it nearly copies; what to do about them is up to the caller
+    (DUPLICATE_ACTION).
+    """
+
+    def __init__(self, app=None):
+        self.index = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DUPLICATE_ACTION', 'flag')
+        app.config.setdefault('DUPLICATE_SIMILARITY', 0.6)
+        app.config.setdefault('DUPLICATE_MIN_TOKENS', 8)
+        app.config.setdefault('DUPLICATE_MIN_MATCHES', 2)
+        app.config.setdefault('DUPLICATE_WINDOW', 86400)
+        app.config.setdefault('DUPLICATE_INDEX_SIZE', 20_000)
+        app.config.setdefault('DUPLICATE_RATE_LIMIT', (3, 3600))
+        app.extensions['near_duplicates'] = self
+
+    def reset_after_fork(self):
+        # The inherited index is still valid; only the lock may be held by a dead thread
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the index; the next check reloads it from the database"""
+        with self._lock:
+            self.index = None
+            self._last_id = 0
+
+    def check(self, text):
+        """(signature or None, ids of recent near-duplicate posts)"""
+        config = current_app.config
+        value = signature(text, config['DUPLICATE_MIN_TOKENS'])
+        if value is None or config['DUPLICATE_ACTION'] == 'off':
+            return value, []
+        with self._lock:
+            self._sync(config)
+            return value, self.index.matches(value)
+
+    def add(self, post_id, value):
+        """Index a post made by this process without waiting for the next sync"""
+        if value is None:
+            return
+        with self._lock:
+            if self.index is not None:
+                self.index.add(post_id, value, time.time())
+
+    def _sync(self, config):
+        from app import db
+        from models.post import Post
+
+        window = config['DUPLICATE_WINDOW']
+        if self.index is None:
+            self.index = MinHashIndex(config['DUPLICATE_SIMILARITY'], config['DUPLICATE_INDEX_SIZE'])
+            self._last_id = 0
+        # Short posts have no signature but still move _last_id, so they are read once
+        query = db.session.query(Post.id, Post.content_minhash, Post.created_at)\
+                          .filter(Post.id > self._last_id,
+                                  Post.created_at >= datetime.utcnow() - timedelta(seconds=window))
+        if not self._last_id:
+            # First load: the newest posts that fit, inserted oldest first
+            rows = query.order_by(Post.id.desc()).limit(self.index.maxsize).all()[::-1]
+        else:
+            rows = query.order_by(Post.id).all()
+        for post_id, value, created in rows:
+            if value is not None and len(value) == _SIGNATURE.size:
+                self.index.add(post_id, value, _timestamp(created))
+        if rows:
+            self._last_id = rows[-1][0]
+        elif not self._last_id:
+            self._last_id = db.session.query(db.func.max(Post.id)).scalar() or 0
+        self.index.expire(time.time() - window)
+
+
+def _timestamp(created):
+    return (created - datetime(1970, 1, 1)).total_seconds()
@@ -0,0 +1,157 @@
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from functools import wraps
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block runs more SQL than its budget allows"""
+
+
+class QueryBudget:
+    """Count the SQL statements run inside a block and check them against a budget.
+
+    ``max_queries`` caps the total number of statements; ``max_repeats`` caps how
+    often a single statement shape may run, which is how N+1 loops show up. In
+    ``raise`` mode a violation raises QueryBudgetExceeded, in ``log`` mode it is
+    written to the app logger. Usable as a context manager or a decorator::
+
+        with QueryBudget(max_queries=10, max_repeats=2):
+            client.get('/')
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None, name=None, mode='raise'):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.name = name
+        self.mode = mode
+        self.statements = Counter()
+        self.locations = {}
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def __enter__(self):
+        _install_listener()
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stack().remove(self)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def __call__(self, f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            budget = QueryBudget(self.max_queries, self.max_repeats,
+                                 self.name or f.__name__, self.mode)
+            with budget:
+                return f(*args, **kwargs)
+        return decorated_function
+
+    def record(self, statement):
+        shape = _WHITESPACE.sub(' ', statement).strip()
+        self.statements[shape] += 1
+        if shape not in self.locations:
+            self.locations[shape] = _find_origin()
+
+    def violations(self):
+        problems = []
+        if self.max_queries is not None and self.count > self.max_queries:
+            problems.append(f'{self.count} queries (budget {self.max_queries})')
+        if self.max_repeats is not None:
+            for shape, count in self.statements.most_common():
+                if count <= self.max_repeats:
+                    break
+                problems.append(f'statement repeated {count}x (budget {self.max_repeats}): '
+                                f'{shape[:200]}\n    at {self.locations[shape]}')
+        return problems
+
+    def report(self):
+        problems = self.violations()
+        if not problems:
+            return None
+        return f"Query budget exceeded in {self.name or 'block'}:\n  " + '\n  '.join(problems)
+
+    def check(self):
+        report = self.report()
+        if report is None:
+            return
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded(report)
+        current_app.logger.warning(report)
+
+
+def _stack():
+    stack = getattr(_local, 'budgets', None)
+    if stack is None:
+        stack = _local.budgets = []
+    return stack
+
+
+def _install_listener():
+    if not event.contains(Engine, 'before_cursor_execute', _record_statement):
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for budget in getattr(_local, 'budgets', ()):
+        budget.record(statement)
+
+
+def _find_origin():
+    """Describe where a statement was issued: the template line if rendering, else app code"""
+    frame = sys._getframe(2)
+    app_frame = None
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return f'{os.path.relpath(template.filename, _PROJECT_ROOT)}:{template.get_corresponding_lineno(frame.f_lineno)}'
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(_PROJECT_ROOT) \
+                and 'site-packages' not in filename and filename != __file__:
+            app_frame = f'{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return app_frame or 'unknown'
+
+
+def init_query_budgets(app):
+    """Enforce the per-endpoint budgets in QUERY_BUDGETS on every request.
+
+    Disabled unless QUERY_BUDGET_MODE is ``log`` (staging) or ``raise`` (tests).
+    """
+    app.config.setdefault('QUERY_BUDGET_MODE', None)
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('QUERY_BUDGET_DEFAULT', (20, 5))
+
+    mode = app.config['QUERY_BUDGET_MODE']
+    if not mode:
+        return
+
+    @app.before_request
+    def start_query_budget():
+        if request.endpoint in (None, 'static'):
+            return
+        max_queries, max_repeats = app.config['QUERY_BUDGETS'].get(
+            request.endpoint, app.config['QUERY_BUDGET_DEFAULT'])
+        budget = QueryBudget(max_queries, max_repeats, request.endpoint, mode)
+        g._query_budget = budget.__enter__()
+
+    @app.teardown_request
+    def finish_query_budget(exc):
+        # Teardown runs last, so statements issued by after_request hooks count too
+        budget = g.pop('_query_budget', None)
+        if budget is not None:
+            budget.__exit__(type(exc) if exc else None, exc, None)
@@ -0,0 +1,124 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from utils.cache import LRUCache
+
+RateLimitResult = namedtuple('RateLimitResult', 'allowed limit remaining retry_after')
+
+
+class MemoryBackend:
+    """Token buckets in this process only; each app worker limits separately"""
+
+    def __init__(self, maxsize=100000):
+        self._buckets = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Take ``cost`` tokens from the bucket; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key) or (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            # A bucket left alone until it is full again is the same as no bucket
+            self._buckets.set(key, (tokens, now), ttl=max(1, (capacity - tokens) / rate))
+        return allowed, tokens
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite file shared by every worker on the host.
+
+    Each check is a single UPSERT ... RETURNING statement, so refill and
+    consume happen atomically under SQLite's write lock without a
+    read-then-write round trip.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._checks = 0
+        self._ensure_schema()
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _ensure_schema(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, '
+            'expires_at REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID')
+
+    def consume(self, key, capacity, rate, cost=1):
+        now = time.time()
+        params = {'key': key, 'capacity': capacity, 'rate': rate, 'cost': cost, 'now': now,
+                  'expires': now + capacity / rate}
+        conn = self._connection()
+        tokens, allowed = conn.execute(
+            'INSERT INTO rate_limit (key, tokens, updated_at, expires_at, allowed) '
+            'VALUES (:key, :capacity - :cost, :now, :expires, 1) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            '  tokens = min(:capacity, tokens + (:now - updated_at) * :rate)'
+            '    - CASE WHEN min(:capacity, tokens + (:now - updated_at) * :rate) >= :cost'
+            '      THEN :cost ELSE 0 END, '
+            '  allowed = min(:capacity, tokens + (:now - updated_at) * :rate) >= :cost, '
+            '  updated_at = :now, expires_at = :expires '
+            'RETURNING tokens, allowed', params).fetchone()
+        self._checks += 1
+        if self._checks % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM rate_limit WHERE expires_at < ?', (now,))
+        return bool(allowed), tokens
+
+
+class RateLimiter:
+    """Token-bucket rate limiting for views decorated with ``rate_limit``.
+
+    ``max_requests`` per ``per_seconds`` is a bucket of that capacity that
+    refills continuously, so short bursts are allowed while the long-run rate
+    is capped. Each check costs O(1): one dict lookup in memory, or one
+    statement against the shared SQLite file (``RATELIMIT_STORAGE_URL =
+    'sqlite:////path/to/ratelimit.db'``) when several workers must share
+    limits.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', 'memory://')
+        self.backend = self.create_backend(app.config['RATELIMIT_STORAGE_URL'])
+        app.extensions['rate_limiter'] = self
+
+    @staticmethod
+    def create_backend(url):
+        if url.startswith('memory://'):
+            return MemoryBackend()
+        if url.startswith('sqlite:///'):
+            return SQLiteBackend(url[len('sqlite:///'):])
+        raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL: {url}')
+
+    def hit(self, key, max_requests, per_seconds, cost=1):
+        """Count one request against ``key``"""
+        rate = max_requests / per_seconds
+        allowed, tokens = self.backend.consume(key, max_requests, rate, cost)
+        retry_after = 0 if allowed else max(1, math.ceil((cost - tokens) / rate))
+        return RateLimitResult(allowed, max_requests, int(tokens), retry_after)
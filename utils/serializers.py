@@ -0,0 +1,30 @@
+import json
+from datetime import date, datetime
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same JSON
+    orjson = None
+
+
+def _default(obj):
+    # Naive datetimes are UTC throughout the app
+    if isinstance(obj, datetime) and obj.tzinfo is None:
+        return obj.isoformat() + '+00:00'
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj):
+    """Compact JSON as bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def json_response(obj, status=200, headers=None):
+    """Response with a pre-serialized JSON body, bypassing Flask's json provider"""
+    return current_app.response_class(dumps(obj), status=status, headers=headers,
+                                      mimetype='application/json')
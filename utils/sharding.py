@@ -0,0 +1,333 @@
+import bisect
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, Table, Column, Index, UniqueConstraint, event, func, select, text
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BooleanClauseList
+
+# Shard n hands out primary keys from (n + 1) << ID_BITS, so rows keep their id
+# when they move and never collide with rows of the main database
+ID_BITS = 40
+
+
+class ShardRoutingError(Exception):
+    """Raised for a statement on sharded rows that cannot be sent to the right shards"""
+
+
+def bind_key(shard):
+    return f'shard{shard}'
+
+
+class Shards:
+    """Places the rows of sharded models on SHARD_DATABASE_URIS by user id.
+
+    A model opts in with ``__shard_key__``, the name of the user id column
+    that decides where its rows live (``Notification.recipient_id``,
+    ``Like.owner_id``). SHARD_MAP lists ``(first user id, shard)`` ranges;
+    without it users are spread by ``user_id % number of shards``. Shards
+    are numbered by their position in SHARD_DATABASE_URIS, so new shards are
+    appended. Without shards every row stays in the main database.
+
+    Routing happens in ShardedSession, so queries and flushes of sharded
+    models look as they did; ``flask shards rebalance`` moves rows after
+    the map changes. Users, posts and comments are not sharded: listings
+    join them with each other and order and page over all of them.
+    """
+
+    def __init__(self, app=None):
+        self.count = 0
+        self._starts = []
+        self._targets = []
+        self._keys = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Before db.init_app: Flask-SQLAlchemy creates the engines of SQLALCHEMY_BINDS
+        app.config.setdefault('SHARD_DATABASE_URIS', [])
+        app.config.setdefault('SHARD_MAP', [])
+        uris = list(app.config['SHARD_DATABASE_URIS'])
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for shard, uri in enumerate(uris):
+            binds.setdefault(bind_key(shard), uri)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        self.count = len(uris)
+
+        ranges = sorted(app.config['SHARD_MAP'])
+        for first_id, shard in ranges:
+            if not 0 <= shard < self.count:
+                raise ValueError(f'SHARD_MAP sends users from {first_id} to unknown shard {shard}')
+        self._starts = [first_id for first_id, _ in ranges]
+        self._targets = [shard for _, shard in ranges]
+        app.extensions['shards'] = self
+
+    def shard_for(self, user_id):
+        """Shard holding the rows keyed by ``user_id``; None when unsharded"""
+        if not self.count:
+            return None
+        if self._starts:
+            return self._targets[max(0, bisect.bisect_right(self._starts, user_id) - 1)]
+        return user_id % self.count
+
+    def partition(self, rows, key):
+        """Group row dicts by the shard of ``row[key]``: [(shard, rows)]"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.shard_for(row[key]), []).append(row)
+        return sorted(groups.items(), key=lambda item: -1 if item[0] is None else item[0])
+
+    def engine(self, shard):
+        from app import db
+        return db.engine if shard is None else db.engines[bind_key(shard)]
+
+    @property
+    def keys(self):
+        """{table name: shard key column name} of the sharded models"""
+        if self._keys is None:
+            from app import db
+            self._keys = {mapper.local_table.name: mapper.class_.__shard_key__
+                          for mapper in db.Model.registry.mappers
+                          if getattr(mapper.class_, '__shard_key__', None)}
+        return self._keys
+
+    def tables(self):
+        from app import db
+        return [db.metadatas[None].tables[name] for name in sorted(self.keys)]
+
+    def create_tables(self, shard):
+        """Create the sharded tables on ``shard`` and start its id range; idempotent"""
+        engine = self.engine(shard)
+        with engine.begin() as connection:
+            for table in self.tables():
+                copy = _without_foreign_keys(table)
+                copy.create(connection, checkfirst=True)
+                start = (shard + 1) << ID_BITS
+                if engine.dialect.name == 'postgresql':
+                    name = connection.dialect.identifier_preparer.quote(table.name)
+                    connection.execute(text(f"SELECT setval(pg_get_serial_sequence(:name, 'id'), "
+                                            f'GREATEST(:seq, (SELECT COALESCE(MAX(id), 0) FROM {name})))'),
+                                       {'name': name, 'seq': start})
+                elif engine.dialect.name == 'sqlite':
+                    # AUTOINCREMENT tables continue from sqlite_sequence, never below it
+                    seq = connection.execute(text('SELECT seq FROM sqlite_sequence WHERE name = :name'),
+                                             {'name': table.name}).scalar()
+                    if seq is None:
+                        connection.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                                           {'name': table.name, 'seq': start})
+                    elif seq < start:
+                        connection.execute(text('UPDATE sqlite_sequence SET seq = :seq WHERE name = :name'),
+                                           {'name': table.name, 'seq': start})
+
+    def rebalance(self, batch_size=1000, dry_run=False):
+        """Move rows whose key maps to another shard than the one holding them.
+
+        Rows still in the main database (written before sharding) are moved
+        too. Each batch is copied, then deleted from its source; ids are kept
+        and rows already present on the target are skipped, so an
+        interrupted run can be repeated. Yields (table, source, target,
+        rows moved) per source and target.
+        """
+        sources = [None] + list(range(self.count))
+        for table in self.tables():
+            key = table.c[self.keys[table.name]]
+            for source in sources:
+                with self.engine(source).connect() as connection:
+                    values = connection.execute(select(key).distinct()).scalars().all()
+                moves = {}
+                for value in values:
+                    target = self.shard_for(value)
+                    if target != source:
+                        moves.setdefault(target, []).append(value)
+                for target, keys in sorted(moves.items()):
+                    moved = 0
+                    for start in range(0, len(keys), 100):
+                        if dry_run:
+                            with self.engine(source).connect() as connection:
+                                moved += connection.execute(select(func.count()).select_from(table)
+                                                            .where(key.in_(keys[start:start + 100]))).scalar()
+                        else:
+                            moved += self._move(table, key, keys[start:start + 100], source, target, batch_size)
+                    yield table.name, source, target, moved
+
+    def _move(self, table, key, keys, source, target, batch_size):
+        moved = 0
+        while True:
+            with self.engine(source).connect() as connection:
+                rows = [row._asdict() for row in connection.execute(
+                    select(table).where(key.in_(keys)).order_by(table.c.id).limit(batch_size))]
+            if not rows:
+                return moved
+            ids = [row['id'] for row in rows]
+            with self.engine(target).begin() as connection:
+                present = set(connection.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+                missing = [row for row in rows if row['id'] not in present]
+                if missing:
+                    connection.execute(table.insert(), missing)
+            with self.engine(source).begin() as connection:
+                connection.execute(table.delete().where(table.c.id.in_(ids)))
+            moved += len(rows)
+
+    def counts(self):
+        """{table name: {shard (None = main database): rows}}"""
+        result = {}
+        for table in self.tables():
+            for shard in [None] + list(range(self.count)):
+                with self.engine(shard).connect() as connection:
+                    rows = connection.execute(select(func.count()).select_from(table)).scalar()
+                result.setdefault(table.name, {})[shard] = rows
+        return result
+
+
+def _without_foreign_keys(table):
+    # Users, posts and comments stay in the main database: no foreign keys across databases
+    copy = Table(table.name, MetaData(),
+                 *(Column(column.name, column.type, primary_key=column.primary_key,
+                          nullable=column.nullable) for column in table.columns),
+                 sqlite_autoincrement=True)
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            copy.append_constraint(UniqueConstraint(*(c.name for c in constraint.columns),
+                                                    name=constraint.name))
+    for index in table.indexes:
+        Index(index.name, *(copy.c[c.name] for c in index.columns), unique=index.unique)
+    return copy
+
+
+class ShardedSession(Session):
+    """db.session: sends statements on sharded models to their shards.
+
+    Flushes go to the shard of each instance's key. A query goes to the
+    shards of the key values it compares with ``==`` or ``IN`` (in the
+    WHERE clause of any of its selects, joined by AND); without one it runs
+    on every shard and the rows are concatenated, so it may not aggregate,
+    order or limit. Statements may not mix sharded and other tables.
+    ``bind_arguments={'shard': n}`` picks a shard explicitly. Writes to
+    several databases are committed one after another, not atomically.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self.shards = current_app.extensions.get('shards')
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard=None, **kwargs):
+        if shard is not None and bind is None:
+            return self._db.engines[bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def flush(self, objects=None):
+        # Per-instance connections only while flushing: ORM bulk inserts refuse them
+        if self.shards is not None and self.shards.count and self.connection_callable is None:
+            self.connection_callable = self._flush_connection
+            try:
+                super().flush(objects)
+            finally:
+                self.connection_callable = None
+        else:
+            super().flush(objects)
+
+    def _flush_connection(self, mapper=None, instance=None, **kwargs):
+        shard = None
+        key = self.shards.keys.get(mapper.local_table.name) if mapper is not None else None
+        if key is not None:
+            value = getattr(instance, key, None)
+            if value is None:
+                raise ShardRoutingError(f'{mapper.class_.__name__}.{key} must be set to place the row on a shard')
+            shard = self.shards.shard_for(value)
+        return self.connection(bind_arguments={'mapper': mapper, 'shard': shard})
+
+
+@event.listens_for(ShardedSession, 'do_orm_execute')
+def _route(orm_context):
+    session = orm_context.session
+    shards = session.shards
+    chosen = orm_context.bind_arguments.get('shard')
+    if shards is None or not shards.count or (chosen is not None and not orm_context.is_insert):
+        return None
+    statement = orm_context.statement
+    keys = shards.keys
+    tables, selects = set(), []
+    for element in visitors.iterate(statement):
+        if element.__visit_name__ == 'table':
+            tables.add(element.name)
+        elif element.__visit_name__ == 'select':
+            selects.append(element)
+    if orm_context.is_insert or orm_context.is_update or orm_context.is_delete:
+        tables.add(statement.table.name)
+    sharded = tables & keys.keys()
+    if not sharded:
+        return None
+    if len(sharded) > 1 or tables - sharded:
+        raise ShardRoutingError(f'Statement mixes sharded tables ({", ".join(sorted(sharded))}) '
+                                f'with others ({", ".join(sorted(tables - sharded)) or "-"})')
+    table = sharded.pop()
+    key = keys[table]
+
+    if orm_context.is_insert:
+        params = orm_context.parameters
+        rows = params if isinstance(params, list) else [params or {}]
+        targets = {chosen} if chosen is not None else \
+            {shards.shard_for(row[key]) if row.get(key) is not None else None for row in rows}
+        if len(targets) != 1 or None in targets:
+            raise ShardRoutingError(f'Rows inserted into {table} must all carry the {key} of one shard '
+                                    '(see Shards.partition)')
+        # A plain INSERT on the shard's connection: the ORM bulk path picks its own
+        # connection. Rows are grouped by the columns they set, as the ORM would
+        connection = session.connection(bind_arguments={'shard': targets.pop()})
+        insert = orm_context.bind_mapper.local_table.insert()
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for group in groups.values():
+            result = connection.execute(insert, group if isinstance(params, list) else group[0])
+        return result
+
+    clauses = [statement.whereclause] if not orm_context.is_select else []
+    clauses += [inner.whereclause for inner in selects]
+    values = _key_values(clauses, table, key, orm_context.parameters or {})
+    targets = sorted({shards.shard_for(value) for value in values}) if values is not None \
+        else list(range(shards.count))
+    targets = targets or [0]  # IN () matches nothing anywhere
+    if len(targets) > 1 and orm_context.is_select and _combines_rows(selects):
+        raise ShardRoutingError(f'Query on {table} spans shards but aggregates, orders or limits; '
+                                f'filter it by {key}')
+    results = [orm_context.invoke_statement(bind_arguments={**orm_context.bind_arguments, 'shard': shard})
+               for shard in targets]
+    return results[0] if len(results) == 1 else results[0].merge(*results[1:])
+
+
+def _conjuncts(clause):
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        for element in clause.clauses:
+            yield from _conjuncts(element)
+    elif clause is not None:
+        yield clause
+
+
+def _key_values(clauses, table, key, parameters):
+    """Values the key column is compared with, or None when it is not constrained"""
+    found = None
+    for clause in clauses:
+        for condition in _conjuncts(clause):
+            if condition.__visit_name__ != 'binary' or condition.operator not in (operators.eq, operators.in_op):
+                continue
+            for column, other in ((condition.left, condition.right), (condition.right, condition.left)):
+                if getattr(column, 'name', None) != key or getattr(getattr(column, 'table', None), 'name', None) != table:
+                    continue
+                if other.__visit_name__ != 'bindparam':
+                    continue
+                value = parameters.get(other.key, other.effective_value) \
+                    if isinstance(parameters, dict) else other.effective_value
+                value = list(value) if condition.operator is operators.in_op else [value]
+                found = set(value) if found is None else found | set(value)
+    return found
+
+
+def _combines_rows(selects):
+    for inner in selects:
+        if (inner._order_by_clauses or inner._group_by_clauses or inner._limit_clause is not None
+                or inner._offset_clause is not None or inner._distinct):
+            return True
+        for column in inner.selected_columns:
+            if any(element.__visit_name__ == 'function' for element in visitors.iterate(column)):
+                return True
+    return False
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+from utils.cache import LRUCache
+
+_MISSING = object()
+
+
+class _Call:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Shares one in-flight computation between concurrent identical requests.
+
+    ``get(name, key, compute)`` runs ``compute()`` once per key at a time;
+    callers arriving while it runs wait for that result instead of running
+    their own. ``SINGLE_FLIGHT_TTLS[name]`` is ``(fresh, stale)`` seconds: a
+    result is reused while fresh, and while stale it is still returned
+    immediately to everyone except the one caller that refreshes it
+    (stale-while-revalidate). With ``(0, 0)`` results are only shared
+    between overlapping callers, never cached.
+
+    Results are shared between viewers, so only use it for computations that
+    do not depend on the current user. ``aget`` is the asyncio counterpart
+    for the ASGI endpoints; both share the same results.
+    """
+
+    def __init__(self, app=None):
+        self.results = LRUCache()
+        self.ttls = {}
+        self.enabled = True
+        self.wait_timeout = None
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SINGLE_FLIGHT_ENABLED', True)
+        app.config.setdefault('SINGLE_FLIGHT_TTLS', {})
+        app.config.setdefault('SINGLE_FLIGHT_CACHE_SIZE', 1024)
+        app.config.setdefault('SINGLE_FLIGHT_WAIT_TIMEOUT', 10)
+        self.enabled = app.config['SINGLE_FLIGHT_ENABLED']
+        self.ttls = app.config['SINGLE_FLIGHT_TTLS']
+        self.results.maxsize = app.config['SINGLE_FLIGHT_CACHE_SIZE']
+        self.wait_timeout = app.config['SINGLE_FLIGHT_WAIT_TIMEOUT']
+        app.extensions['single_flight'] = self
+
+    def reset_after_fork(self):
+        # Leaders of calls in flight at fork time don't exist in the child
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def forget(self, name, key):
+        self.results.pop((name, key))
+
+    def _lookup(self, full_key):
+        """(value, refresh lock) of a cached result.
+
+        The lock is returned to the one caller that should refresh a stale
+        result and is None otherwise; value is _MISSING when nothing is cached.
+        """
+        entry = self.results.get(full_key)
+        if entry is None:
+            return _MISSING, None
+        value, fresh_until, refreshing = entry
+        if time.monotonic() < fresh_until or not refreshing.acquire(blocking=False):
+            return value, None
+        return value, refreshing
+
+    def _store(self, name, full_key, value):
+        fresh, stale = self.ttls.get(name, (0, 0))
+        if fresh or stale:
+            # The lock lets one caller at a time refresh the stale result; the
+            # entry drops out of the LRU when the stale window ends
+            self.results.set(full_key, (value, time.monotonic() + fresh, threading.Lock()),
+                             ttl=fresh + stale)
+
+    def get(self, name, key, compute):
+        if not self.enabled:
+            return compute()
+        full_key = (name, key)
+        value, refreshing = self._lookup(full_key)
+        if refreshing is not None:
+            # Everyone else keeps getting the stale value meanwhile
+            try:
+                value = compute()
+                self._store(name, full_key, value)
+            finally:
+                refreshing.release()
+            return value
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            call = self._calls.get(full_key)
+            leader = call is None
+            if leader:
+                call = self._calls[full_key] = _Call()
+        if not leader:
+            if not call.event.wait(self.wait_timeout):
+                return compute()  # the leader is stuck; don't queue behind it
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            self._store(name, full_key, call.value)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(full_key, None)
+            call.event.set()
+
+    async def aget(self, name, key, compute):
+        """``get`` for coroutines: ``compute`` is an async function"""
+        if not self.enabled:
+            return await compute()
+        full_key = (name, key)
+        value, refreshing = self._lookup(full_key)
+        if refreshing is not None:
+            try:
+                value = await compute()
+                self._store(name, full_key, value)
+            finally:
+                refreshing.release()
+            return value
+        if value is not _MISSING:
+            return value
+
+        # One event loop per process, so no lock is needed around the dict
+        future = self._async_calls.get(full_key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this request was cancelled, not the leader
+                return await compute()
+        future = self._async_calls[full_key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+            self._store(name, full_key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, so an unawaited failure isn't logged
+            raise
+        finally:
+            del self._async_calls[full_key]
@@ -0,0 +1,138 @@
+import atexit
+import threading
+import time
+from flask import after_this_request, current_app, request
+from flask_login import current_user
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from utils.hyperloglog import HyperLogLog
+
+
+class UniqueViews:
+    """Counts post views and estimates unique viewers, writing in batches.
+
+    ``record(post_id)`` bumps an in-process view counter and adds the viewer
+    (user id, or IP and user agent for anonymous readers) to a per-post
+    HyperLogLog sketch; nothing identifying is kept, only register maxima.
+    Every ``UNIQUE_VIEWS_FLUSH_INTERVAL`` seconds the buffers are merged into
+    the stored sketches and ``Post.views_count`` / ``unique_views_count`` are
+    updated - one write per viewed post per interval instead of one per view.
+    The flush runs after the response of the request that triggers it.
+    """
+
+    def __init__(self, app=None):
+        self.precision = None
+        self.interval = None
+        self._pending = {}  # post_id -> [views, sketch]
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._exit_apps = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('UNIQUE_VIEWS_PRECISION', 12)
+        app.config.setdefault('UNIQUE_VIEWS_FLUSH_INTERVAL', 30)
+        self.precision = app.config['UNIQUE_VIEWS_PRECISION']
+        self.interval = app.config['UNIQUE_VIEWS_FLUSH_INTERVAL']
+        if not self._exit_apps:
+            atexit.register(self._flush_at_exit)
+        self._exit_apps.append(app)
+        app.extensions['unique_views'] = self
+
+    def reset_after_fork(self):
+        # The parent flushes what it buffered; a child starts empty
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def viewer_key(self):
+        if current_user.is_authenticated:
+            return f'user:{current_user.id}'
+        return f"anon:{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+
+    def record(self, post_id):
+        key = self.viewer_key()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.get(post_id)
+            if entry is None:
+                entry = self._pending[post_id] = [0, HyperLogLog(self.precision)]
+            entry[0] += 1
+            entry[1].add(key)
+            due = now - self._last_flush >= self.interval
+            if due:
+                self._last_flush = now
+
+        if due:
+            app = current_app._get_current_object()
+
+            @after_this_request
+            def flush_after_response(response):
+                response.call_on_close(lambda: self._flush_in(app))
+                return response
+
+    def _flush_in(self, app):
+        with app.app_context():
+            self.flush()
+
+    def _flush_at_exit(self):
+        if self._pending and self._exit_apps:
+            self._flush_in(self._exit_apps[-1])
+
+    def flush(self):
+        """Write buffered views; returns the number of posts updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            return self._write(pending)
+        except SQLAlchemyError:
+            current_app.logger.warning('Flushing post views failed; retrying on the next flush',
+                                       exc_info=True)
+            with self._lock:
+                for post_id, (views, sketch) in pending.items():
+                    entry = self._pending.setdefault(post_id, [0, HyperLogLog(self.precision)])
+                    entry[0] += views
+                    entry[1].merge(sketch)
+            return 0
+
+    def _write(self, pending):
+        from app import db
+        from models.post import Post
+        from models.view_sketch import PostViewSketch
+
+        posts, sketches = Post.__table__, PostViewSketch.__table__
+        with db.engine.begin() as connection:
+            post_ids = list(connection.scalars(select(posts.c.id).where(posts.c.id.in_(list(pending)))))
+            stored = dict(connection.execute(
+                select(sketches.c.post_id, sketches.c.sketch)
+                .where(sketches.c.post_id.in_(post_ids)).with_for_update()).all())
+
+            inserts, updates, counts = [], [], []
+            for post_id in post_ids:
+                views, sketch = pending[post_id]
+                if post_id in stored:
+                    previous = HyperLogLog.from_bytes(stored[post_id])
+                    if previous.precision == sketch.precision:  # a changed precision starts over
+                        sketch = previous.merge(sketch)
+                row = {'b_post_id': post_id, 'b_sketch': sketch.to_bytes()}
+                (updates if post_id in stored else inserts).append(row)
+                counts.append({'b_post_id': post_id, 'b_views': views, 'b_unique': sketch.count()})
+
+            if inserts:
+                connection.execute(sketches.insert().values(
+                    post_id=bindparam('b_post_id'), sketch=bindparam('b_sketch')), inserts)
+            if updates:
+                connection.execute(sketches.update()
+                                   .where(sketches.c.post_id == bindparam('b_post_id'))
+                                   .values(sketch=bindparam('b_sketch')), updates)
+            if counts:
+                # updated_at is kept as is: it versions the post's content, not its counters
+                connection.execute(update(posts)
+                                   .where(posts.c.id == bindparam('b_post_id'))
+                                   .values(views_count=posts.c.views_count + bindparam('b_views'),
+                                           unique_views_count=bindparam('b_unique'),
+                                           updated_at=posts.c.updated_at), counts)
+        return len(counts)
@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import subprocess
+
+
+class VideoToolsMissing(RuntimeError):
+    """ffmpeg or ffprobe is not installed"""
+
+
+class VideoProcessingError(RuntimeError):
+    """ffmpeg failed on the input"""
+
+
+def find_tool(name):
+    path = shutil.which(name)
+    if path is None:
+        raise VideoToolsMissing(f'{name} not found; install ffmpeg or set FFMPEG_BINARY/FFPROBE_BINARY')
+    return path
+
+
+def _run(command, timeout):
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise VideoProcessingError(f'{os.path.basename(command[0])} timed out after {timeout}s')
+    if result.returncode != 0:
+        stderr = result.stderr.decode(errors='replace').strip().splitlines()[-5:]
+        raise VideoProcessingError(f'{os.path.basename(command[0])} failed: ' + ' | '.join(stderr))
+    return result.stdout
+
+
+def probe(ffprobe, source, timeout=60):
+    """Display size, duration and whether there is an audio track"""
+    output = _run([ffprobe, '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format',
+                   source], timeout)
+    info = json.loads(output)
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise VideoProcessingError('no video stream')
+    width, height = int(video['width']), int(video['height'])
+    rotation = int(video.get('tags', {}).get('rotate', 0))
+    for side_data in video.get('side_data_list', []):
+        rotation = int(side_data.get('rotation', rotation))
+    if rotation % 180:
+        width, height = height, width  # ffmpeg rotates on decode
+    return {
+        'width': width,
+        'height': height,
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in info.get('streams', [])),
+    }
+
+
+def poster_command(ffmpeg, source, destination, at, max_width):
+    # -ss before -i seeks on keyframes without decoding the frames before it
+    return [ffmpeg, '-v', 'error', '-y', '-ss', f'{at:.2f}', '-i', source, '-frames:v', '1',
+            '-vf', f"scale='min({max_width},iw)':-2", '-q:v', '3', destination]
+
+
+def ladder(info, renditions):
+    """Renditions no taller than the source; the source height alone if all are"""
+    fitting = [r for r in renditions if r[0] <= info['height']]
+    if not fitting:
+        smallest = min(renditions)
+        fitting = [(info['height'] - info['height'] % 2,) + tuple(smallest[1:])]
+    return fitting
+
+
+def transcode_command(ffmpeg, source, directory, info, renditions, mp4_height, segment_seconds):
+    """One ffmpeg run, one decode: a faststart MP4 plus an HLS stream per rendition.
+
+    ``renditions`` are (height, video bitrate, audio bitrate). Keyframes are
+    forced every segment so all renditions split at the same points and
+    players can switch between them.
+    """
+    heights = [min(mp4_height, info['height'] - info['height'] % 2)] + [r[0] for r in renditions]
+    split = ''.join(f'[v{i}]' for i in range(len(heights)))
+    filters = [f'[0:v]split={len(heights)}{split}'] + [
+        f'[v{i}]scale=-2:{height}[o{i}]' for i, height in enumerate(heights)]
+    command = [ffmpeg, '-v', 'error', '-y', '-i', source, '-filter_complex', ';'.join(filters)]
+    audio = ['-map', '0:a:0'] if info['has_audio'] else []
+    keyframes = ['-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})', '-sc_threshold', '0']
+
+    command += ['-map', '[o0]', *audio, '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart',
+                os.path.join(directory, 'video.mp4')]
+    for i, (height, video_bitrate, audio_bitrate) in enumerate(renditions, start=1):
+        command += ['-map', f'[o{i}]', *audio, '-c:v', 'libx264', '-preset', 'veryfast',
+                    '-b:v', video_bitrate, '-maxrate', video_bitrate, '-bufsize', _double(video_bitrate),
+                    '-pix_fmt', 'yuv420p', *keyframes, '-c:a', 'aac', '-b:a', audio_bitrate,
+                    '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+                    '-hls_segment_filename', os.path.join(directory, f'{height}p_%03d.ts'),
+                    os.path.join(directory, f'{height}p.m3u8')]
+    return command
+
+
+def _double(bitrate):
+    return f'{int(bitrate[:-1]) * 2}{bitrate[-1]}' if bitrate[-1].isalpha() else str(int(bitrate) * 2)
+
+
+def _bits(bitrate):
+    units = {'k': 1000, 'm': 1000000}
+    return int(float(bitrate[:-1]) * units[bitrate[-1].lower()]) if bitrate[-1].isalpha() else int(bitrate)
+
+
+def master_playlist(info, renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for height, video_bitrate, audio_bitrate in renditions:
+        width = round(info['width'] * height / info['height'] / 2) * 2
+        bandwidth = _bits(video_bitrate) + (_bits(audio_bitrate) if info['has_audio'] else 0)
+        lines += [f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height}',
+                  f'{height}p.m3u8']
+    return '\n'.join(lines) + '\n'
+
+
+def process_video(source, directory, ffmpeg, ffprobe, renditions, mp4_height=1080,
+                  segment_seconds=4, poster_at=1.0, poster_width=1280, timeout=1800):
+    """Write poster.jpg, video.mp4 and master.m3u8 (+ HLS renditions) into ``directory``"""
+    ffmpeg, ffprobe = find_tool(ffmpeg), find_tool(ffprobe)
+    info = probe(ffprobe, source)
+    renditions = ladder(info, renditions)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        at = min(poster_at, info['duration'] / 2) if info['duration'] else 0
+        _run(poster_command(ffmpeg, source, os.path.join(directory, 'poster.jpg'), at, poster_width), timeout)
+        _run(transcode_command(ffmpeg, source, directory, info, renditions, mp4_height, segment_seconds),
+             timeout)
+        with open(os.path.join(directory, 'master.m3u8'), 'w') as playlist:
+            playlist.write(master_playlist(info, renditions))
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return info